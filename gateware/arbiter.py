@@ -0,0 +1,155 @@
+from amaranth            import *
+from amaranth.build      import Platform
+from amaranth.lib.coding import PriorityEncoder
+from amaranth.sim        import Settle
+
+from amlib.test          import GatewareTestCase, sync_test_case
+
+class RoundRobinArbiter(Elaboratable):
+    """ grants one of the requests, the request, which has been granted last,
+        has the lowest priority the next time, so no request waits longer
+        than one round through all the others.
+        With registered, the grant comes out of a register, so the encoders
+        are not in the path behind it. It is then computed from the requests
+        of the last clock, so the user has to check, that the granted request
+        is still there """
+    def __init__(self, *, width, registered=False):
+        assert width >= 2, "there is nothing to arbitrate between fewer than two requests"
+
+        # Parameters
+        self._width = width
+        self._registered = registered
+
+        # Inputs
+        self.requests_in = Signal(width)
+        self.next_in     = Signal() # the granted request has been served
+
+        # Outputs
+        self.grant_out = Signal(range(width))
+        self.valid_out = Signal()
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        width = self._width
+
+        served = Signal()
+        m.d.comb += served.eq(self.next_in & self.valid_out)
+
+        # the search starts right above the last grant,
+        # and wraps around to the bottom, if there is no request up there
+        last     = Signal(range(width), reset=width - 1)
+        previous = Signal(range(width))
+        above    = Signal(width)
+        if self._registered:
+            # the next grant is decided, while the current one is served
+            m.d.comb += previous.eq(Mux(served, self.grant_out, last))
+        else:
+            m.d.comb += previous.eq(last)
+        m.d.comb += above.eq(~((Const(2, width + 1) << previous) - 1))
+
+        m.submodules.upper = upper = PriorityEncoder(width)
+        m.submodules.lower = lower = PriorityEncoder(width)
+        m.d.comb += [
+            upper.i.eq(self.requests_in & above),
+            lower.i.eq(self.requests_in),
+        ]
+        domain = m.d.sync if self._registered else m.d.comb
+        domain += [
+            self.grant_out.eq(Mux(upper.n, lower.o, upper.o)),
+            self.valid_out.eq(~lower.n),
+        ]
+
+        with m.If(served):
+            m.d.sync += last.eq(self.grant_out)
+
+        return m
+
+class RoundRobinArbiterTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = RoundRobinArbiter
+    FRAGMENT_ARGUMENTS = {'width': 5}
+
+    @sync_test_case
+    def test_basic(self):
+        dut = self.dut
+
+        yield Settle()
+        self.assertEqual((yield dut.valid_out), 0)
+
+        # all requests are granted in turn
+        yield dut.requests_in.eq(0b11111)
+        yield dut.next_in.eq(1)
+        grants = []
+        for _ in range(7):
+            yield Settle()
+            self.assertEqual((yield dut.valid_out), 1)
+            grants.append((yield dut.grant_out))
+            yield
+        self.assertEqual(grants, [0, 1, 2, 3, 4, 0, 1])
+
+        # the grant stays, until it has been served
+        yield dut.requests_in.eq(0b10001)
+        yield dut.next_in.eq(0)
+        for _ in range(3):
+            yield Settle()
+            self.assertEqual((yield dut.grant_out), 4)
+            yield
+
+        # a request, which keeps coming back, does not shut out the others
+        yield dut.next_in.eq(1)
+        grants = []
+        for _ in range(4):
+            yield Settle()
+            grants.append((yield dut.grant_out))
+            yield
+        self.assertEqual(grants, [4, 0, 4, 0])
+
+class RoundRobinArbiterRegisteredTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = RoundRobinArbiter
+    FRAGMENT_ARGUMENTS = {'width': 5, 'registered': True}
+
+    @sync_test_case
+    def test_basic(self):
+        dut = self.dut
+
+        # the requests show up at the output a clock later
+        yield dut.requests_in.eq(0b11111)
+        yield dut.next_in.eq(1)
+        yield Settle()
+        self.assertEqual((yield dut.valid_out), 0)
+        yield
+
+        # all requests are granted in turn, one per clock
+        grants = []
+        for _ in range(7):
+            yield Settle()
+            self.assertEqual((yield dut.valid_out), 1)
+            grants.append((yield dut.grant_out))
+            yield
+        self.assertEqual(grants, [0, 1, 2, 3, 4, 0, 1])
+
+        # the grant stays, until it has been served
+        yield dut.requests_in.eq(0b10001)
+        yield dut.next_in.eq(0)
+        yield
+        for _ in range(3):
+            yield Settle()
+            self.assertEqual((yield dut.grant_out), 4)
+            yield
+
+        # a request, which keeps coming back, does not shut out the others
+        yield dut.next_in.eq(1)
+        grants = []
+        for _ in range(4):
+            yield Settle()
+            grants.append((yield dut.grant_out))
+            yield
+        self.assertEqual(grants, [4, 0, 4, 0])
+
+        # a request, which has gone, is still granted for a clock
+        yield dut.requests_in.eq(0b00100)
+        grants = []
+        for _ in range(3):
+            yield Settle()
+            grants.append((yield dut.grant_out))
+            yield
+        self.assertEqual(grants, [4, 2, 2])
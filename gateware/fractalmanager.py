@@ -1,19 +1,135 @@
 from amaranth            import *
 from amaranth.build      import Platform
 from amaranth.lib.coding import PriorityEncoder
+from amaranth.lib.fifo   import SyncFIFOBuffered
+from amaranth.sim        import Settle
 
 from amlib.test          import GatewareTestCase, sync_test_case
 from amlib.stream        import StreamInterface
 
-from mandelbrot import Mandelbrot
+from mandelbrot import Mandelbrot, PipelinedMandelbrot, MultiLimbMandelbrot, PerturbationMandelbrot
+from mandelbrot import mandelbrot_reference, perturbation_reference, reference_orbit, distance_reference
+from mandelbrot import escape_orbit, traced_orbit
+from interior   import InteriorCheck
+from arbiter    import RoundRobinArbiter
 
 class FractalManagerCore(Elaboratable):
-    def __init__(self, *, bitwidth, fraction_bits, no_cores, test=False):
+    def __init__(self, *, bitwidth, fraction_bits, no_cores, multipliers=1, multiplier_stages=0,
+                 squarers=False, pipelined=False, slots=4, interior_check=False,
+                 periodicity_check=False, periodicity_tolerance=0,
+                 narrow_cores=0, narrow_fraction_bits=32, narrow_guard_bits=16,
+                 limb_width=None, max_limbs=None, perturbation=False, orbit_depth=4096,
+                 resumable=False, distance_estimate=False,
+                 buddhabrot=False, histogram_width=64, histogram_height=64, histogram_bits=16,
+                 orbit_trace=False, chunk_size=None, result_fifo_depth=16,
+                 subdivide=False, subdivide_levels=3, subdivide_min=4, subdivide_depth=32,
+                 interlace_levels=0, queue_frames=False, raster_order=False, reorder_depth=64,
+                 cluster_size=None, supersample_levels=0, supersample_depth=16, test=False):
         # Parameters
         assert bitwidth % 8 == 0, "bitwidth must be a multiple of 8"
+        assert narrow_cores <= no_cores, "the narrow cores are part of the pool of cores"
+        assert narrow_fraction_bits <= fraction_bits, "narrow cores cannot have more fraction bits"
+        if limb_width is not None:
+            assert bitwidth == limb_width * max_limbs, "the coordinates consist of max_limbs limbs"
+            assert fraction_bits == bitwidth - limb_width, "the integer part is the top limb"
+            assert limb_width % 8 == 0, "limb_width must be a multiple of 8"
+            assert narrow_cores == 0, "multi limb cores choose their precision per command"
+        if perturbation:
+            assert limb_width is None and narrow_cores == 0, "perturbation cores are the only cores in the pool"
+        if resumable:
+            assert not pipelined and limb_width is None and not perturbation and narrow_cores == 0, \
+                "only the full width Mandelbrot cores can be resumed"
+        if distance_estimate:
+            assert not pipelined and limb_width is None and not perturbation and not resumable, \
+                "only the Mandelbrot cores compute the derivative"
+            assert multipliers == 1 and not squarers, "the derivative shares the single multiplier with z"
+        if buddhabrot:
+            assert not pipelined and limb_width is None and not perturbation and narrow_cores == 0, \
+                "only the full width Mandelbrot cores can trace their orbits"
+            assert not (resumable or distance_estimate), "a traced pixel runs its whole orbit twice"
+            assert histogram_width  & (histogram_width  - 1) == 0, "histogram_width must be a power of two"
+            assert histogram_height & (histogram_height - 1) == 0, "histogram_height must be a power of two"
+            assert histogram_bits % 8 == 0, "histogram_bits must be a multiple of 8"
+        if orbit_trace:
+            assert not pipelined and limb_width is None and not perturbation and narrow_cores == 0, \
+                "only the full width Mandelbrot cores can trace their orbits"
+            assert not (resumable or distance_estimate), "a traced pixel runs its whole orbit twice"
+            assert not buddhabrot, "the orbit points go either to the histogram or to the host"
+        if chunk_size is not None:
+            assert chunk_size & (chunk_size - 1) == 0, "chunk_size must be a power of two"
+            assert not (resumable or orbit_trace), "the cores only take their pixels from their chunk"
+        if subdivide:
+            assert limb_width is None, "the subdivided frame comes as a tile, which multi limb builds do not decode"
+            assert not (perturbation or resumable or distance_estimate or buddhabrot), \
+                "a filled rectangle has nothing but an iteration count"
+            assert chunk_size is None, "the lines of a rectangle go to the cores pixel by pixel"
+            assert subdivide_min >= 2, "a rectangle is split into two halves, which are not empty"
+        if interlace_levels:
+            assert limb_width is None, "the interlaced frame comes as a tile, which multi limb builds do not decode"
+            assert chunk_size is None, "a chunk is a run of neighbouring pixels"
+        if queue_frames:
+            assert not pipelined and limb_width is None and not perturbation, \
+                "only the Mandelbrot cores run one pixel at a time with its own max_iterations"
+            assert not (buddhabrot or orbit_trace), "the histogram and the orbit trace use the corner of the command"
+            assert chunk_size is None, "a chunk steps on with the step of the frame, which gave it out"
+        if raster_order:
+            assert not (perturbation or resumable or distance_estimate or buddhabrot or orbit_trace), \
+                "a pixel comes out as nothing but its iteration count"
+            assert not (subdivide or interlace_levels or chunk_size is not None), \
+                "the pixels come out in the order they are given to the cores, which is the raster order"
+            assert not queue_frames, "the frames follow each other in the stream without a frame record"
+            assert reorder_depth & (reorder_depth - 1) == 0, "reorder_depth must be a power of two"
+        if cluster_size is not None:
+            assert cluster_size < no_cores, "the cores form at least two clusters"
+        if supersample_levels:
+            assert supersample_levels <= 3, "the maxed samples of a pixel are counted in a byte"
+            assert limb_width is None, "the supersampled frame comes as a tile, which multi limb builds do not decode"
+            assert not (perturbation or resumable or distance_estimate or buddhabrot or orbit_trace), \
+                "a supersampled pixel has nothing but its mean iteration count and its maxed samples"
+            assert not (subdivide or raster_order or queue_frames or chunk_size is not None), \
+                "the samples of a pixel go to the cores one by one and add up in a slot of the frame"
+            assert supersample_depth & (supersample_depth - 1) == 0, "supersample_depth must be a power of two"
         self._bitwidth = bitwidth
         self._no_cores = no_cores
         self._fraction_bits = fraction_bits
+        self._multipliers = multipliers
+        self._multiplier_stages = multiplier_stages
+        self._squarers = squarers
+        self._pipelined = pipelined
+        self._slots = slots
+        # the check costs four multipliers of its own, so it is off by default,
+        # the coordinates are differences to the reference in perturbation mode,
+        # the chunks go to the cores without the interior check
+        self._interior_check = interior_check and not perturbation and chunk_size is None
+        self._periodicity_check = periodicity_check
+        self._periodicity_tolerance = periodicity_tolerance
+        self._narrow_cores = narrow_cores
+        self._narrow_fraction_bits = narrow_fraction_bits
+        self._narrow_guard_bits = narrow_guard_bits
+        self._limb_width = limb_width
+        self._max_limbs = max_limbs
+        self._perturbation = perturbation
+        self._orbit_depth = orbit_depth
+        self._resumable = resumable
+        self._distance_estimate = distance_estimate
+        self._buddhabrot = buddhabrot
+        self._histogram_width = histogram_width
+        self._histogram_height = histogram_height
+        self._histogram_bits = histogram_bits
+        self._orbit_trace = orbit_trace
+        self._chunk_size = chunk_size
+        self._result_fifo_depth = result_fifo_depth
+        self._subdivide = subdivide
+        self._subdivide_levels = subdivide_levels
+        self._subdivide_min = subdivide_min
+        self._subdivide_depth = subdivide_depth
+        self._interlace_levels = interlace_levels
+        self._queue_frames = queue_frames
+        self._raster_order = raster_order
+        self._reorder_depth = reorder_depth
+        self._cluster_size = cluster_size
+        self._supersample_levels = supersample_levels
+        self._supersample_depth = supersample_depth
         self._test = test
 
         # I/O
@@ -25,6 +141,16 @@ class FractalManagerCore(Elaboratable):
         self.no_pixels_x    = Signal(16)
         self.no_pixels_y    = Signal(16)
         self.max_iterations = Signal(32)
+        # number of limbs in use, with multi limb cores
+        self.limbs          = Signal(range((max_limbs or 0) + 1))
+
+        # perturbation mode: the corner and the step are the difference
+        # to the reference orbit, scaled up by 2^exponent
+        self.exponent             = Signal(8)
+        self.orbit_length         = Signal(range(orbit_depth + 1))
+        self.orbit_write_address  = Signal(range(orbit_depth))
+        self.orbit_write_data     = Signal(2 * bitwidth) # Cat(x, y)
+        self.orbit_write_enable   = Signal()
 
         self.bottom_left_corner_x = Signal(signed(bitwidth))
         self.bottom_left_corner_y = Signal(signed(bitwidth))
@@ -32,6 +158,47 @@ class FractalManagerCore(Elaboratable):
 
         # this will trigger the computation
         self.start = Signal()
+        # strobes, when the last pixel of the frame has been given to a core
+        self.frame_done = Signal()
+        # the scheduler can take the next command
+        self.scheduler_idle = Signal()
+
+        # with tile set at the start, only the no_pixels_x + 1 by no_pixels_y + 1 pixels
+        # from pixel tile_x, tile_y of the frame at the corner are computed, all of them
+        self.tile   = Signal()
+        self.tile_x = Signal(16)
+        self.tile_y = Signal(16)
+        # with subdivide set at the start, the frame or the tile is split into rectangles,
+        # those with one iteration count all around come out as a single filled result
+        self.subdivide = Signal()
+        # the tile is scanned in interlace + 1 passes, the first one takes every 2^interlace-th
+        # pixel of every 2^interlace-th row, each later one fills in the pixels of the grid
+        # with half the spacing, so a coarse preview of the whole tile comes first
+        self.interlace = Signal(range(interlace_levels + 1))
+        # with queue_frames, the next command is loaded while the cores still run the last frame,
+        # it starts as soon as the scheduler is done with the last one, each start counts up
+        # frame_id, which comes back with the results of the frame
+        self.frame_id = Signal(8)
+        # with supersample set at the start, each pixel of the tile is computed as 2^supersample
+        # by 2^supersample samples, it comes out with the mean iteration count of its samples,
+        # as maxed, if all of them are, and with the number of its maxed samples
+        self.supersample = Signal(range(supersample_levels + 1))
+
+        # computes a single pixel of the frame at the corner
+        self.list_valid   = Signal()
+        self.list_ready   = Signal() # the scheduler has taken the pixel
+        self.list_pixel_x = Signal(16)
+        self.list_pixel_y = Signal(16)
+
+        # continues a maxed pixel of the last frame from its final state,
+        # the pixel coordinate is relative to the corner of the last frame
+        self.resume_valid     = Signal()
+        self.resume_ready     = Signal() # the scheduler has taken the pixel
+        self.resume_pixel_x   = Signal(16)
+        self.resume_pixel_y   = Signal(16)
+        self.resume_x         = Signal(signed(bitwidth))
+        self.resume_y         = Signal(signed(bitwidth))
+        self.resume_iteration = Signal(32)
 
         # result output
         self.result_iterations = Signal(32)
@@ -39,191 +206,1398 @@ class FractalManagerCore(Elaboratable):
         self.result_pixel_y    = Signal(16)
         self.result_escape     = Signal()
         self.result_maxed      = Signal()
+        self.result_glitch     = Signal() # the pixel needs to be computed with another reference
+        self.result_interior   = Signal() # the interior check found the pixel, it has no final z
+        self.result_zx         = Signal(signed(bitwidth)) # final z of a maxed pixel
+        self.result_zy         = Signal(signed(bitwidth))
+        self.result_distance   = Signal(signed(16)) # log2 of the distance estimate of an escaped pixel
+        self.result_fill       = Signal() # the result fills the rectangle up to fill_x, fill_y
+        self.result_fill_x     = Signal(16)
+        self.result_fill_y     = Signal(16)
+        self.result_frame      = Signal(8) # the frame_id, which was current, when the pixel was given out
+        self.result_maxed_samples = Signal(8) # of a supersampled pixel
         self.result_valid      = Signal() # strobes, if the result is valid
+        self.result_ready      = Signal() # the consumer can take a result
+        self.result_waiting    = Signal() # a result is there, whether the consumer takes it or not
+        self.results_pending   = Signal() # results are still on their way to the consumer
+
+        # statistics of the current frame
+        # iterations the cores did not run, because of the interior
+        # and the periodicity checks
+        self.saved_iterations  = Signal(48)
+
+        # buddhabrot mode: the cores hand out the orbits of the escaping pixels,
+        # their points are counted in a histogram, which starts at the corner
+        # of the frame and has bins of 2^histogram_shift in both directions
+        self.histogram_shift   = Signal(8)
+        self.histogram_address = Signal(range(histogram_width * histogram_height))
+        self.histogram_data    = Signal(histogram_bits) # one clock after the address
+        self.histogram_clear   = Signal() # clears the entry at histogram_address
+        self.histogram_busy    = Signal() # orbit points are still being counted
+
+        # orbit trace mode: this traces the orbit of the corner on the next idle core,
+        # up to max_iterations, its points come out one by one, followed by its result,
+        # which is marked with result_orbit
+        self.orbit_start       = Signal()
+        self.trace_valid       = Signal()
+        self.trace_ready       = Signal()
+        self.trace_x           = Signal(signed(bitwidth))
+        self.trace_y           = Signal(signed(bitwidth))
+        self.result_orbit      = Signal()
 
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
         bitwidth  = self._bitwidth
         bytewidth = bitwidth // 8
         no_cores = self._no_cores
+        # pixels found inside by the interior check and the filled rectangles
+        # of subdivide mode are collected like the results of additional cores
+        fill_source = no_cores + 1 if self._interior_check else no_cores
+        no_sources  = fill_source + 1 if self._subdivide else fill_source
 
         current_x = Signal.like(self.bottom_left_corner_x)
         current_y = Signal.like(self.bottom_left_corner_y)
         current_pixel_x = Signal.like(self.no_pixels_x)
         current_pixel_y = Signal.like(self.no_pixels_y)
+        # the rows of a frame or a tile start at left_x, the scheduler
+        # stops when it gets to stop_pixel_x, stop_pixel_y
+        left_x          = Signal.like(self.bottom_left_corner_x)
+        left_pixel_x    = Signal.like(self.no_pixels_x)
+        right_pixel_x   = Signal.like(self.no_pixels_x)
+        stop_pixel_x    = Signal.like(self.no_pixels_x)
+        stop_pixel_y    = Signal(17)
+
+        # with queue_frames, the scheduler and the cores work from a copy of the command,
+        # which is taken at the start, so that the next command can come in meanwhile
+        queued = self._queue_frames
+        if queued:
+            frame_corner_x       = Signal.like(self.bottom_left_corner_x)
+            frame_corner_y       = Signal.like(self.bottom_left_corner_y)
+            frame_step           = Signal.like(self.step)
+            frame_max_iterations = Signal.like(self.max_iterations)
+        else:
+            frame_corner_x       = self.bottom_left_corner_x
+            frame_corner_y       = self.bottom_left_corner_y
+            frame_step           = self.step
+            frame_max_iterations = self.max_iterations
+
+        # with raster_order, the pixels are numbered in the order they go to the cores, a result
+        # waits in the reorder buffer, until the results of all the pixels before it have gone on
+        raster     = self._raster_order
+        index_bits = (self._reorder_depth - 1).bit_length()
+        sequence   = Signal(index_bits + 1)
+        emitted    = Signal(index_bits + 1)
+        # the reorder buffer has a place for the next pixel
+        room       = Signal()
+
+        # with supersample_levels, the samples of a pixel go to the cores one after the other,
+        # the pixel is given a slot, when its first sample leaves the scheduler,
+        # where the results of its samples add up, until the last one is in
+        supersampled = self._supersample_levels > 0
+        slot_bits    = (self._supersample_depth - 1).bit_length()
+        # the samples of the current pixel lie sample_step apart from the pixel on,
+        # sub_x and sub_y count them up to sample_last, a pixel with a single sample needs no slot
+        sample_x     = Signal.like(current_x)
+        sample_y     = Signal.like(current_y)
+        first_sample = Signal()
+
+        if supersampled:
+            sample_level = Signal.like(self.supersample)
+            sample_last  = Signal(self._supersample_levels)
+            sample_step  = Signal.like(self.step)
+            sub_x        = Signal.like(sample_last)
+            sub_y        = Signal.like(sample_last)
+            offset_x     = Signal.like(self.step)
+            offset_y     = Signal.like(self.step)
+            # the slot of the pixel, which has been given out last
+            sample_slot  = Signal(slot_bits)
+            next_slot    = (sample_slot + 1)[:slot_bits]
+            slot_busy    = Array([Signal(name=f"slot_busy_{n}") for n in range(self._supersample_depth)])
+            slot_free    = Signal()
+            m.d.comb += [
+                sample_x.eq(current_x + offset_x),
+                sample_y.eq(current_y + offset_y),
+                first_sample.eq((sub_x == 0) & (sub_y == 0) & (sample_level != 0)),
+                slot_free.eq(~slot_busy[next_slot]),
+            ]
+
+            def claim_slot():
+                return [
+                    sample_slot.eq(next_slot),
+                    slot_busy[next_slot].eq(1),
+                ]
+        else:
+            m.d.comb += [
+                sample_x.eq(current_x),
+                sample_y.eq(current_y),
+            ]
+
+        if raster:
+            m.d.comb += room.eq((sequence - emitted)[:len(sequence)] < self._reorder_depth)
+        elif not supersampled:
+            m.d.comb += room.eq(1)
+
+        # the frame id or the number of the pixel follows the pixel coordinates in the tag,
+        # a sample has its slot and the number of levels of its pixel there
+        if queued:
+            tag_width = 32 + len(self.frame_id)
+        elif raster:
+            tag_width = 32 + len(sequence)
+        elif supersampled:
+            tag_width = 32 + slot_bits + len(self.supersample)
+        else:
+            tag_width = 32
+
+        def pixel_tag(pixel_x, pixel_y):
+            if queued:
+                return Cat(pixel_x, pixel_y, self.frame_id)
+            elif supersampled:
+                # the first sample of a pixel claims a slot
+                return Cat(pixel_x, pixel_y, first_sample)
+            return Cat(pixel_x, pixel_y)
+
+        def launch_tag(tag):
+            # the pixel is numbered, when it leaves the scheduler
+            if raster:
+                return Cat(tag[:32], sequence)
+            elif supersampled:
+                return Cat(tag[:32], Mux(tag[32], next_slot, sample_slot), sample_level)
+            return tag
 
         # instantiate cores
         cores    = []
         # core scheduler signals
         idle     = Array([Signal(                  name=f"idle_{n}")   for n in range(no_cores)])
+        busy     = Array([Signal(                  name=f"busy_{n}")   for n in range(no_cores)])
         start    = Array([Signal(                  name=f"start_{n}")  for n in range(no_cores)])
         xs       = Array([Signal(signed(bitwidth), name=f"x_{n}")      for n in range(no_cores)])
         ys       = Array([Signal(signed(bitwidth), name=f"y_{n}")      for n in range(no_cores)])
-        pixel_x  = Array([Signal(signed(bitwidth), name=f"pixelx_{n}") for n in range(no_cores)])
-        pixel_y  = Array([Signal(signed(bitwidth), name=f"pixely_{n}") for n in range(no_cores)])
+        # the pixel coordinates travel with the pixel through the core
+        tags     = Array([Signal(tag_width,        name=f"tag_{n}")    for n in range(no_cores)])
+        # with queue_frames, a core runs its pixel up to the max_iterations of its frame
+        limits   = Array([Signal(32,               name=f"limit_{n}")  for n in range(no_cores)])
 
-        m.d.comb += self.busy_out.eq(~Cat(idle))
+        m.d.comb += self.busy_out.eq(Cat(busy))
 
-        # result collector signals
-        done       = Array([Signal(    name=f"done_{n}")    for n in range(no_cores)])
-        collect    = Array([Signal(    name=f"collect_{n}") for n in range(no_cores)])
-        maxed      = Array([Signal(    name=f"maxed_{n}")   for n in range(no_cores)])
-        escape     = Array([Signal(    name=f"escape_{n}")  for n in range(no_cores)])
-        iterations = Array([Signal(32, name=f"done_{n}")    for n in range(no_cores)])
+        # chunk mode: each core is given a run of up to chunk_size pixels of a row,
+        # xs and tags then hold its next pixel, which it steps on by itself
+        chunked      = self._chunk_size is not None
+        chunk_bits   = (self._chunk_size or 1).bit_length() - 1
+        chunk_left   = Array([Signal(range((self._chunk_size or 1) + 1), name=f"chunk_left_{n}")
+                              for n in range(no_cores)])
+        chunk_pixels = Signal.like(chunk_left[0])
 
+        # result collector signals
+        done       = Array([Signal(    name=f"done_{n}")    for n in range(no_sources)])
+        collect    = Array([Signal(    name=f"collect_{n}") for n in range(no_sources)])
+        maxed      = Array([Signal(    name=f"maxed_{n}")   for n in range(no_sources)])
+        escape     = Array([Signal(    name=f"escape_{n}")  for n in range(no_sources)])
+        glitch     = Array([Signal(    name=f"glitch_{n}")  for n in range(no_sources)])
+        iterations = Array([Signal(32, name=f"done_{n}")    for n in range(no_sources)])
+        result_tag = Array([Signal(tag_width, name=f"result_tag_{n}") for n in range(no_sources)])
+        saved      = Array([Signal(32, name=f"saved_{n}")   for n in range(no_sources)])
+        zx         = Array([Signal(signed(bitwidth), name=f"zx_{n}") for n in range(no_sources)])
+        zy         = Array([Signal(signed(bitwidth), name=f"zy_{n}") for n in range(no_sources)])
+        distance   = Array([Signal(signed(16), name=f"distance_{n}") for n in range(no_sources)])
+
+        # orbit points of the buddhabrot and the orbit trace modes
+        trace_valid = Array([Signal(name=f"trace_valid_{n}") for n in range(no_cores)])
+        trace_ready = Array([Signal(name=f"trace_ready_{n}") for n in range(no_cores)])
+        trace_x     = Array([Signal(signed(bitwidth), name=f"trace_x_{n}") for n in range(no_cores)])
+        trace_y     = Array([Signal(signed(bitwidth), name=f"trace_y_{n}") for n in range(no_cores)])
+
+        # the cores take the resume state when they are started
+        resume_start     = Signal()
+        resume_x         = Signal.like(self.resume_x)
+        resume_y         = Signal.like(self.resume_y)
+        resume_iteration = Signal.like(self.resume_iteration)
+
+        # the core, which traces an orbit, is told so when it is started,
+        # the result of the orbit has a pixel x, which no frame has
+        orbit_trigger = Signal()
+        orbit_tag     = Const(0xffff, 32)
+
+        # the last narrow_cores cores have fewer fraction bits, but the same
+        # integer bits, they are smaller and faster and are given pixels only
+        # when the step between pixels is coarse enough for their precision
+        narrow_shift    = self._fraction_bits - self._narrow_fraction_bits
+        narrow_bitwidth = bitwidth - narrow_shift
+        narrow_frame    = Signal()
+        usable          = Signal(no_cores)
+
+        first_narrow = no_cores - self._narrow_cores
+        m.d.comb += usable.eq(Cat(*[Const(1) if c < first_narrow else narrow_frame for c in range(no_cores)]))
+
+        if self._perturbation:
+            # the reference orbit is shared by all cores, each one has its own read port
+            orbit = Memory(width=2 * bitwidth, depth=self._orbit_depth)
+            m.submodules.orbit_write = orbit_write = orbit.write_port()
+            m.d.comb += [
+                orbit_write.addr.eq(self.orbit_write_address),
+                orbit_write.data.eq(self.orbit_write_data),
+                orbit_write.en.eq(self.orbit_write_enable),
+            ]
 
         for c in range(no_cores):
-            core = Mandelbrot(bitwidth=bitwidth, fraction_bits=self._fraction_bits, test=self._test)
+            narrow = c >= first_narrow
+            core_bitwidth      = narrow_bitwidth if narrow else bitwidth
+            core_fraction_bits = self._narrow_fraction_bits if narrow else self._fraction_bits
+            shift              = narrow_shift if narrow else 0
+
+            if self._limb_width is not None:
+                core = MultiLimbMandelbrot(limb_width=self._limb_width, max_limbs=self._max_limbs,
+                                           tag_width=tag_width)
+                m.d.comb += core.limbs_in.eq(self.limbs)
+            elif self._perturbation:
+                core = PerturbationMandelbrot(bitwidth=bitwidth, fraction_bits=self._fraction_bits,
+                                              orbit_depth=self._orbit_depth, tag_width=tag_width)
+                m.submodules[f"orbit_read_{c}"] = orbit_read = orbit.read_port(transparent=False)
+                m.d.comb += [
+                    orbit_read.addr.eq(core.orbit_address_out),
+                    core.orbit_x_in.eq(orbit_read.data[:bitwidth]),
+                    core.orbit_y_in.eq(orbit_read.data[bitwidth:]),
+                    core.orbit_length_in.eq(self.orbit_length),
+                    core.exponent_in.eq(self.exponent),
+                    glitch[c].eq(core.glitch_out),
+                ]
+            elif self._pipelined:
+                core = PipelinedMandelbrot(bitwidth=core_bitwidth, fraction_bits=core_fraction_bits,
+                                           slots=self._slots, multiplier_stages=self._multiplier_stages,
+                                           squarers=self._squarers, tag_width=tag_width)
+            else:
+                core = Mandelbrot(bitwidth=core_bitwidth, fraction_bits=core_fraction_bits,
+                                  multipliers=self._multipliers, multiplier_stages=self._multiplier_stages,
+                                  squarers=self._squarers, periodicity_check=self._periodicity_check,
+                                  periodicity_tolerance=self._periodicity_tolerance,
+                                  resumable=self._resumable, distance_estimate=self._distance_estimate,
+                                  trace=self._buddhabrot, orbit_trace=self._orbit_trace,
+                                  tag_width=tag_width, test=self._test)
+                m.d.comb += saved[c].eq(core.saved_iterations_out)
+                if self._distance_estimate:
+                    m.d.comb += distance[c].eq(core.distance_out)
+                if self._orbit_trace:
+                    m.d.comb += core.trace_orbit_in.eq(orbit_trigger)
+                if self._buddhabrot or self._orbit_trace:
+                    m.d.comb += [
+                        trace_valid[c].eq(core.trace_valid_out),
+                        core.trace_ready_in.eq(trace_ready[c]),
+                        trace_x[c].eq(core.trace_x_out),
+                        trace_y[c].eq(core.trace_y_out),
+                    ]
+                if self._resumable:
+                    m.d.comb += [
+                        core.resume_in.eq(resume_start),
+                        core.x_in.eq(resume_x),
+                        core.y_in.eq(resume_y),
+                        core.iteration_in.eq(resume_iteration),
+                        zx[c].eq(core.x_out),
+                        zy[c].eq(core.y_out),
+                    ]
             cores.append(core)
             m.submodules[f"core_{c}"] = core
+
+            core_x, core_y = xs[c], ys[c]
+            if chunked:
+                # the core starts the pixels of its chunk one after the other,
+                # it shows ready_out for one more clock after each start
+                chunk_start = Signal(name=f"chunk_start_{c}")
+                chunk_wait  = Signal(name=f"chunk_wait_{c}")
+                # the core keeps reading cx_in and cy_in, while it iterates,
+                # so it is given its pixel from registers of its own
+                chunk_x     = Signal.like(xs[c], name=f"chunk_x_{c}")
+                chunk_y     = Signal.like(ys[c], name=f"chunk_y_{c}")
+                core_x      = Signal.like(xs[c], name=f"core_x_{c}")
+                core_y      = Signal.like(ys[c], name=f"core_y_{c}")
+                m.d.comb += [
+                    chunk_start.eq((chunk_left[c] != 0) & core.ready_out & ~chunk_wait),
+                    start[c].eq(chunk_start),
+                    # the next chunk can be given while the core runs the last pixel
+                    idle[c].eq(chunk_left[c] == 0),
+                    core_x.eq(Mux(chunk_start, xs[c], chunk_x)),
+                    core_y.eq(Mux(chunk_start, ys[c], chunk_y)),
+                ]
+                m.d.sync += chunk_wait.eq(chunk_start)
+                with m.If(chunk_start):
+                    m.d.sync += [
+                        chunk_x.eq(xs[c]),
+                        chunk_y.eq(ys[c]),
+                        xs[c].eq(xs[c] + frame_step),
+                        tags[c][:16].eq(tags[c][:16] + 1),
+                        chunk_left[c].eq(chunk_left[c] - 1),
+                    ]
+            else:
+                m.d.comb += idle[c].eq(core.ready_out)
+
             m.d.comb += [
-                idle[c].eq(~core.busy_out),
+                busy[c].eq(core.busy_out),
                 core.start_in.eq(start[c]),
                 done[c].eq(core.result_ready_out),
                 maxed[c].eq(core.maxed_out),
                 escape[c].eq(core.escape_out),
                 core.result_read_in.eq(collect[c]),
                 iterations[c].eq(core.iterations_out),
-                core.cx_in.eq(xs[c]),
-                core.cy_in.eq(ys[c]),
-                core.max_iterations_in.eq(self.max_iterations),
+                result_tag[c].eq(core.tag_out),
+                core.cx_in.eq(core_x >> shift),
+                core.cy_in.eq(core_y >> shift),
+                core.tag_in.eq(tags[c]),
+                core.max_iterations_in.eq(limits[c] if queued else self.max_iterations),
+            ]
+
+        # the dispatcher hands out one pixel per clock, the pixels run through
+        # the interior check first and wait at its end for an idle core,
+        # the whole dispatch pipeline stalls while they wait
+        dispatch_advance = Signal()
+        dispatch_feed    = Signal()
+        dispatch_accept  = Signal()
+        pixels_left      = Signal()
+        # the cores, which are started in the next clock
+        launch           = Signal(no_cores)
+        if not chunked:
+            m.d.comb += Cat(start).eq(launch)
+
+        # interior check, the pixels it finds never escape
+        # and are marked as maxed without running through a core
+        interior_found = Signal()
+        interior_tag   = Signal(tag_width)
+        interior_limit = Signal(32) if queued else frame_max_iterations
+
+        if self._interior_check:
+            m.submodules.interior_check = interior_check = EnableInserter(dispatch_advance)(
+                InteriorCheck(bitwidth=bitwidth, fraction_bits=self._fraction_bits))
+            m.d.comb += [
+                interior_check.cx_in.eq(sample_x),
+                interior_check.cy_in.eq(sample_y),
+                interior_check.start_in.eq(dispatch_feed),
+                done[no_cores].eq(interior_found),
+                maxed[no_cores].eq(1),
+                escape[no_cores].eq(0),
+                iterations[no_cores].eq(interior_limit + 1),
+                result_tag[no_cores].eq(interior_tag),
+                saved[no_cores].eq(interior_limit + 1),
             ]
 
+            with m.If(collect[no_cores]):
+                m.d.sync += interior_found.eq(0)
+
+        # with cluster_size, the cores are grouped into clusters, each of which registers
+        # its next idle core and its next result, so the encoders and the wide multiplexers
+        # over all the cores are split into a stage per cluster and a stage over the clusters,
+        # where round robin arbiters pick one of the few clusters
+        clustered = self._cluster_size is not None
+        clusters  = [range(lo, min(lo + self._cluster_size, no_cores))
+                     for lo in range(0, no_cores, self._cluster_size)] if clustered else []
+
         # next core scheduler
         next_core       = Signal(range(no_cores))
         next_core_ready = Signal()
+        next_core_taken = Signal() # the scheduler gives its pixel to next_core
         current_core    = Signal.like(next_core)
+        free            = Signal(no_cores)
+        m.d.comb += free.eq(Cat(idle) & usable & ~launch)
+
+        if clustered:
+            cluster_core  = Array([Signal(range(no_cores), name=f"cluster_core_{k}") for k in range(len(clusters))])
+            cluster_free  = Signal(len(clusters))
+            # the cluster, which has just given out its core, makes its next choice a clock later
+            cluster_taken = Signal(len(clusters))
+
+            for k, cluster in enumerate(clusters):
+                m.submodules[f"cluster_core_scheduler_{k}"] = encoder = PriorityEncoder(len(cluster))
+                m.d.comb += encoder.i.eq(free[cluster.start:cluster.stop])
+                m.d.sync += [
+                    cluster_free[k].eq(~encoder.n),
+                    cluster_core[k].eq(cluster.start + encoder.o),
+                ]
 
-        m.submodules.next_core_scheduler = next_core_scheduler = PriorityEncoder(no_cores)
-        m.d.comb += [
-            next_core_scheduler.i.eq(Cat(idle)),
-            next_core.eq(next_core_scheduler.o),
-            next_core_ready.eq(~next_core_scheduler.n),
-        ]
+            # the grant over the clusters is registered as well, so its choice is two clocks old
+            m.submodules.next_core_scheduler = next_core_scheduler = RoundRobinArbiter(width=len(clusters), registered=True)
+            m.d.comb += [
+                next_core_scheduler.requests_in.eq(cluster_free & ~cluster_taken),
+                next_core_scheduler.next_in.eq(next_core_taken),
+                next_core.eq(cluster_core[next_core_scheduler.grant_out]),
+                # the core may have been taken since, and the usable cores change with the start of a frame
+                next_core_ready.eq(next_core_scheduler.valid_out & free.bit_select(next_core, 1)),
+            ]
+            m.d.sync += cluster_taken.eq(Mux(next_core_taken, 1 << next_core_scheduler.grant_out, 0))
+        else:
+            m.submodules.next_core_scheduler = next_core_scheduler = PriorityEncoder(no_cores)
+            m.d.comb += [
+                next_core_scheduler.i.eq(free),
+                next_core.eq(next_core_scheduler.o),
+                next_core_ready.eq(~next_core_scheduler.n),
+            ]
 
-        # result scheduler
+        # result scheduler, the collector takes its results from its inputs, which are
+        # the sources themselves, or the registers of the clusters and the other sources
+        first_other       = len(clusters) if clustered else no_cores
+        no_inputs         = first_other + no_sources - no_cores
         next_result_ready = Signal()
-        next_result       = Signal(range(no_cores))
-        current_result    = Signal.like(next_result)
+        next_result_taken = Signal() # the collector takes the result of next_result
+        next_result       = Signal(range(no_inputs))
+        # the results, which are still there at the start of a frame, are dropped
+        flush_results     = Signal()
+
+        if clustered:
+            fields = [maxed, escape, glitch, iterations, result_tag, saved, zx, zy, distance]
+
+            def input_array(array, name):
+                return Array([Signal.like(array[cluster.start], name=f"cluster_{name}_{k}")
+                              for k, cluster in enumerate(clusters)]
+                             + [array[n] for n in range(no_cores, no_sources)])
+
+            input_done       = input_array(done, "done")
+            input_fields     = [input_array(array, f"field_{n}") for n, array in enumerate(fields)]
+            input_collect    = Array([Signal(name=f"input_collect_{n}") for n in range(no_inputs)])
+            (input_maxed, input_escape, input_glitch, input_iterations, input_result_tag,
+             input_saved, input_zx, input_zy, input_distance) = input_fields
+
+            for n in range(no_cores, no_sources):
+                m.d.comb += collect[n].eq(input_collect[first_other + n - no_cores])
+
+            for k, cluster in enumerate(clusters):
+                m.submodules[f"cluster_result_scheduler_{k}"] = encoder = PriorityEncoder(len(cluster))
+                cluster_result = Signal(range(no_cores), name=f"cluster_result_{k}")
+                m.d.comb += [
+                    encoder.i.eq(Cat(done[c] for c in cluster)),
+                    cluster_result.eq(cluster.start + encoder.o),
+                ]
+                # the register takes the next result, while its last one is being collected
+                with m.If(~encoder.n & (~input_done[k] | input_collect[k])):
+                    m.d.comb += collect[cluster_result].eq(1)
+                    m.d.sync += [
+                        input_done[k].eq(1),
+                        *[inputs[k].eq(array[cluster_result]) for inputs, array in zip(input_fields, fields)],
+                    ]
+                with m.Elif(input_collect[k]):
+                    m.d.sync += input_done[k].eq(0)
+                with m.If(flush_results):
+                    m.d.sync += input_done[k].eq(0)
 
-        m.submodules.result_scheduler = result_scheduler = PriorityEncoder(no_cores)
-        m.d.comb += [
-            result_scheduler.i.eq(Cat(done)),
-            next_result.eq(result_scheduler.o),
-            next_result_ready.eq(~result_scheduler.n),
-        ]
+            # a result, which waits in the register of its cluster, keeps the cores of the cluster
+            # busy, so that the next command does not start and drop it
+            m.d.comb += self.busy_out.eq(Cat(busy) | Cat(Repl(input_done[k], len(cluster))
+                                                         for k, cluster in enumerate(clusters)))
 
+            m.submodules.result_scheduler = result_scheduler = RoundRobinArbiter(width=no_inputs, registered=True)
+            m.d.comb += [
+                result_scheduler.requests_in.eq(Cat(input_done)),
+                result_scheduler.next_in.eq(next_result_taken),
+                next_result.eq(result_scheduler.grant_out),
+                # the grant is a clock old, the result may have been taken or flushed since
+                next_result_ready.eq(result_scheduler.valid_out & input_done[next_result]),
+            ]
+        else:
+            (input_done, input_collect, input_maxed, input_escape, input_glitch, input_iterations,
+             input_result_tag, input_saved, input_zx, input_zy, input_distance) = \
+                (done, collect, maxed, escape, glitch, iterations, result_tag, saved, zx, zy, distance)
 
-        # core scheduler FSM
-        with m.FSM(name="scheduler") as fsm:
-            with m.State("IDLE"):
-                with m.If(self.start):
+            m.submodules.result_scheduler = result_scheduler = PriorityEncoder(no_sources)
+            m.d.comb += [
+                result_scheduler.i.eq(Cat(done)),
+                next_result.eq(result_scheduler.o),
+                next_result_ready.eq(~result_scheduler.n),
+            ]
+
+
+        # interlaced scan: the rows of a pass are row_stride apart from first_row on,
+        # on the rows, which the last pass has been through, every other pixel is left
+        interlaced = self._interlace_levels > 0
+        # the pixel at the current position is in the row, a row of a later pass may be empty
+        in_row     = Signal()
+
+        if interlaced:
+            scan_pass    = Signal(range(self._interlace_levels + 1))
+            first_pass   = Signal()
+            row_stride   = Signal(16)
+            row_step     = Signal.like(self.step)
+            pixel_stride = Signal(17)
+            pixel_step   = Signal.like(self.step)
+            first_row    = Signal.like(current_pixel_y)
+            first_row_y  = Signal.like(current_y)
+            last_row     = Signal(17)
+
+            def start_scan(passes, first, first_y, last, step):
+                return [
+                    scan_pass.eq(passes),
+                    first_pass.eq(1),
+                    row_stride.eq(Const(1, 16) << passes),
+                    row_step.eq(step << passes),
+                    pixel_stride.eq(Const(1, 16) << passes),
+                    pixel_step.eq(step << passes),
+                    first_row.eq(first),
+                    first_row_y.eq(first_y),
+                    last_row.eq(last),
+                ]
+
+            def next_row():
+                row       = current_pixel_y + row_stride
+                revisited = (  ~first_pass & (row <= last_row)
+                             & (((row - first_row) & ((row_stride << 1) - 1)) == 0))
+                with m.If((row > last_row) & (scan_pass != 0)):
+                    # the next pass starts over at the first row, which this pass has been through
                     m.d.sync += [
-                        current_x.eq(self.bottom_left_corner_x),
-                        current_y.eq(self.bottom_left_corner_y),
-                        current_pixel_x.eq(0),
-                        current_pixel_y.eq(0),
+                        scan_pass.eq(scan_pass - 1),
+                        first_pass.eq(0),
+                        row_stride.eq(row_stride >> 1),
+                        row_step.eq(row_step >> 1),
+                        pixel_stride.eq(row_stride),
+                        pixel_step.eq(row_step),
+                        current_x.eq(left_x + (row_step >> 1)),
+                        current_pixel_x.eq(left_pixel_x + (row_stride >> 1)),
+                        current_y.eq(first_row_y),
+                        current_pixel_y.eq(first_row),
+                    ]
+                with m.Else():
+                    m.d.sync += [
+                        current_x.eq(Mux(revisited, left_x + row_step, left_x)),
+                        current_pixel_x.eq(Mux(revisited, left_pixel_x + row_stride, left_pixel_x)),
+                        current_y.eq(current_y + row_step),
+                        current_pixel_y.eq(row),
+                        pixel_stride.eq(Mux(revisited, row_stride << 1, row_stride)),
+                        pixel_step.eq(Mux(revisited, row_step << 1, row_step)),
                     ]
-                    m.d.comb += Cat(collect).eq(2**no_cores - 1)
-                    m.next = "PICK"
 
-            with m.State("PICK"):
-                with m.If(  (current_pixel_x == self.no_pixels_x)
-                          & (current_pixel_y == self.no_pixels_y)):
+            def next_pixel():
+                with m.If(current_pixel_x + pixel_stride <= right_pixel_x):
                     m.d.sync += [
-                        current_pixel_x.eq(0),
-                        current_pixel_y.eq(0),
+                        current_x.eq(current_x + pixel_step),
+                        current_pixel_x.eq(current_pixel_x + pixel_stride),
                     ]
-                    m.next = "IDLE"
+                with m.Else():
+                    next_row()
 
-                with m.Elif(next_core_ready):
-                    m.d.sync += current_core.eq(next_core)
-                    m.next = "SCHEDULE"
+            m.d.comb += in_row.eq(current_pixel_x <= right_pixel_x)
 
-            with m.State("SCHEDULE"):
+        else:
+            def next_row():
                 m.d.sync += [
-                    xs[current_core].eq(current_x),
-                    ys[current_core].eq(current_y),
-                    pixel_x[current_core].eq(current_pixel_x),
-                    pixel_y[current_core].eq(current_pixel_y),
+                    current_x.eq(left_x),
+                    current_pixel_x.eq(left_pixel_x),
+                    current_y.eq(current_y + frame_step),
+                    current_pixel_y.eq(current_pixel_y + 1),
                 ]
 
-                with m.If(current_pixel_x < self.no_pixels_x):
+            def next_pixel():
+                with m.If(current_pixel_x < right_pixel_x):
                     m.d.sync += [
-                        current_x.eq(current_x + self.step),
+                        current_x.eq(current_x + frame_step),
                         current_pixel_x.eq(current_pixel_x + 1),
                     ]
                 with m.Else():
+                    next_row()
+
+            m.d.comb += in_row.eq(1)
+
+        # the chunk ends with the row, or where the scheduler stops
+        row_end = Signal(17)
+        m.d.comb += row_end.eq(Mux(current_pixel_y == stop_pixel_y, stop_pixel_x, right_pixel_x + 1))
+
+        def next_sample():
+            # the samples of a pixel are scanned row by row like the pixels of a tile
+            with m.If(sub_x != sample_last):
+                m.d.sync += [
+                    sub_x.eq(sub_x + 1),
+                    offset_x.eq(offset_x + sample_step),
+                ]
+            with m.Elif(sub_y != sample_last):
+                m.d.sync += [
+                    sub_x.eq(0),
+                    offset_x.eq(0),
+                    sub_y.eq(sub_y + 1),
+                    offset_y.eq(offset_y + sample_step),
+                ]
+            with m.Else():
+                m.d.sync += [
+                    sub_x.eq(0),
+                    offset_x.eq(0),
+                    sub_y.eq(0),
+                    offset_y.eq(0),
+                ]
+                next_pixel()
+
+        def next_chunk():
+            with m.If(current_pixel_x + self._chunk_size < row_end):
+                m.d.sync += [
+                    current_x.eq(current_x + (frame_step << chunk_bits)),
+                    current_pixel_x.eq(current_pixel_x + self._chunk_size),
+                ]
+            with m.Elif(current_pixel_y == stop_pixel_y):
+                # the last chunk
+                m.d.sync += current_pixel_x.eq(stop_pixel_x)
+            with m.Else():
+                next_row()
+
+        if chunked:
+            row_left = Signal(17)
+            m.d.comb += [
+                row_left.eq(row_end - current_pixel_x),
+                chunk_pixels.eq(Mux(row_left > self._chunk_size, self._chunk_size, row_left)),
+            ]
+
+        def pixel_coordinate(corner, pixel, step=self.step):
+            return corner + pixel * step
+
+        # the pixels travel alongside the interior check
+        dispatch_stages = interior_check.latency if self._interior_check else 0
+        dispatch_valid  = Signal(dispatch_stages)
+        dispatch_x      = [Signal.like(current_x, name=f"dispatch_x_{n}") for n in range(dispatch_stages)]
+        dispatch_y      = [Signal.like(current_y, name=f"dispatch_y_{n}") for n in range(dispatch_stages)]
+        dispatch_tag    = [Signal(tag_width,      name=f"dispatch_tag_{n}") for n in range(dispatch_stages)]
+        dispatch_inside = interior_check.inside_out if self._interior_check else Const(0)
+
+        # the pixel at the end of the pipeline
+        dispatch_pixel  = Signal()
+        out_valid = dispatch_valid[-1] if dispatch_stages else dispatch_pixel
+        out_x     = dispatch_x[-1]   if dispatch_stages else sample_x
+        out_y     = dispatch_y[-1]   if dispatch_stages else sample_y
+        out_tag   = dispatch_tag[-1] if dispatch_stages else pixel_tag(current_pixel_x, current_pixel_y)
+
+        if supersampled:
+            # the later samples of a pixel go into the slot of its first one
+            m.d.comb += room.eq(~(out_valid & out_tag[32]) | slot_free)
+
+        m.d.comb += [
+            pixels_left.eq(~((current_pixel_x == stop_pixel_x) & (current_pixel_y == stop_pixel_y))),
+            dispatch_pixel.eq(pixels_left & in_row),
+            dispatch_accept.eq(out_valid & room & Mux(dispatch_inside, ~interior_found, next_core_ready)),
+            dispatch_advance.eq(~out_valid | dispatch_accept),
+        ]
+        m.d.sync += launch.eq(0)
+
+        tile_x = Mux(self.tile, self.tile_x, 0)
+        tile_y = Mux(self.tile, self.tile_y, 0)
+        # the coordinates of the first pixel of the tile
+        tile_cx = Signal.like(current_x)
+        tile_cy = Signal.like(current_y)
+        m.d.comb += [
+            tile_cx.eq(pixel_coordinate(self.bottom_left_corner_x, tile_x)),
+            tile_cy.eq(pixel_coordinate(self.bottom_left_corner_y, tile_y)),
+        ]
+
+        # a single pixel of a pixel list or a resumed pixel
+        resuming = Signal()
+
+        # subdivide mode: the rectangles wait on a work stack, one, whose surrounding
+        # ring of computed pixels has a single iteration count, is filled with it,
+        # a small one is computed pixel by pixel and any other one is split in two
+        # by a line of pixels across its longer side, which are computed first.
+        # Each side of the ring is kept as 2^subdivide_levels segments, which end
+        # where the lines of the later rectangles cross it, each one with the
+        # iteration count its pixels share, so that the halves know their rings
+        subdivide   = self._subdivide
+        subdividing = Signal()
+        splitting   = Signal()
+
+        if subdivide:
+            segments       = 2**self._subdivide_levels
+            segment_layout = [("seen", 1), ("mixed", 1), ("value", 32)]
+            side_layout    = [(f"segment_{s}", segment_layout) for s in range(segments)]
+            sides          = ["bottom", "top", "left", "right"]
+            # the pixels inside of the ring
+            rect_layout    = [("x0", 16), ("y0", 16), ("x1", 16), ("y1", 16)]
+
+            work   = Record(rect_layout + [(side, side_layout) for side in sides], name="work")
+            second = Record(work.layout, name="second")
+            line   = Record(side_layout, name="line")
+
+            stack = Memory(width=len(work), depth=self._subdivide_depth)
+            m.submodules.stack_read  = stack_read  = stack.read_port(transparent=False)
+            m.submodules.stack_write = stack_write = stack.write_port()
+            stack_pointer = Signal(range(self._subdivide_depth + 1))
+            m.d.comb += [
+                stack_write.addr.eq(stack_pointer),
+                stack_write.data.eq(second),
+            ]
+
+            def segments_of(side):
+                return [side[f"segment_{s}"] for s in range(segments)]
+
+            def half(side, upper):
+                # a segment of the side covers two segments of its half
+                return [side[f"segment_{(s + upper * segments) // 2}"] for s in range(segments)]
+
+            # the ring has a single iteration count, if no segment is mixed
+            # and all the segments, which have seen pixels, agree
+            ring         = [segment for side in sides for segment in segments_of(work[side])]
+            ring_value   = Signal(32)
+            ring_uniform = Signal()
+            value        = Const(0, 32)
+            for segment in reversed(ring):
+                value = Mux(segment.seen, segment.value, value)
+            m.d.comb += [
+                ring_value.eq(value),
+                ring_uniform.eq(  Cat(*[segment.seen for segment in ring]).any()
+                                & Cat(*[~segment.mixed & (~segment.seen | (segment.value == ring_value))
+                                        for segment in ring]).all()),
+            ]
+
+            mid_x = Signal(16)
+            mid_y = Signal(16)
+            wide  = Signal()
+            small = Signal()
+            m.d.comb += [
+                mid_x.eq((work.x0 + work.x1) >> 1),
+                mid_y.eq((work.y0 + work.y1) >> 1),
+                wide.eq(work.x1 - work.x0 >= work.y1 - work.y0),
+                small.eq(  (work.x1 - work.x0 < self._subdivide_min)
+                         | (work.y1 - work.y0 < self._subdivide_min)),
+            ]
+
+            # a small rectangle is dispatched like a tile, so is the line
+            # through the middle of a larger one
+            origin_x  = Signal(16)
+            origin_y  = Signal(16)
+            origin_cx = Signal.like(current_x)
+            origin_cy = Signal.like(current_y)
+            m.d.comb += [
+                origin_x.eq(Mux(~small & wide, mid_x, work.x0)),
+                origin_y.eq(Mux(~small & ~wide, mid_y, work.y0)),
+                origin_cx.eq(pixel_coordinate(frame_corner_x, origin_x, frame_step)),
+                origin_cy.eq(pixel_coordinate(frame_corner_y, origin_y, frame_step)),
+            ]
+
+            # the line runs from line_first to line_last at line_position,
+            # its segments end where the lines of its halves will cross it
+            line_vertical = Signal()
+            line_position = Signal(16)
+            line_first    = Signal(16)
+            line_last     = Signal(16)
+            # results of the line, which have not been collected yet
+            line_left     = Signal(17)
+
+            def cut_positions(first, last, levels):
+                if levels == 0:
+                    return []
+                middle = (first + last) >> 1
+                return (  cut_positions(first, middle - 1, levels - 1) + [middle]
+                        + cut_positions(middle + 1, last, levels - 1))
+
+            first = Cat(line_first, Const(0, 1)).as_signed()
+            last  = Cat(line_last,  Const(0, 1)).as_signed()
+            cuts  = [Signal(signed(18), name=f"cut_{n}") for n in range(segments - 1)]
+            m.d.comb += [cut.eq(position) for cut, position in zip(cuts, cut_positions(first, last, self._subdivide_levels))]
+            # neighbouring segments share the pixel, where they meet
+            segment_low  = [first - 1] + cuts
+            segment_high = cuts + [last + 1]
+
+            fill_found = Signal()
+            fill_value = Signal(32)
+            fill_rect  = Record(rect_layout, name="fill_rect")
+            m.d.comb += [
+                done[fill_source].eq(fill_found),
+                maxed[fill_source].eq(fill_value > frame_max_iterations),
+                escape[fill_source].eq(fill_value <= frame_max_iterations),
+                iterations[fill_source].eq(fill_value),
+                result_tag[fill_source].eq(pixel_tag(fill_rect.x0, fill_rect.y0)),
+            ]
+            with m.If(collect[fill_source]):
+                m.d.sync += fill_found.eq(0)
+
+        # core scheduler FSM
+        with m.FSM(name="scheduler") as fsm:
+            m.d.comb += self.scheduler_idle.eq(fsm.ongoing("IDLE"))
+            with m.State("IDLE"):
+                with m.If(self.start):
+                    m.d.sync += [
+                        current_x.eq(tile_cx),
+                        current_y.eq(tile_cy),
+                        current_pixel_x.eq(tile_x),
+                        current_pixel_y.eq(tile_y),
+                        left_x.eq(tile_cx),
+                        left_pixel_x.eq(tile_x),
+                        right_pixel_x.eq(tile_x + self.no_pixels_x),
+                        # a frame stops right before its last pixel,
+                        # a tile right after its last row
+                        stop_pixel_x.eq(Mux(self.tile, tile_x, self.no_pixels_x)),
+                        stop_pixel_y.eq(Mux(self.tile, tile_y + self.no_pixels_y + 1, self.no_pixels_y)),
+                        self.saved_iterations.eq(0),
+                        # the narrow cores need a few guard bits below the step
+                        narrow_frame.eq(self.step >= (1 << (narrow_shift + self._narrow_guard_bits))),
+                        dispatch_valid.eq(0),
+                        subdividing.eq(self.subdivide),
+                    ]
+                    m.next = "DISPATCH"
+                    if queued:
+                        # the results of the last frame are still coming in
+                        m.d.sync += [
+                            frame_corner_x.eq(self.bottom_left_corner_x),
+                            frame_corner_y.eq(self.bottom_left_corner_y),
+                            frame_step.eq(self.step),
+                            frame_max_iterations.eq(self.max_iterations),
+                            self.frame_id.eq(self.frame_id + 1),
+                        ]
+                    elif not raster:
+                        # with raster_order, every pixel, which has been given out, has its place in the stream
+                        m.d.comb += [
+                            Cat(collect).eq(2**no_sources - 1),
+                            flush_results.eq(1),
+                        ]
+                    if supersampled:
+                        m.d.sync += [
+                            sample_level.eq(self.supersample),
+                            sample_last.eq((Const(1, len(sample_last) + 1) << self.supersample) - 1),
+                            sample_step.eq(self.step >> self.supersample),
+                            sub_x.eq(0),
+                            sub_y.eq(0),
+                            offset_x.eq(0),
+                            offset_y.eq(0),
+                            # the samples are closer together than the pixels
+                            narrow_frame.eq((self.step >> self.supersample)
+                                            >= (1 << (narrow_shift + self._narrow_guard_bits))),
+                        ]
+                    if interlaced:
+                        # a frame stops right before its last pixel, so only a tile is interlaced
+                        m.d.sync += start_scan(Mux(self.tile, self.interlace, 0), tile_y, tile_cy,
+                                               tile_y + self.no_pixels_y, self.step)
+                    if subdivide:
+                        with m.If(self.subdivide):
+                            # the ring of the whole frame is not known
+                            m.d.sync += [
+                                work.x0.eq(tile_x),
+                                work.y0.eq(tile_y),
+                                work.x1.eq(tile_x + self.no_pixels_x),
+                                work.y1.eq(tile_y + self.no_pixels_y),
+                                *[segment.eq(Cat(Const(0, 1), Const(1, 1), Const(0, 32))) for segment in ring],
+                                stack_pointer.eq(0),
+                            ]
+                            m.next = "DECIDE"
+                if self._resumable:
+                    with m.Elif(self.resume_valid):
+                        m.d.comb += self.resume_ready.eq(1)
+                        m.d.sync += [
+                            current_x.eq(pixel_coordinate(self.bottom_left_corner_x, self.resume_pixel_x)),
+                            current_y.eq(pixel_coordinate(self.bottom_left_corner_y, self.resume_pixel_y)),
+                            current_pixel_x.eq(self.resume_pixel_x),
+                            current_pixel_y.eq(self.resume_pixel_y),
+                            resume_x.eq(self.resume_x),
+                            resume_y.eq(self.resume_y),
+                            resume_iteration.eq(self.resume_iteration),
+                            resuming.eq(1),
+                        ]
+                        m.next = "SINGLE"
+
+                with m.Elif(self.list_valid):
+                    m.d.comb += self.list_ready.eq(1)
+                    m.d.sync += [
+                        current_x.eq(pixel_coordinate(self.bottom_left_corner_x, self.list_pixel_x)),
+                        current_y.eq(pixel_coordinate(self.bottom_left_corner_y, self.list_pixel_y)),
+                        current_pixel_x.eq(self.list_pixel_x),
+                        current_pixel_y.eq(self.list_pixel_y),
+                        narrow_frame.eq(self.step >= (1 << (narrow_shift + self._narrow_guard_bits))),
+                        resuming.eq(0),
+                    ]
+                    if supersampled:
+                        # a pixel of the list is a single sample, which needs no slot
+                        m.d.sync += [
+                            sample_level.eq(0),
+                            sample_last.eq(0),
+                        ]
+                    m.next = "SINGLE"
+
+                if self._orbit_trace:
+                    with m.Elif(self.orbit_start):
+                        m.next = "ORBIT"
+
+            with m.State("DISPATCH"):
+                with m.If(dispatch_advance):
+                    m.d.comb += dispatch_feed.eq(dispatch_pixel)
+                    with m.If(pixels_left):
+                        if chunked:
+                            next_chunk()
+                        elif supersampled:
+                            next_sample()
+                        else:
+                            next_pixel()
+                    if dispatch_stages:
+                        m.d.sync += [
+                            dispatch_valid.eq(Cat(dispatch_pixel, dispatch_valid[:-1])),
+                            dispatch_x[0].eq(sample_x),
+                            dispatch_y[0].eq(sample_y),
+                            dispatch_tag[0].eq(pixel_tag(current_pixel_x, current_pixel_y)),
+                            *[dispatch_x[n].eq(dispatch_x[n - 1]) for n in range(1, dispatch_stages)],
+                            *[dispatch_y[n].eq(dispatch_y[n - 1]) for n in range(1, dispatch_stages)],
+                            *[dispatch_tag[n].eq(dispatch_tag[n - 1]) for n in range(1, dispatch_stages)],
+                        ]
+
+                with m.If(dispatch_accept & dispatch_inside):
+                    m.d.sync += [
+                        interior_found.eq(1),
+                        interior_tag.eq(launch_tag(out_tag)),
+                    ]
+                    if queued:
+                        m.d.sync += interior_limit.eq(frame_max_iterations)
+                with m.Elif(dispatch_accept):
+                    # the core takes its coordinates with the start in the next clock
+                    m.d.comb += next_core_taken.eq(1)
+                    m.d.sync += [
+                        xs[next_core].eq(out_x),
+                        ys[next_core].eq(out_y),
+                        tags[next_core].eq(launch_tag(out_tag)),
+                    ]
+                    if chunked:
+                        m.d.sync += chunk_left[next_core].eq(chunk_pixels)
+                    else:
+                        m.d.sync += launch.eq(1 << next_core)
+                    if queued:
+                        m.d.sync += limits[next_core].eq(frame_max_iterations)
+                if raster:
+                    with m.If(dispatch_accept):
+                        m.d.sync += sequence.eq(sequence + 1)
+                if supersampled:
+                    with m.If(dispatch_accept & out_tag[32]):
+                        m.d.sync += claim_slot()
+
+                with m.If(~pixels_left & (dispatch_valid == 0)):
                     m.d.sync += [
-                        current_x.eq(self.bottom_left_corner_x),
                         current_pixel_x.eq(0),
-                        current_y.eq(current_y + self.step),
-                        current_pixel_y.eq(current_pixel_y + 1),
+                        current_pixel_y.eq(0),
+                    ]
+                    if subdivide:
+                        with m.If(splitting):
+                            m.next = "SPLIT"
+                        with m.Elif(subdividing):
+                            m.next = "POP"
+                        with m.Else():
+                            m.d.comb += self.frame_done.eq(1)
+                            m.next = "IDLE"
+                    else:
+                        m.d.comb += self.frame_done.eq(1)
+                        m.next = "IDLE"
+
+            if subdivide:
+                with m.State("DECIDE"):
+                    with m.If(ring_uniform):
+                        # one filled rectangle at a time waits to be collected
+                        with m.If(~fill_found):
+                            m.d.sync += [
+                                fill_found.eq(1),
+                                fill_value.eq(ring_value),
+                                fill_rect.eq(Cat(work.x0, work.y0, work.x1, work.y1)),
+                            ]
+                            m.next = "POP"
+                    with m.Else():
+                        m.d.sync += [
+                            current_x.eq(origin_cx),
+                            current_y.eq(origin_cy),
+                            current_pixel_x.eq(origin_x),
+                            current_pixel_y.eq(origin_y),
+                            left_x.eq(origin_cx),
+                            left_pixel_x.eq(origin_x),
+                            right_pixel_x.eq(Mux(~small & wide, mid_x, work.x1)),
+                            stop_pixel_x.eq(origin_x),
+                            stop_pixel_y.eq(Mux(~small & ~wide, mid_y, work.y1) + 1),
+                            dispatch_valid.eq(0),
+                            splitting.eq(~small),
+                            line_vertical.eq(wide),
+                            line_position.eq(Mux(wide, mid_x, mid_y)),
+                            line_first.eq(Mux(wide, work.y0, work.x0)),
+                            line_last.eq(Mux(wide, work.y1, work.x1)),
+                            line_left.eq(Mux(wide, work.y1 - work.y0, work.x1 - work.x0) + 1),
+                            line.eq(0),
+                        ]
+                        if interlaced:
+                            m.d.sync += start_scan(0, origin_y, origin_cy, 0, frame_step)
+                        m.next = "DISPATCH"
+
+                # once all the results of the line are in, the second half
+                # goes onto the stack and the first one is next
+                with m.State("SPLIT"):
+                    with m.If(line_left == 0):
+                        m.d.comb += stack_write.en.eq(1)
+                        m.d.sync += [
+                            stack_pointer.eq(stack_pointer + 1),
+                            splitting.eq(0),
+                        ]
+                        with m.If(wide):
+                            m.d.comb += second.eq(Cat((mid_x + 1)[:16], work.y0, work.x1, work.y1,
+                                                      *half(work.bottom, 1), *half(work.top, 1), line, work.right))
+                            m.d.sync += work.eq(Cat(work.x0, work.y0, (mid_x - 1)[:16], work.y1,
+                                                    *half(work.bottom, 0), *half(work.top, 0), work.left, line))
+                        with m.Else():
+                            m.d.comb += second.eq(Cat(work.x0, (mid_y + 1)[:16], work.x1, work.y1,
+                                                      line, work.top, *half(work.left, 1), *half(work.right, 1)))
+                            m.d.sync += work.eq(Cat(work.x0, work.y0, work.x1, (mid_y - 1)[:16],
+                                                    work.bottom, line, *half(work.left, 0), *half(work.right, 0)))
+                        m.next = "DECIDE"
+
+                with m.State("POP"):
+                    with m.If(stack_pointer == 0):
+                        # the frame is done, once its last filled rectangle has been taken
+                        with m.If(~fill_found):
+                            m.d.comb += self.frame_done.eq(1)
+                            m.next = "IDLE"
+                    with m.Else():
+                        m.d.comb += stack_read.addr.eq(stack_pointer - 1)
+                        m.d.sync += stack_pointer.eq(stack_pointer - 1)
+                        m.next = "LOAD"
+
+                # the entry appears one clock after its address
+                with m.State("LOAD"):
+                    m.d.sync += work.eq(stack_read.data)
+                    m.next = "DECIDE"
+
+            # a single pixel goes to the next idle core,
+            # then the scheduler waits for the next one in IDLE
+            with m.State("SINGLE"):
+                with m.If(next_core_ready & room):
+                    m.d.comb += next_core_taken.eq(1)
+                    m.d.sync += [
+                        current_core.eq(next_core),
+                        xs[next_core].eq(current_x),
+                        ys[next_core].eq(current_y),
+                        tags[next_core].eq(launch_tag(pixel_tag(current_pixel_x, current_pixel_y))),
                     ]
+                    if raster:
+                        m.d.sync += sequence.eq(sequence + 1)
+                    if queued:
+                        # the pixels of a pixel list or a continue command run up to its max_iterations
+                        m.d.sync += limits[next_core].eq(self.max_iterations)
+                    if chunked:
+                        # a chunk of one pixel
+                        m.d.sync += chunk_left[next_core].eq(1)
+                        m.next = "IDLE"
+                    else:
+                        m.next = "SINGLE_TRIGGER"
+
+            with m.State("SINGLE_TRIGGER"):
+                m.d.comb += [
+                    start[current_core].eq(1),
+                    resume_start.eq(resuming),
+                ]
+                m.next = "IDLE"
 
-                m.next = "TRIGGER"
+            if self._orbit_trace:
+                # like a resumed pixel, the orbit goes to the next idle core
+                with m.State("ORBIT"):
+                    with m.If(next_core_ready):
+                        m.d.comb += next_core_taken.eq(1)
+                        m.d.sync += [
+                            current_core.eq(next_core),
+                            xs[next_core].eq(self.bottom_left_corner_x),
+                            ys[next_core].eq(self.bottom_left_corner_y),
+                            tags[next_core].eq(orbit_tag),
+                        ]
+                        m.next = "ORBIT_TRIGGER"
 
-            with m.State("TRIGGER"):
-                m.d.comb += start[current_core].eq(1)
-                m.next = "PICK"
+                with m.State("ORBIT_TRIGGER"):
+                    m.d.comb += [
+                        start[current_core].eq(1),
+                        orbit_trigger.eq(1),
+                    ]
+                    m.next = "IDLE"
 
         m.d.comb += [
             self.result_x_out.eq(self.result_pixel_x),
             self.result_y_out.eq(self.result_pixel_y),
         ]
 
-        # result collector FSM
-        with m.FSM(name="result_collector") as fsm:
-            with m.State("WAIT"):
-                m.d.comb += self.result_valid.eq(0)
-                with m.If(next_result_ready):
-                    m.d.sync += current_result.eq(next_result)
-                    m.next = "COLLECT"
+        if self._buddhabrot or self._orbit_trace:
+            # one orbit point at a time is taken, the cores wait until theirs is
+            next_trace       = Signal(range(no_cores))
+            next_trace_ready = Signal()
+            m.submodules.trace_scheduler = trace_scheduler = PriorityEncoder(no_cores)
+            m.d.comb += [
+                trace_scheduler.i.eq(Cat(trace_valid)),
+                next_trace.eq(trace_scheduler.o),
+                next_trace_ready.eq(~trace_scheduler.n),
+            ]
 
-            with m.State("COLLECT"):
-                m.d.comb += [
-                    self.result_iterations.eq(iterations [current_result]),
-                    self.result_maxed     .eq(maxed      [current_result]),
-                    self.result_escape    .eq(escape     [current_result]),
-                    self.result_pixel_x   .eq(pixel_x    [current_result]),
-                    self.result_pixel_y   .eq(pixel_y    [current_result]),
-                    self.result_valid.eq(1),
-                    collect[current_result].eq(1)
+        if self._orbit_trace:
+            m.d.comb += [
+                self.trace_valid.eq(next_trace_ready),
+                self.trace_x.eq(trace_x[next_trace]),
+                self.trace_y.eq(trace_y[next_trace]),
+                trace_ready[next_trace].eq(self.trace_ready),
+            ]
+
+        if self._buddhabrot:
+            width_bits  = (self._histogram_width  - 1).bit_length()
+            height_bits = (self._histogram_height - 1).bit_length()
+            histogram = Memory(width=self._histogram_bits, depth=self._histogram_width * self._histogram_height)
+            m.submodules.histogram_read  = histogram_read  = histogram.read_port(transparent=False)
+            m.submodules.histogram_write = histogram_write = histogram.write_port()
+
+            bin_x         = Signal(signed(bitwidth + 1))
+            bin_y         = Signal(signed(bitwidth + 1))
+            in_histogram  = Signal()
+            count_address = Signal.like(self.histogram_address)
+            m.d.comb += [
+                bin_x.eq((trace_x[next_trace] - self.bottom_left_corner_x) >> self.histogram_shift),
+                bin_y.eq((trace_y[next_trace] - self.bottom_left_corner_y) >> self.histogram_shift),
+                in_histogram.eq(  (bin_x >= 0) & (bin_x < self._histogram_width)
+                                & (bin_y >= 0) & (bin_y < self._histogram_height)),
+                self.histogram_data.eq(histogram_read.data),
+            ]
+
+            with m.FSM(name="histogram") as fsm:
+                m.d.comb += self.histogram_busy.eq(next_trace_ready | ~fsm.ongoing("IDLE"))
+                with m.State("IDLE"):
+                    m.d.comb += histogram_read.addr.eq(self.histogram_address)
+                    with m.If(self.histogram_clear):
+                        m.d.comb += [
+                            histogram_write.addr.eq(self.histogram_address),
+                            histogram_write.data.eq(0),
+                            histogram_write.en.eq(1),
+                        ]
+                    with m.Elif(next_trace_ready):
+                        m.d.comb += trace_ready[next_trace].eq(1)
+                        # points outside of the histogram are dropped
+                        with m.If(in_histogram):
+                            m.d.comb += histogram_read.addr.eq(Cat(bin_x[:width_bits], bin_y[:height_bits]))
+                            m.d.sync += count_address.eq(Cat(bin_x[:width_bits], bin_y[:height_bits]))
+                            m.next = "COUNT"
+
+                with m.State("COUNT"):
+                    # the counts saturate
+                    m.d.comb += [
+                        histogram_write.addr.eq(count_address),
+                        histogram_write.data.eq(histogram_read.data + 1),
+                        histogram_write.en.eq(histogram_read.data != 2**self._histogram_bits - 1),
+                    ]
+                    m.next = "IDLE"
+
+        # result collector: one result per clock goes from the cores into the
+        # result FIFO, so the cores never wait for the results to be sent
+        result_layout = [
+            ("iterations", 32),
+            ("pixel_x",    16),
+            ("pixel_y",    16),
+            ("escape",      1),
+            ("maxed",       1),
+            ("glitch",      1),
+            ("interior",    1),
+            ("orbit",       1),
+        ]
+        if self._resumable:
+            result_layout += [("zx", bitwidth), ("zy", bitwidth)]
+        if self._distance_estimate:
+            result_layout += [("distance", 16)]
+        if subdivide:
+            result_layout += [("fill", 1), ("fill_x", 16), ("fill_y", 16)]
+        if queued:
+            result_layout += [("frame", len(self.frame_id))]
+        if supersampled:
+            result_layout += [("maxed_samples", 8)]
+
+        collected = Record(result_layout, name="collected")
+        sent      = Record(result_layout, name="sent")
+        m.submodules.result_fifo = result_fifo = SyncFIFOBuffered(width=len(collected), depth=self._result_fifo_depth)
+
+        m.d.comb += [
+            collected.iterations .eq(input_iterations [next_result]),
+            collected.pixel_x    .eq(input_result_tag [next_result][:16]),
+            collected.pixel_y    .eq(input_result_tag [next_result][16:32]),
+            collected.escape     .eq(input_escape     [next_result]),
+            collected.maxed      .eq(input_maxed      [next_result]),
+            collected.glitch     .eq(input_glitch     [next_result]),
+            collected.interior   .eq((next_result == first_other) if self._interior_check else 0),
+            collected.orbit      .eq(input_result_tag [next_result][:32] == orbit_tag),
+        ]
+        if self._resumable:
+            m.d.comb += [
+                collected.zx .eq(input_zx [next_result]),
+                collected.zy .eq(input_zy [next_result]),
+            ]
+        if self._distance_estimate:
+            m.d.comb += collected.distance.eq(input_distance[next_result])
+        if queued:
+            m.d.comb += collected.frame.eq(input_result_tag[next_result][32:])
+        if subdivide:
+            m.d.comb += [
+                collected.fill   .eq(next_result == first_other + fill_source - no_cores),
+                collected.fill_x .eq(fill_rect.x1),
+                collected.fill_y .eq(fill_rect.y1),
+            ]
+
+            # the results on the line of the rectangle, which is being split,
+            # go into the segments, which they are part of
+            along_line = Signal(16)
+            across     = Signal(16)
+            on_line    = Signal()
+            this_frame = (collected.frame == self.frame_id) if queued else Const(1)
+            position   = Cat(along_line, Const(0, 1)).as_signed()
+            m.d.comb += [
+                along_line.eq(Mux(line_vertical, collected.pixel_y, collected.pixel_x)),
+                across.eq(Mux(line_vertical, collected.pixel_x, collected.pixel_y)),
+                on_line.eq(splitting & this_frame & (across == line_position) & ~collected.fill
+                           & (along_line >= line_first) & (along_line <= line_last)),
+            ]
+
+        if supersampled:
+            # the result of a sample is added to the slot of its pixel, the result of its last sample
+            # goes on as the result of the pixel, the slot is then cleared for the next pixel
+            sum_bits     = 32 + 2 * self._supersample_levels
+            slot_sum     = Array([Signal(sum_bits, name=f"slot_sum_{n}") for n in range(self._supersample_depth)])
+            slot_maxed   = Array([Signal(8, name=f"slot_maxed_{n}")     for n in range(self._supersample_depth)])
+            slot_samples = Array([Signal(8, name=f"slot_samples_{n}")   for n in range(self._supersample_depth)])
+            result_slot  = Signal(slot_bits)
+            # twice the levels of the pixel, the number of samples is a power of four
+            sample_shift = Signal(len(sample_level) + 1)
+            in_slot      = Signal()
+            sum_in       = Signal(sum_bits)
+            maxed_in     = Signal(8)
+            samples_in   = Signal(8)
+            last_sample  = Signal()
+            m.d.comb += [
+                result_slot.eq(input_result_tag[next_result][32:32 + slot_bits]),
+                sample_shift.eq(Cat(Const(0, 1), input_result_tag[next_result][32 + slot_bits:])),
+                in_slot.eq(sample_shift != 0),
+                sum_in.eq(Mux(in_slot, slot_sum[result_slot], 0) + input_iterations[next_result]),
+                maxed_in.eq(Mux(in_slot, slot_maxed[result_slot], 0) + input_maxed[next_result]),
+                samples_in.eq(Mux(in_slot, slot_samples[result_slot], 0) + 1),
+                last_sample.eq(samples_in == (Const(1, 8) << sample_shift)),
+                collected.iterations.eq(sum_in >> sample_shift),
+                collected.maxed.eq(maxed_in == samples_in),
+                collected.maxed_samples.eq(maxed_in),
+            ]
+
+        if raster:
+            # the collector puts the result at the place of its pixel, the results
+            # go on into the result FIFO in the order of the pixels
+            reorder = Memory(width=len(collected), depth=self._reorder_depth)
+            m.submodules.reorder_write = reorder_write = reorder.write_port()
+            m.submodules.reorder_read  = reorder_read  = reorder.read_port(domain="comb")
+            filled = Array([Signal(name=f"filled_{n}") for n in range(self._reorder_depth)])
+            m.d.comb += [
+                reorder_write.addr.eq(input_result_tag[next_result][32:32 + index_bits]),
+                reorder_write.data.eq(collected),
+                reorder_read.addr.eq(emitted[:index_bits]),
+                result_fifo.w_data.eq(reorder_read.data),
+            ]
+            with m.If(filled[emitted[:index_bits]] & result_fifo.w_rdy):
+                m.d.comb += result_fifo.w_en.eq(1)
+                m.d.sync += [
+                    filled[emitted[:index_bits]].eq(0),
+                    emitted.eq(emitted + 1),
                 ]
-                m.next = "WAIT"
+            # the dispatcher never has more pixels out than there are places
+            collector_ready = Const(1)
+        else:
+            m.d.comb += result_fifo.w_data.eq(collected)
+            collector_ready = result_fifo.w_rdy
+
+        with m.If(next_result_ready & collector_ready):
+            m.d.comb += [
+                input_collect[next_result].eq(1),
+                next_result_taken.eq(1),
+            ]
+            if raster:
+                m.d.comb += reorder_write.en.eq(1)
+                m.d.sync += filled[input_result_tag[next_result][32:32 + index_bits]].eq(1)
+            elif supersampled:
+                with m.If(last_sample):
+                    m.d.comb += result_fifo.w_en.eq(1)
+                with m.If(last_sample & in_slot):
+                    m.d.sync += [
+                        slot_sum[result_slot].eq(0),
+                        slot_maxed[result_slot].eq(0),
+                        slot_samples[result_slot].eq(0),
+                        slot_busy[result_slot].eq(0),
+                    ]
+                with m.Elif(in_slot):
+                    m.d.sync += [
+                        slot_sum[result_slot].eq(sum_in),
+                        slot_maxed[result_slot].eq(maxed_in),
+                        slot_samples[result_slot].eq(samples_in),
+                    ]
+            else:
+                m.d.comb += result_fifo.w_en.eq(1)
+            m.d.sync += self.saved_iterations.eq(self.saved_iterations + input_saved[next_result])
+
+            if subdivide:
+                with m.If(on_line):
+                    m.d.sync += line_left.eq(line_left - 1)
+                    for low, high, segment in zip(segment_low, segment_high, segments_of(line)):
+                        with m.If((position >= low) & (position <= high)):
+                            with m.If(~segment.seen):
+                                m.d.sync += [
+                                    segment.seen.eq(1),
+                                    segment.value.eq(collected.iterations),
+                                ]
+                            with m.Elif(segment.value != collected.iterations):
+                                m.d.sync += segment.mixed.eq(1)
+
+        if supersampled:
+            with m.If(flush_results):
+                m.d.sync += [signal.eq(0) for slot in (slot_sum, slot_maxed, slot_samples, slot_busy)
+                                          for signal in slot]
+
+        m.d.comb += [
+            sent.eq(result_fifo.r_data),
+            self.result_iterations .eq(sent.iterations),
+            self.result_pixel_x    .eq(sent.pixel_x),
+            self.result_pixel_y    .eq(sent.pixel_y),
+            self.result_escape     .eq(sent.escape),
+            self.result_maxed      .eq(sent.maxed),
+            self.result_glitch     .eq(sent.glitch),
+            self.result_interior   .eq(sent.interior),
+            self.result_orbit      .eq(sent.orbit),
+            # the consumer takes a result, while it shows result_ready
+            self.result_waiting    .eq(result_fifo.r_rdy),
+            self.result_valid      .eq(result_fifo.r_rdy & self.result_ready),
+            result_fifo.r_en       .eq(self.result_valid),
+        ]
+        if self._resumable:
+            m.d.comb += [
+                self.result_zx .eq(sent.zx),
+                self.result_zy .eq(sent.zy),
+            ]
+        if self._distance_estimate:
+            m.d.comb += self.result_distance.eq(sent.distance)
+        if subdivide:
+            m.d.comb += [
+                self.result_fill   .eq(sent.fill),
+                self.result_fill_x .eq(sent.fill_x),
+                self.result_fill_y .eq(sent.fill_y),
+            ]
+        if queued:
+            m.d.comb += self.result_frame.eq(sent.frame)
+        if supersampled:
+            m.d.comb += self.result_maxed_samples.eq(sent.maxed_samples)
+
+        # the cores are not busy anymore, once their results have been collected,
+        # but those still wait in the result FIFO and the stages before it
+        pending = [result_fifo.r_rdy, Cat(input_done).any()]
+        if raster:
+            pending.append(Cat(filled).any())
+        if supersampled:
+            pending.append(Cat(slot_busy).any())
+        m.d.comb += self.results_pending.eq(Cat(pending).any())
 
         return m
 
 class FractalManagerStream(Elaboratable):
-    def __init__(self, *, bitwidth, fraction_bits, no_cores, test=False):
-        # Parameters
-        assert bitwidth % 8 == 0, "bitwidth must be a multiple of 8"
-        self._bitwidth = bitwidth
-        self._no_cores = no_cores
-        self._fraction_bits = fraction_bits
-        self._test = test
+    def __init__(self, *, run_length=False, **kwargs):
+        # Parameters, all but run_length are those of the core, which checks them
+        manager = FractalManagerCore(**kwargs)
+        if run_length:
+            assert not (manager._perturbation or manager._resumable or manager._distance_estimate), \
+                "a run has nothing but an iteration count"
+            assert not (manager._buddhabrot or manager._orbit_trace), \
+                "the results of the frame are the only ones, which go out"
+            assert not manager._raster_order, "the pixels have no coordinates, which a run could start at"
+            assert not manager._supersample_levels, \
+                "the pixels of a run are equal, a supersampled pixel has its maxed samples besides"
+        self._manager = manager
+        self._run_length = run_length
 
         # I/O
         self.command_stream_in  = StreamInterface(name="command_stream")
         self.pixel_stream_out   = StreamInterface(name="pixel_stream")
-        self.busy_out           = Signal(no_cores)
+        self.busy_out           = Signal(manager._no_cores)
 
         self.result_x_out = Signal(16)
         self.result_y_out = Signal(16)
 
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
-        bitwidth  = self._bitwidth
+        manager   = self._manager
+        bitwidth  = manager._bitwidth
         bytewidth = bitwidth // 8
         stream_in = self.command_stream_in
-        no_cores = self._no_cores
+        no_cores = manager._no_cores
         pixel_out = self.pixel_stream_out
 
-        manager = FractalManagerCore(
-            bitwidth=self._bitwidth,
-            fraction_bits=self._fraction_bits,
-            no_cores=self._no_cores,
-            test=self._test)
 
         m.submodules.fractal_manager = manager
 
@@ -231,10 +1605,217 @@ class FractalManagerStream(Elaboratable):
         command_complete = Signal()
 
         ready = Signal()
-        m.d.comb += stream_in.ready.eq(ready)
+        # commands wait, until the current frame has been scheduled,
+        # with queue_frames only until it has been started
+        m.d.comb += stream_in.ready.eq(ready & ~command_complete)
+        queued = manager._queue_frames
+
+        multi_limb      = manager._limb_width is not None
+        perturbation    = manager._perturbation
+        buddhabrot      = manager._buddhabrot
+        # in perturbation mode the exponent follows max_iterations,
+        # in buddhabrot mode the histogram shift
+        header_bytes    = 9 if perturbation or buddhabrot else 8
+        limb_bytes      = (manager._limb_width or 0) // 8
+        coordinates     = [manager.bottom_left_corner_x, manager.bottom_left_corner_y, manager.step]
+        coordinate      = Signal(range(len(coordinates) + 1))
+        coordinate_byte = Signal(16)
+
+        # a command with no_pixels_x = 0xfffc traces the orbit of the corner,
+        # the step is not used, the points come back as x and y,
+        # each followed by 0xa8, then the iterations, escape and maxed
+        # of the point, padded to the size of a point and followed by 0xa9
+        orbit_trace   = manager._orbit_trace
+        orbit_command = Signal()
+        orbit_point   = Signal(2 * bitwidth)
+        orbit_marker  = Signal(8)
+
+        def end_of_command():
+            m.d.sync += [
+                bytepos.eq(0),
+                orbit_command.eq(0),
+            ]
+            with m.If((stream_in.payload == 0xa5) & orbit_command):
+                m.d.comb += manager.orbit_start.eq(1)
+            with m.Elif(stream_in.payload == 0xa5):
+                m.d.sync += [
+                    command_complete.eq(1),
+                ]
+                if not queued:
+                    m.d.comb += manager.start.eq(1)
+            with m.Else():
+                m.d.sync += [
+                    tiling.eq(0),
+                    subdividing.eq(0),
+                    interlacing.eq(0),
+                    supersampling.eq(0),
+                    manager.bottom_left_corner_x.eq(0),
+                    manager.bottom_left_corner_y.eq(0),
+                    manager.step.eq(1),
+                    manager.max_iterations.eq(64),
+                ]
+
+        # a command with no_pixels_x = 0xffff uploads a reference orbit,
+        # no_pixels_y holds its length, the entries follow as x and y
+        uploading   = Signal()
+        orbit_entry = Signal(2 * bitwidth)
+        orbit_byte  = Signal(range(2 * bytewidth))
+
+        # a command with no_pixels_x = 0xfffe continues maxed pixels of the last frame
+        # with the new max_iterations, no_pixels_y holds the number of pixels,
+        # each one is sent as pixel x and y, iteration, x and y of its final z
+        resumable      = manager._resumable
+        continuing     = Signal()
+        resume_entry   = Signal(64 + 2 * bitwidth)
+        resume_bytes   = len(resume_entry) // 8
+        resume_byte    = Signal(range(resume_bytes))
+        resume_count   = Signal(16)
+        resume_pending = Signal()
+
+        m.d.comb += [
+            manager.resume_valid.eq(resume_pending),
+            manager.resume_pixel_x.eq(resume_entry[0:16]),
+            manager.resume_pixel_y.eq(resume_entry[16:32]),
+            manager.resume_iteration.eq(resume_entry[32:64]),
+            manager.resume_x.eq(resume_entry[64:64 + bitwidth]),
+            manager.resume_y.eq(resume_entry[64 + bitwidth:]),
+        ]
+        with m.If(manager.resume_ready):
+            m.d.sync += resume_pending.eq(0)
+
+        # a command with no_pixels_x = 0xfffb renders a tile of the frame, its
+        # pixel x and y offset and its no_pixels_x and no_pixels_y follow the coordinates
+        tiling       = Signal()
+        tile_fields  = [manager.tile_x, manager.tile_y, manager.no_pixels_x, manager.no_pixels_y]
+
+        # a command with no_pixels_x = 0xfff9 is a tile, which is subdivided into rectangles,
+        # a filled rectangle comes back as its bottom left and its top right pixel,
+        # each followed by 0xaa
+        subdivide    = manager._subdivide
+        subdividing  = Signal()
+
+        # a command with no_pixels_x = 0xfff8 is a tile, which is scanned interlaced,
+        # the number of passes after the first one follows the tile fields
+        interlaced   = manager._interlace_levels > 0
+        interlacing  = Signal()
+        scan_passes  = Signal.like(manager.interlace)
+
+        # a command with no_pixels_x = 0xfff7 is a tile of supersampled pixels, the levels
+        # follow the tile fields, a pixel has 2^levels by 2^levels samples and comes back
+        # with the number of its maxed samples in front of the separator
+        supersampled  = manager._supersample_levels > 0
+        supersampling = Signal()
+        sample_levels = Signal.like(manager.supersample)
+
+        # a command with no_pixels_x = 0xfffa computes a list of pixels of the frame,
+        # no_pixels_y holds their number, each one follows the coordinates as pixel x and y
+        listing      = Signal()
+        list_entry   = Signal(32)
+        list_byte    = Signal(range(4))
+        list_count   = Signal(16)
+        list_pending = Signal()
+        list_start   = header_bytes + 3 * bytewidth
+
+        m.d.comb += [
+            manager.tile.eq(tiling),
+            manager.subdivide.eq(subdividing),
+            manager.interlace.eq(Mux(interlacing, scan_passes, 0)),
+            manager.supersample.eq(Mux(supersampling, sample_levels, 0)),
+            manager.list_valid.eq(list_pending),
+            manager.list_pixel_x.eq(list_entry[0:16]),
+            manager.list_pixel_y.eq(list_entry[16:32]),
+        ]
+        with m.If(manager.list_ready):
+            m.d.sync += list_pending.eq(0)
+
+        # a command with no_pixels_x = 0xfffd and no_pixels_y = 0 sends the
+        # buddhabrot histogram, once the cores are done, and clears it
+        dumping         = Signal()
+        dump_address    = Signal.like(manager.histogram_address)
+        histogram_bytes = manager._histogram_bits // 8
+        dump_byte       = Signal(range(histogram_bytes))
+
+        # the kind of the command holds until it has been started
+        with m.If(manager.start):
+            m.d.sync += [
+                tiling.eq(0),
+                subdividing.eq(0),
+                interlacing.eq(0),
+                supersampling.eq(0),
+            ]
+
+        if queued:
+            # the command starts, once the scheduler is done with the last frame,
+            # then the next one can come in, while the cores are still busy
+            m.d.comb += manager.start.eq(command_complete & manager.scheduler_idle)
+            with m.If(manager.start):
+                m.d.sync += command_complete.eq(0)
+        else:
+            # the next command can come in, once the frame has been scheduled
+            with m.If(manager.frame_done):
+                m.d.sync += command_complete.eq(0)
 
         # read command
-        with m.If(stream_in.valid & ready & ~command_complete):
+        with m.If(stream_in.valid & ready & ~command_complete & uploading):
+            with m.If(manager.orbit_write_address == manager.no_pixels_y):
+                m.d.sync += [
+                    uploading.eq(0),
+                    bytepos.eq(0),
+                    manager.orbit_length.eq(Mux(stream_in.payload == 0xa5, manager.no_pixels_y, 0)),
+                ]
+            with m.Else():
+                m.d.sync += [
+                    orbit_entry.eq(Cat(orbit_entry[8:], stream_in.payload)),
+                    orbit_byte.eq(orbit_byte + 1),
+                ]
+                with m.If(orbit_byte == 2 * bytewidth - 1):
+                    m.d.comb += [
+                        manager.orbit_write_data.eq(Cat(orbit_entry[8:], stream_in.payload)),
+                        manager.orbit_write_enable.eq(1),
+                    ]
+                    m.d.sync += [
+                        orbit_byte.eq(0),
+                        manager.orbit_write_address.eq(manager.orbit_write_address + 1),
+                    ]
+
+        # the pixels follow the header of the continue command
+        with m.Elif(stream_in.valid & ready & ~command_complete & continuing & (bytepos == 8)):
+            with m.If(resume_count == manager.no_pixels_y):
+                m.d.sync += [
+                    continuing.eq(0),
+                    bytepos.eq(0),
+                ]
+            with m.Else():
+                m.d.sync += [
+                    resume_entry.eq(Cat(resume_entry[8:], stream_in.payload)),
+                    resume_byte.eq(resume_byte + 1),
+                ]
+                with m.If(resume_byte == resume_bytes - 1):
+                    m.d.sync += [
+                        resume_byte.eq(0),
+                        resume_count.eq(resume_count + 1),
+                        resume_pending.eq(1),
+                    ]
+
+        # the pixels follow the coordinates of the pixel list command
+        with m.Elif(stream_in.valid & ready & ~command_complete & listing & (bytepos == list_start)):
+            with m.If(list_count == manager.no_pixels_y):
+                m.d.sync += [
+                    listing.eq(0),
+                    bytepos.eq(0),
+                ]
+            with m.Else():
+                m.d.sync += [
+                    list_entry.eq(Cat(list_entry[8:], stream_in.payload)),
+                    list_byte.eq(list_byte + 1),
+                ]
+                with m.If(list_byte == 3):
+                    m.d.sync += [
+                        list_count.eq(list_count + 1),
+                        list_pending.eq(1),
+                    ]
+
+        with m.Elif(stream_in.valid & ready & ~command_complete):
             m.d.sync += bytepos.eq(bytepos + 1)
 
             with m.Switch(bytepos):
@@ -247,60 +1828,310 @@ class FractalManagerStream(Elaboratable):
                     m.d.sync += manager.no_pixels_y[:8].eq(stream_in.payload)
                 with m.Case(3):
                     m.d.sync += manager.no_pixels_y[8:].eq(stream_in.payload)
+                    if perturbation:
+                        with m.If(manager.no_pixels_x == 0xffff):
+                            m.d.sync += [
+                                uploading.eq(1),
+                                orbit_byte.eq(0),
+                                manager.orbit_write_address.eq(0),
+                                manager.orbit_length.eq(0),
+                            ]
+                    if buddhabrot:
+                        with m.If(manager.no_pixels_x == 0xfffd):
+                            m.d.sync += [
+                                dumping.eq(1),
+                                bytepos.eq(0),
+                            ]
+                    if not multi_limb:
+                        with m.If(manager.no_pixels_x == 0xfffb):
+                            m.d.sync += tiling.eq(1)
+                        if interlaced:
+                            with m.If(manager.no_pixels_x == 0xfff8):
+                                m.d.sync += [
+                                    tiling.eq(1),
+                                    interlacing.eq(1),
+                                ]
+                        if supersampled:
+                            with m.If(manager.no_pixels_x == 0xfff7):
+                                m.d.sync += [
+                                    tiling.eq(1),
+                                    supersampling.eq(1),
+                                ]
+                        if subdivide:
+                            with m.If(manager.no_pixels_x == 0xfff9):
+                                m.d.sync += [
+                                    tiling.eq(1),
+                                    subdividing.eq(1),
+                                ]
+                        with m.If(manager.no_pixels_x == 0xfffa):
+                            m.d.sync += [
+                                listing.eq(1),
+                                list_byte.eq(0),
+                                list_count.eq(0),
+                            ]
+                    if orbit_trace:
+                        with m.If(manager.no_pixels_x == 0xfffc):
+                            m.d.sync += orbit_command.eq(1)
+                    if resumable:
+                        with m.If(manager.no_pixels_x == 0xfffe):
+                            m.d.sync += [
+                                continuing.eq(1),
+                                resume_byte.eq(0),
+                                resume_count.eq(0),
+                            ]
 
                 for b in range(4):
                     with m.Case(4 + b):
                         m.d.sync += manager.max_iterations[b*8:(b*8+8)].eq(stream_in.payload),
 
-                for b in range(bytewidth):
-                    with m.Case(8 + b):
-                        m.d.sync += manager.bottom_left_corner_x[b*8:(b*8+8)].eq(stream_in.payload),
-
-                for b in range(bytewidth):
-                    with m.Case(8 + bytewidth + b):
-                        m.d.sync += manager.bottom_left_corner_y[b*8:(b*8+8)].eq(stream_in.payload),
+                if perturbation:
+                    with m.Case(8):
+                        m.d.sync += manager.exponent.eq(stream_in.payload)
+
+                if buddhabrot:
+                    with m.Case(8):
+                        m.d.sync += manager.histogram_shift.eq(stream_in.payload)
+
+                if not multi_limb:
+                    for b in range(bytewidth):
+                        with m.Case(header_bytes + b):
+                            m.d.sync += manager.bottom_left_corner_x[b*8:(b*8+8)].eq(stream_in.payload),
+
+                    for b in range(bytewidth):
+                        with m.Case(header_bytes + bytewidth + b):
+                            m.d.sync += manager.bottom_left_corner_y[b*8:(b*8+8)].eq(stream_in.payload),
+
+                    for b in range(bytewidth):
+                        with m.Case(header_bytes + 2*bytewidth + b):
+                            m.d.sync += manager.step[b*8:(b*8+8)].eq(stream_in.payload),
+
+                    for n, field in enumerate(tile_fields):
+                        for b in range(2):
+                            with m.Case(list_start + 2*n + b):
+                                with m.If(tiling):
+                                    m.d.sync += field[b*8:(b*8+8)].eq(stream_in.payload)
+                                with m.Else():
+                                    end_of_command()
+
+                    if interlaced or supersampled:
+                        with m.Case(list_start + 2*len(tile_fields)):
+                            with m.If(interlacing):
+                                m.d.sync += scan_passes.eq(Mux(stream_in.payload > manager._interlace_levels,
+                                                               manager._interlace_levels, stream_in.payload))
+                            with m.Elif(supersampling):
+                                m.d.sync += sample_levels.eq(Mux(stream_in.payload > manager._supersample_levels,
+                                                                 manager._supersample_levels, stream_in.payload))
+                            with m.Else():
+                                end_of_command()
 
-                for b in range(bytewidth):
-                    with m.Case(8 + 2*bytewidth + b):
-                        m.d.sync += manager.step[b*8:(b*8+8)].eq(stream_in.payload),
+                    with m.Default():
+                        end_of_command()
 
-                with m.Default():
-                    m.d.sync += bytepos.eq(0)
-                    with m.If(stream_in.payload == 0xa5):
-                        m.d.sync += [
-                            command_complete.eq(1),
-                        ]
-                        m.d.comb += manager.start.eq(1)
-                    with m.Else():
+                else:
+                    # the coordinates only have as many bytes as the limbs in use,
+                    # they are shifted in from the top, the unused limbs stay zero
+                    with m.Case(8):
                         m.d.sync += [
-                            manager.bottom_left_corner_x.eq(0),
-                            manager.bottom_left_corner_y.eq(0),
-                            manager.step.eq(1),
-                            manager.max_iterations.eq(64),
+                            manager.limbs.eq(stream_in.payload),
+                            coordinate.eq(0),
+                            coordinate_byte.eq(0),
+                            *[c.eq(0) for c in coordinates],
                         ]
 
+                    with m.Default():
+                        with m.If(coordinate < len(coordinates)):
+                            # stay here until all coordinates are in
+                            m.d.sync += [
+                                bytepos.eq(bytepos),
+                                coordinate_byte.eq(coordinate_byte + 1),
+                            ]
+                            with m.Switch(coordinate):
+                                for n, c in enumerate(coordinates):
+                                    with m.Case(n):
+                                        m.d.sync += c.eq(Cat(c[8:], stream_in.payload))
+                            with m.If(coordinate_byte == manager.limbs * limb_bytes - 1):
+                                m.d.sync += [
+                                    coordinate.eq(coordinate + 1),
+                                    coordinate_byte.eq(0),
+                                ]
+                        with m.Else():
+                            end_of_command()
+
         result_iterations = Signal(32)
         result_pixel_x    = Signal(16)
         result_pixel_y    = Signal(16)
         result_escape     = Signal()
         result_maxed      = Signal()
+        result_glitch     = Signal()
+        result_fill       = Signal()
+        result_fill_x     = Signal(16)
+        result_fill_y     = Signal(16)
+        result_maxed_samples = Signal(8)
+        # log2 of the distance estimate, the pixels, which did not escape are far away
+        result_distance   = Signal(signed(16))
+        distance_bytes    = len(result_distance) // 8 if manager._distance_estimate else 0
+        # iteration and final z, which follow the result of a maxed pixel
+        result_state      = Signal(32 + 2 * bitwidth)
+        state_bytes       = len(result_state) // 8 if resumable else 0
 
         send_byte = Signal(8)
         first_result_sent = Signal()
+        # a result of another frame than the one before is preceded by the id of its frame,
+        # padded to the size of a result and followed by 0xab
+        sent_frame = Signal.like(manager.result_frame)
+
+        # with run_length, results, which continue the row of the one before with the
+        # same value, are merged into a run, which goes out like a filled rectangle
+        run_length  = self._run_length
+        fills       = subdivide or run_length
+        run_pending = Signal()
+        run_x       = Signal(16)
+        run_end     = Signal(16)
+        run_y       = Signal(16)
+        run_value   = Signal(8) # as it is sent, the maxed bit on top of the iterations
+        run_frame   = Signal.like(manager.result_frame)
+        joins       = Signal()
+        result_value = Cat(manager.result_iterations[0:7], manager.result_maxed)
+        m.d.comb += joins.eq(  run_pending & manager.result_waiting & ~manager.result_fill
+                             & (manager.result_pixel_y == run_y)
+                             & (manager.result_pixel_x == (run_end + 1)[:16])
+                             & (result_value == run_value)
+                             & ((manager.result_frame == run_frame) if queued else 1))
+
+        # the last byte is only marked, once no more results can follow it
+        drained = Signal()
+        m.d.comb += drained.eq(  (manager.busy_out == 0) & ~manager.results_pending
+                               & manager.scheduler_idle & ~run_pending)
+
+        # with raster_order, the results come in the order of the pixels,
+        # each one goes out as nothing but its whole iteration count
+        raster = manager._raster_order
+
+        def send_result(frame):
+            m.d.sync += send_byte.eq(0)
+            m.next = "COUNT" if raster else "SEND"
+            if queued:
+                m.d.sync += sent_frame.eq(frame)
+                with m.If(frame != sent_frame):
+                    m.next = "FRAME"
+
+        def send_separator():
+            m.d.sync += first_result_sent.eq(0)
+            # separator, glitched pixels have their own, and so have
+            # maxed pixels, which escaped in their last iteration
+            if resumable:
+                m.d.comb += pixel_out.payload.eq(Mux(result_maxed & result_escape, 0xa7, 0xa5))
+            elif fills:
+                m.d.comb += pixel_out.payload.eq(Mux(result_fill, 0xaa, 0xa5))
+            else:
+                m.d.comb += pixel_out.payload.eq(Mux(result_glitch, 0xa6, 0xa5))
+            # mark last result byte
+            with m.If(drained):
+                m.d.comb += pixel_out.last.eq(1)
+            m.next = "IDLE"
 
         with m.FSM(name="result_transmitter") as fsm:
             with m.State("IDLE"):
-                m.d.comb += ready.eq(~manager.busy_out)
-                with m.If(pixel_out.ready & manager.result_valid):
-                    m.d.sync += [
-                        result_iterations .eq(manager.result_iterations),
-                        result_pixel_x    .eq(manager.result_pixel_x),
-                        result_pixel_y    .eq(manager.result_pixel_y),
-                        result_escape     .eq(manager.result_escape),
-                        result_maxed      .eq(manager.result_maxed),
-                        send_byte         .eq(0),
-                    ]
-                    m.next = "SEND"
+                m.d.comb += manager.result_ready.eq(pixel_out.ready)
+                if queued:
+                    # a frame command comes in alongside the last frame, but not before
+                    # the scheduler has taken the last pixel of a continue or a pixel list
+                    # command, which is placed relative to the corner of its command
+                    m.d.comb += ready.eq(Mux(continuing | listing,
+                                             Mux(continuing, ~resume_pending, ~list_pending) & manager.scheduler_idle,
+                                             ~resume_pending & ~list_pending) & ~dumping)
+                else:
+                    # the pixels of a continue or a pixel list command are taken one by one
+                    m.d.comb += ready.eq(Mux(continuing, ~resume_pending,
+                                             Mux(listing, ~list_pending, manager.busy_out == 0))
+                                         & ~dumping & manager.scheduler_idle)
+                if buddhabrot:
+                    # the histogram is the result, the pixels are dropped
+                    m.d.comb += manager.result_ready.eq(1)
+                    with m.If(dumping & (manager.busy_out == 0) & ~manager.histogram_busy):
+                        m.d.sync += dump_address.eq(0)
+                        m.next = "DUMP"
+                else:
+                    take_result = m.If
+                    if orbit_trace:
+                        # the points of an orbit go out before its result
+                        m.d.comb += manager.result_ready.eq(pixel_out.ready & ~manager.trace_valid)
+                        with m.If(pixel_out.ready & manager.trace_valid):
+                            m.d.comb += manager.trace_ready.eq(1)
+                            m.d.sync += [
+                                orbit_point  .eq(Cat(manager.trace_x, manager.trace_y)),
+                                orbit_marker .eq(0xa8),
+                                send_byte    .eq(0),
+                            ]
+                            m.next = "POINT"
+                        with m.Elif(pixel_out.ready & manager.result_valid & manager.result_orbit):
+                            m.d.sync += [
+                                orbit_point  .eq(Cat(manager.result_iterations,
+                                                     manager.result_escape, manager.result_maxed)),
+                                orbit_marker .eq(0xa9),
+                                send_byte    .eq(0),
+                            ]
+                            m.next = "POINT"
+                        take_result = m.Elif
+
+                    if run_length:
+                        # the run goes out, once a result does not continue it, or once
+                        # the scheduler and the cores have no more pixels, which could
+                        m.d.comb += manager.result_ready.eq(pixel_out.ready & (~run_pending | joins))
+                        with m.If(run_pending & ~joins & (  manager.result_waiting
+                                                          | (manager.scheduler_idle & (manager.busy_out == 0)))):
+                            m.d.sync += [
+                                run_pending       .eq(0),
+                                result_iterations .eq(run_value[:7]),
+                                result_pixel_x    .eq(run_x),
+                                result_pixel_y    .eq(run_y),
+                                result_escape     .eq(~run_value[7]),
+                                result_maxed      .eq(run_value[7]),
+                                result_glitch     .eq(0),
+                                # a single pixel goes out as it is
+                                result_fill       .eq(run_end != run_x),
+                                result_fill_x     .eq(run_end),
+                                result_fill_y     .eq(run_y),
+                            ]
+                            send_result(run_frame)
+                        take_result = m.Elif
+
+                    def take():
+                        m.d.sync += [
+                            result_iterations .eq(manager.result_iterations),
+                            result_pixel_x    .eq(manager.result_pixel_x),
+                            result_pixel_y    .eq(manager.result_pixel_y),
+                            result_escape     .eq(manager.result_escape),
+                            result_maxed      .eq(manager.result_maxed),
+                            result_glitch     .eq(manager.result_glitch),
+                            result_fill       .eq(manager.result_fill),
+                            result_fill_x     .eq(manager.result_fill_x),
+                            result_fill_y     .eq(manager.result_fill_y),
+                            result_maxed_samples.eq(manager.result_maxed_samples),
+                            result_distance   .eq(Mux(manager.result_escape, manager.result_distance, 0x7fff)),
+                            # the interior pixels never escape, so there is nothing to continue
+                            result_state      .eq(Cat(Mux(manager.result_interior, 0xffffffff, manager.result_iterations),
+                                                      manager.result_zx, manager.result_zy)),
+                        ]
+                        send_result(manager.result_frame)
+
+                    with take_result(pixel_out.ready & manager.result_valid):
+                        if run_length:
+                            with m.If(joins):
+                                m.d.sync += run_end.eq(run_end + 1)
+                            with m.Elif(~manager.result_fill):
+                                m.d.sync += [
+                                    run_pending .eq(1),
+                                    run_x       .eq(manager.result_pixel_x),
+                                    run_end     .eq(manager.result_pixel_x),
+                                    run_y       .eq(manager.result_pixel_y),
+                                    run_value   .eq(result_value),
+                                    run_frame   .eq(manager.result_frame),
+                                ]
+                            with m.Else():
+                                take()
+                        else:
+                            take()
 
             with m.State("SEND"):
                 m.d.sync += send_byte.eq(send_byte + 1)
@@ -321,26 +2152,198 @@ class FractalManagerStream(Elaboratable):
                         m.d.comb +=  pixel_out.payload.eq(result_pixel_y[8:16])
                     with m.Case(4):
                         m.d.comb +=  pixel_out.payload.eq(Cat(result_iterations[0:7], result_maxed))
+                    for b in range(distance_bytes):
+                        with m.Case(5 + b):
+                            m.d.comb += pixel_out.payload.eq(result_distance[b*8:(b*8+8)])
+                    for b in range(state_bytes):
+                        with m.Case(5 + distance_bytes + b):
+                            with m.If(result_maxed):
+                                m.d.comb += pixel_out.payload.eq(result_state[b*8:(b*8+8)])
+                            with m.Else():
+                                send_separator()
+                    if supersampled:
+                        with m.Case(5):
+                            m.d.comb += pixel_out.payload.eq(result_maxed_samples)
+                    if fills:
+                        # the top right pixel of a filled rectangle follows its bottom left one
+                        with m.Case(5):
+                            with m.If(result_fill):
+                                m.d.comb += pixel_out.payload.eq(0xaa)
+                            with m.Else():
+                                send_separator()
+                        fill_corner = Cat(result_fill_x, result_fill_y, result_iterations[0:7], result_maxed)
+                        for b in range(5):
+                            with m.Case(6 + b):
+                                m.d.comb += pixel_out.payload.eq(fill_corner[b*8:(b*8+8)])
                     with m.Default():
-                        m.d.sync += first_result_sent.eq(0)
-                        # separator
-                        m.d.comb +=  pixel_out.payload.eq(0xa5)
+                        send_separator()
+
+            if raster:
+                # 7 bits at a time from the bottom on, the top bit
+                # of a byte is set, if more of the count follows
+                with m.State("COUNT"):
+                    more = result_iterations[7:] != 0
+                    m.d.sync += [
+                        send_byte.eq(send_byte + 1),
+                        result_iterations.eq(result_iterations >> 7),
+                    ]
+                    m.d.comb += [
+                        pixel_out.valid.eq(1),
+                        pixel_out.payload.eq(Cat(result_iterations[0:7], more)),
+                        pixel_out.first.eq(send_byte == 0),
+                    ]
+                    with m.If(~more):
                         # mark last result byte
-                        with m.If(~manager.busy_out):
+                        with m.If(drained):
                             m.d.comb += pixel_out.last.eq(1)
                         m.next = "IDLE"
 
+            if queued:
+                with m.State("FRAME"):
+                    m.d.sync += send_byte.eq(send_byte + 1)
+                    m.d.comb += pixel_out.valid.eq(1)
+
+                    with m.Switch(send_byte):
+                        with m.Case(0):
+                            m.d.comb += pixel_out.payload.eq(sent_frame)
+                            with m.If(~first_result_sent):
+                                m.d.comb += pixel_out.first.eq(1)
+                                m.d.sync += first_result_sent.eq(1)
+                        with m.Case(5):
+                            m.d.comb += pixel_out.payload.eq(0xab)
+                            m.d.sync += [
+                                send_byte.eq(0),
+                                first_result_sent.eq(0),
+                            ]
+                            m.next = "SEND"
+                        with m.Default():
+                            m.d.comb += pixel_out.payload.eq(0)
+
+            if orbit_trace:
+                with m.State("POINT"):
+                    m.d.comb += pixel_out.valid.eq(1)
+                    with m.Switch(send_byte):
+                        for b in range(2 * bytewidth):
+                            with m.Case(b):
+                                m.d.comb += pixel_out.payload.eq(orbit_point[b*8:(b*8+8)])
+                        with m.Default():
+                            m.d.comb += [
+                                pixel_out.payload.eq(orbit_marker),
+                                pixel_out.last.eq(orbit_marker == 0xa9),
+                            ]
+
+                    # the cores wait for their points to be taken,
+                    # so the points wait for the host
+                    with m.If(pixel_out.ready):
+                        m.d.sync += send_byte.eq(send_byte + 1)
+                        with m.If(send_byte == 2 * bytewidth):
+                            m.next = "IDLE"
+
+            if buddhabrot:
+                with m.State("DUMP"):
+                    # the entry appears one clock after its address
+                    m.d.comb += manager.histogram_address.eq(dump_address)
+                    m.d.sync += dump_byte.eq(0)
+                    m.next = "DUMP_SEND"
+
+                with m.State("DUMP_SEND"):
+                    m.d.comb += [
+                        manager.histogram_address.eq(dump_address),
+                        pixel_out.valid.eq(1),
+                        pixel_out.first.eq((dump_address == 0) & (dump_byte == 0)),
+                    ]
+                    with m.Switch(dump_byte):
+                        for b in range(histogram_bytes):
+                            with m.Case(b):
+                                m.d.comb += pixel_out.payload.eq(manager.histogram_data[b*8:(b*8+8)])
+
+                    with m.If(pixel_out.ready):
+                        m.d.sync += dump_byte.eq(dump_byte + 1)
+                        with m.If(dump_byte == histogram_bytes - 1):
+                            m.d.comb += manager.histogram_clear.eq(1)
+                            m.d.sync += dump_address.eq(dump_address + 1)
+                            with m.If(dump_address == manager._histogram_width * manager._histogram_height - 1):
+                                m.d.comb += pixel_out.last.eq(1)
+                                m.d.sync += dumping.eq(0)
+                                m.next = "IDLE"
+                            with m.Else():
+                                m.next = "DUMP"
+
         return m
 
 class FractalManagerTest(GatewareTestCase):
     FRAGMENT_UNDER_TEST = FractalManagerStream
-    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'test': True}
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'interior_check': True, 'test': True}
+    RESULT_CYCLES = 4000
+    PACKET_BYTES = 6
+
+    def expected_results(self, cx, cy, max_iterations, scale):
+        iterations, _, maxed = mandelbrot_reference(cx, cy, max_iterations, scale)
+        return [((iterations & 0x7f) | (maxed << 7), 0xa5)]
+
+    def send_preamble(self, command_stream, max_iterations):
+        yield from ()
+
+    def send_bytes(self, command_stream, data):
+        yield command_stream.valid.eq(1)
+        for byte in data:
+            yield command_stream.payload.eq(byte)
+            yield Settle()
+            # the stream holds off while it is busy
+            while not (yield command_stream.ready):
+                yield
+                yield Settle()
+            yield
+        yield command_stream.valid.eq(0)
+
+    def send_and_receive(self, commands, stall=0):
+        # the results of a command come out, while the next one is still waiting to be taken,
+        # for the first stall cycles, the consumer takes none of them
+        dut = self.dut
+        command_stream = dut.command_stream_in
+        result_stream  = dut.pixel_stream_out
+        data = [byte for command in commands for byte in command]
+        received = []
+        # the bytes, which are marked as the last ones
+        self.lasts = []
+
+        yield command_stream.valid.eq(1)
+        cycles = 0
+        while data:
+            yield result_stream.ready.eq(cycles >= stall)
+            cycles += 1
+            yield command_stream.payload.eq(data[0])
+            yield Settle()
+            if (yield command_stream.ready):
+                data.pop(0)
+            if (yield result_stream.valid):
+                received.append((yield result_stream.payload))
+                if (yield result_stream.last):
+                    self.lasts.append(len(received) - 1)
+            yield
+        yield command_stream.valid.eq(0)
+        yield result_stream.ready.eq(1)
+        # the number of bytes, which came out before the last command was taken
+        sent = len(received)
+
+        for _ in range(self.RESULT_CYCLES):
+            if (yield result_stream.valid):
+                received.append((yield result_stream.payload))
+                if (yield result_stream.last):
+                    self.lasts.append(len(received) - 1)
+            yield
+        return received, sent
+
+    def send_coordinates(self, command_stream, coordinates):
+        bytewidth = self.FRAGMENT_ARGUMENTS['bitwidth'] // 8
+        for coordinate in coordinates:
+            for i in range(bytewidth):
+                yield command_stream.payload.eq(0xff & (coordinate >> (i * 8)))
+                yield
 
     @sync_test_case
     def test_basic(self):
         scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
-        bitwidth = self.FRAGMENT_ARGUMENTS['bitwidth']
-        bytewidth = bitwidth // 8
         dut = self.dut
         command_stream = dut.command_stream_in
         result_stream = dut.pixel_stream_out
@@ -352,6 +2355,9 @@ class FractalManagerTest(GatewareTestCase):
         yield command_stream.valid.eq(1)
         yield result_stream.ready.eq(1)
 
+        max_iterations = 63
+        yield from self.send_preamble(command_stream, max_iterations)
+
         # send 0x0010 twice to calculate 4x4 pixels
         for _ in range(2):
             yield command_stream.payload.eq(4)
@@ -360,29 +2366,676 @@ class FractalManagerTest(GatewareTestCase):
             yield
 
         # max iterations
-        max_iterations = 63
         for b in range(4):
             yield command_stream.payload.eq(max_iterations >> (8 * b))
             yield
 
-        # send corner_x
-        for i in  range(bytewidth):
-            yield command_stream.payload.eq(0xff & (corner_x >> (i * 8)))
+        # send corner_x, corner_y and step
+        yield from self.send_coordinates(command_stream, [corner_x, corner_y, step])
+
+        yield command_stream.payload.eq(0xa5)
+        yield
+
+        yield command_stream.valid.eq(0)
+
+        received = []
+        for _ in range(self.RESULT_CYCLES):
+            if (yield result_stream.valid):
+                received.append((yield result_stream.payload))
             yield
 
-        # send corner_y
-        for i in  range(bytewidth):
-            yield command_stream.payload.eq(0xff & (corner_y >> (i * 8)))
+        self.assertEqual(len(received) % self.PACKET_BYTES, 0)
+        pixels = set()
+        for i in range(0, len(received), self.PACKET_BYTES):
+            packet = received[i:i+self.PACKET_BYTES]
+            pixel_x = packet[0] | (packet[1] << 8)
+            pixel_y = packet[2] | (packet[3] << 8)
+            self.assertIn(tuple(packet[4:]), self.expected_results(
+                corner_x + pixel_x * step, corner_y + pixel_y * step, max_iterations, scale))
+            pixels.add((pixel_x, pixel_y))
+
+        print(f"received {len(pixels)} pixels")
+        self.assertEqual(len(pixels), len(received) // self.PACKET_BYTES)
+        # the scheduler stops right before the last pixel
+        self.assertEqual(len(pixels), 5 * 5 - 1)
+class FractalManagerThreeMultipliersTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'multipliers': 3, 'test': True}
+
+class FractalManagerPipelinedTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'pipelined': True, 'slots': 4, 'test': True}
+
+class FractalManagerNoInteriorCheckTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'interior_check': False, 'test': True}
+
+class FractalManagerPeriodicityTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'multipliers': 3,
+                          'interior_check': False, 'periodicity_check': True, 'test': True}
+
+class FractalManagerNarrowCoresTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':3, 'narrow_cores': 2,
+                          'narrow_fraction_bits': 24, 'narrow_guard_bits': 8, 'test': True}
+
+    def expected_results(self, cx, cy, max_iterations, scale):
+        # the pixel may have been computed by a wide or by a narrow core
+        shift = scale - self.FRAGMENT_ARGUMENTS['narrow_fraction_bits']
+        wide   = FractalManagerTest.expected_results(self, cx, cy, max_iterations, scale)
+        narrow = FractalManagerTest.expected_results(self, cx >> shift, cy >> shift, max_iterations, scale - shift)
+        return wide + narrow
+
+class FractalManagerClusterTest(FractalManagerTest):
+    # more cores than there are pixels, in clusters, which take turns
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':32, 'cluster_size': 4,
+                          'interior_check': True, 'test': True}
+
+class FractalManagerMultiLimbTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 48, 'fraction_bits': 32, 'no_cores':2,
+                          'limb_width': 16, 'max_limbs': 3, 'test': True}
+    RESULT_CYCLES = 12000
+    LIMBS = 2
+
+    def unused_bits(self):
+        return (self.FRAGMENT_ARGUMENTS['max_limbs'] - self.LIMBS) * self.FRAGMENT_ARGUMENTS['limb_width']
+
+    def expected_results(self, cx, cy, max_iterations, scale):
+        unused = self.unused_bits()
+        return super().expected_results(cx >> unused, cy >> unused, max_iterations, scale - unused)
+
+    def send_coordinates(self, command_stream, coordinates):
+        # the number of limbs, followed by the upper limbs of the coordinates
+        yield command_stream.payload.eq(self.LIMBS)
+        yield
+        unused = self.unused_bits()
+        for coordinate in coordinates:
+            for i in range(self.LIMBS * self.FRAGMENT_ARGUMENTS['limb_width'] // 8):
+                yield command_stream.payload.eq(0xff & (coordinate >> (unused + i * 8)))
+                yield
+
+class FractalManagerChunkTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'chunk_size': 2, 'test': True}
+
+class FractalManagerTileTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'test': True}
+
+    def parse_pixels(self, received):
+        self.assertEqual(len(received) % self.PACKET_BYTES, 0)
+        packets = [received[i:i+self.PACKET_BYTES] for i in range(0, len(received), self.PACKET_BYTES)]
+        pixels = {}
+        self.fills = 0
+
+        def add(pixel, result):
+            self.assertNotIn(pixel, pixels)
+            pixels[pixel] = result
+
+        while packets:
+            packet = packets.pop(0)
+            pixel_x, pixel_y = packet[0] | (packet[1] << 8), packet[2] | (packet[3] << 8)
+            if packet[5] == 0xaa:
+                # a filled rectangle, its top right pixel follows
+                corner = packets.pop(0)
+                self.assertEqual(corner[4:], packet[4:])
+                fill_x, fill_y = corner[0] | (corner[1] << 8), corner[2] | (corner[3] << 8)
+                for x in range(pixel_x, fill_x + 1):
+                    for y in range(pixel_y, fill_y + 1):
+                        add((x, y), (packet[4], 0xa5))
+                self.fills += 1
+            else:
+                add((pixel_x, pixel_y), tuple(packet[4:]))
+        return pixels
+
+    def check_pixels(self, commands, expected, view=None, max_iterations=63, stall=0):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        bytewidth = self.FRAGMENT_ARGUMENTS['bitwidth'] // 8
+        corner_x, corner_y, step = view or (-3 << (scale - 1), 0, 1 << (scale - 2))
+
+        data = []
+        for header, trailer in commands:
+            command = header + list(max_iterations.to_bytes(4, byteorder='little'))
+            for coordinate in (corner_x, corner_y, step):
+                command += list(coordinate.to_bytes(bytewidth, byteorder='little', signed=True))
+            data.append(command + trailer)
+
+        # the results of the first tile come out, while the second one is still being sent
+        yield from self.advance_cycles(5)
+        received, _ = yield from self.send_and_receive(data, stall)
+        pixels = self.parse_pixels(received)
+        print(f"received {len(pixels)} pixels")
+        self.assertEqual(set(pixels), set(expected))
+        for (pixel_x, pixel_y), result in pixels.items():
+            self.assertIn(result, self.expected_results(
+                corner_x + pixel_x * step, corner_y + pixel_y * step, max_iterations, scale))
+        return pixels
+
+    @sync_test_case
+    def test_basic(self):
+        # the frame of FractalManagerTest, its results may come with
+        # frame records or merged into runs like those of the tiles
+        expected = [(x, y) for y in range(5) for x in range(5)][:-1]
+        yield from self.check_pixels([([4, 0, 4, 0], [0xa5])], expected)
+
+    @sync_test_case
+    def test_tile(self):
+        # a 3x2 tile at pixel 1, 2 of the frame, all of its pixels are computed,
+        # then the 2x1 tile right of it
+        tiles = [(1, 2, 3, 2), (4, 2, 2, 1)]
+        commands = []
+        for x, y, width, height in tiles:
+            fields = [x, y, width - 1, height - 1]
+            commands.append(([0xfb, 0xff, 0, 0], [b for v in fields for b in v.to_bytes(2, byteorder='little')] + [0xa5]))
+        expected = [(x + i, y + j) for x, y, width, height in tiles for j in range(height) for i in range(width)]
+        yield from self.check_pixels(commands, expected)
+
+    @sync_test_case
+    def test_pixel_list(self):
+        pixels = [(0, 0), (3, 1), (4, 4), (2, 3), (7, 0)]
+        entries = [b for x, y in pixels for b in x.to_bytes(2, byteorder='little') + y.to_bytes(2, byteorder='little')]
+        yield from self.check_pixels([([0xfa, 0xff, len(pixels), 0], entries + [0xa5])], pixels)
+
+class FractalManagerChunkTileTest(FractalManagerTileTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'chunk_size': 2, 'test': True}
+
+class FractalManagerClusterTileTest(FractalManagerTileTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':16, 'cluster_size': 4,
+                          'result_fifo_depth': 2, 'interior_check': True, 'test': True}
+
+    @sync_test_case
+    def test_stall(self):
+        # the consumer takes nothing, until the results of the first tile fill the FIFO
+        # and wait in the registers of the clusters, the second tile must not drop them
+        tiles = [(0, 0, 4, 1), (0, 1, 4, 1)]
+        commands = []
+        for x, y, width, height in tiles:
+            fields = [x, y, width - 1, height - 1]
+            commands.append(([0xfb, 0xff, 0, 0], [b for v in fields for b in v.to_bytes(2, byteorder='little')] + [0xa5]))
+        expected = [(x + i, y + j) for x, y, width, height in tiles for j in range(height) for i in range(width)]
+        pixels = yield from self.check_pixels(commands, expected, stall=2000)
+        # the results of the first tile still wait in the result FIFO, when the cores
+        # are done, so only the last byte of each tile is marked
+        self.assertLessEqual(len(self.lasts), len(tiles))
+        self.assertEqual(self.lasts[-1], len(pixels) * self.PACKET_BYTES - 1)
+
+class FractalManagerInterlaceTest(FractalManagerTileTest):
+    # a single core without the interior check keeps the results in the order of the pixels
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':1, 'interior_check': False,
+                          'interlace_levels': 2, 'test': True}
+    RESULT_CYCLES = 12000
+
+    def interlace_order(self, x, y, width, height, passes):
+        order = []
+        for scan_pass in reversed(range(passes + 1)):
+            spacing = 1 << scan_pass
+            for row in range(0, height, spacing):
+                # the rows of the last pass only have every other pixel left
+                revisited = scan_pass < passes and row % (2 * spacing) == 0
+                for column in range(spacing if revisited else 0, width, 2 * spacing if revisited else spacing):
+                    order.append((x + column, y + row))
+        return order
+
+    @sync_test_case
+    def test_interlace(self):
+        # a 6x5 tile at pixel 1, 1 in three passes, then a 1x3 tile in two,
+        # whose revisited rows have no pixels left
+        tiles = [(1, 1, 6, 5, 2), (7, 1, 1, 3, 1)]
+        commands = []
+        expected = []
+        for x, y, width, height, passes in tiles:
+            fields = [x, y, width - 1, height - 1]
+            commands.append(([0xf8, 0xff, 0, 0],
+                             [b for v in fields for b in v.to_bytes(2, byteorder='little')] + [passes, 0xa5]))
+            expected += self.interlace_order(x, y, width, height, passes)
+        self.assertEqual(len(expected), 6 * 5 + 3)
+        pixels = yield from self.check_pixels(commands, expected)
+        self.assertEqual(list(pixels), expected)
+
+class FractalManagerSubdivideTest(FractalManagerTileTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2,
+                          'subdivide': True, 'subdivide_min': 2, 'test': True}
+    RESULT_CYCLES = 15000
+
+    @sync_test_case
+    def test_subdivide(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        # parts of the main cardioid and the bands left of it are filled
+        view = (-5 << (scale - 3), -1 << (scale - 1), 1 << (scale - 4))
+        fields = [0, 0, 15, 15]
+        command = ([0xf9, 0xff, 0, 0], [b for v in fields for b in v.to_bytes(2, byteorder='little')] + [0xa5])
+        expected = [(x, y) for y in range(16) for x in range(16)]
+        yield from self.check_pixels([command], expected, view=view, max_iterations=15)
+        print(f"{self.fills} filled rectangles")
+        self.assertGreater(self.fills, 0)
+
+class FractalManagerRunLengthTest(FractalManagerTileTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'run_length': True, 'test': True}
+
+    @sync_test_case
+    def test_runs(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        # every pixel of the tile escapes in the first iteration, so each row
+        # goes out as a run, unless the cores hand its pixels back out of order
+        view = (-4 << scale, 0, 1 << (scale - 4))
+        fields = [0, 0, 7, 3]
+        command = ([0xfb, 0xff, 0, 0], [b for v in fields for b in v.to_bytes(2, byteorder='little')] + [0xa5])
+        expected = [(x, y) for y in range(4) for x in range(8)]
+        yield from self.check_pixels([command], expected, view=view)
+        print(f"{self.fills} runs")
+        self.assertGreaterEqual(self.fills, 4)
+
+class FractalManagerRasterTest(FractalManagerTest):
+    # a small reorder buffer holds the dispatcher back now and then
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2,
+                          'raster_order': True, 'reorder_depth': 4, 'test': True}
+    RESULT_CYCLES = 20000
+
+    @sync_test_case
+    def test_basic(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        bytewidth = self.FRAGMENT_ARGUMENTS['bitwidth'] // 8
+        dut = self.dut
+        command_stream = dut.command_stream_in
+        result_stream = dut.pixel_stream_out
+        corner_x = -3 << (scale - 1)
+        corner_y = 0
+        step = 1 << (scale - 2)
+        # the maxed pixels and some of the escaped ones take two bytes
+        max_iterations = 300
+
+        yield from self.advance_cycles(5)
+        yield result_stream.ready.eq(1)
+
+        command = [4, 0, 4, 0] + list(max_iterations.to_bytes(4, byteorder='little'))
+        for coordinate in (corner_x, corner_y, step):
+            command += list(coordinate.to_bytes(bytewidth, byteorder='little', signed=True))
+        yield from self.send_bytes(command_stream, command + [0xa5])
+
+        received = []
+        for _ in range(self.RESULT_CYCLES):
+            if (yield result_stream.valid):
+                received.append((yield result_stream.payload))
             yield
 
-        # send step
-        for i in  range(bytewidth):
-            yield command_stream.payload.eq(0xff & (step >> (i * 8)))
+        counts = []
+        count, shift = 0, 0
+        for byte in received:
+            count |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                counts.append(count)
+                count, shift = 0, 0
+        self.assertEqual(shift, 0)
+
+        # the scheduler stops right before the last pixel
+        pixels = [(x, y) for y in range(5) for x in range(5)][:-1]
+        expected = [mandelbrot_reference(corner_x + x * step, corner_y + y * step, max_iterations, scale)[0]
+                    for x, y in pixels]
+        print(f"received {len(counts)} pixels in {len(received)} bytes")
+        self.assertEqual(counts, expected)
+
+class FractalManagerQueueTest(FractalManagerTileTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'queue_frames': True, 'test': True}
+    RESULT_CYCLES = 8000
+
+    def parse_pixels(self, received):
+        # a frame record comes before the results of each frame
+        packets = [received[i:i+self.PACKET_BYTES] for i in range(0, len(received), self.PACKET_BYTES)]
+        return super().parse_pixels([byte for packet in packets if packet[-1] != 0xab for byte in packet])
+
+    @sync_test_case
+    def test_queue(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        bytewidth = self.FRAGMENT_ARGUMENTS['bitwidth'] // 8
+        # the second frame has its own corner, step and max_iterations,
+        # it starts while the cores still run the last pixels of the first one
+        frames = [((-3 << (scale - 1), 0, 1 << (scale - 2)), 63),
+                  ((-1 << (scale - 1), 1 << (scale - 3), 1 << (scale - 3)), 20)]
+        commands = []
+        for (corner_x, corner_y, step), max_iterations in frames:
+            command = [4, 0, 4, 0] + list(max_iterations.to_bytes(4, byteorder='little'))
+            for coordinate in (corner_x, corner_y, step):
+                command += list(coordinate.to_bytes(bytewidth, byteorder='little', signed=True))
+            commands.append(command + [0xa5])
+
+        yield from self.advance_cycles(5)
+        received, sent = yield from self.send_and_receive(commands)
+        self.assertEqual(len(received) % self.PACKET_BYTES, 0)
+
+        # the frames are counted from 1 on
+        pixels = {1: {}, 2: {}}
+        frame = None
+        for i in range(0, len(received), self.PACKET_BYTES):
+            packet = received[i:i+self.PACKET_BYTES]
+            if packet[-1] == 0xab:
+                frame = packet[0]
+                continue
+            pixel = (packet[0] | (packet[1] << 8), packet[2] | (packet[3] << 8))
+            self.assertIn(frame, pixels)
+            self.assertNotIn(pixel, pixels[frame])
+            pixels[frame][pixel] = tuple(packet[4:])
+            if i < sent:
+                self.assertEqual(frame, 1)
+
+        first_sent = sum(1 for i in range(0, sent, self.PACKET_BYTES) if received[i + 5] != 0xab)
+        print(f"{first_sent} pixels of the first frame came out before the second one was taken")
+        self.assertLess(first_sent, 5 * 5 - 1)
+
+        for n, ((corner_x, corner_y, step), max_iterations) in enumerate(frames):
+            results = pixels[n + 1]
+            # the scheduler stops right before the last pixel
+            self.assertEqual(len(results), 5 * 5 - 1)
+            for (pixel_x, pixel_y), result in results.items():
+                self.assertIn(result, self.expected_results(
+                    corner_x + pixel_x * step, corner_y + pixel_y * step, max_iterations, scale))
+
+class FractalManagerSupersampleTest(FractalManagerTileTest):
+    # two slots hold the dispatcher back now and then
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2,
+                          'supersample_levels': 2, 'supersample_depth': 2, 'test': True}
+    RESULT_CYCLES = 20000
+    PACKET_BYTES = 7
+    # the levels and the step of the supersampled pixels by their coordinates
+    sampling = {}
+
+    def expected_results(self, cx, cy, max_iterations, scale):
+        # the mean iteration count of the samples and the number of the maxed ones
+        levels, step = self.sampling.get((cx, cy), (0, 0))
+        side = 1 << levels
+        samples = [mandelbrot_reference(cx + i * (step >> levels), cy + j * (step >> levels), max_iterations, scale)
+                   for j in range(side) for i in range(side)]
+        mean = sum(iterations for iterations, _, _ in samples) >> (2 * levels)
+        maxed = sum(maxed for _, _, maxed in samples)
+        return [((mean & 0x7f) | ((maxed == len(samples)) << 7), maxed, 0xa5)]
+
+    @sync_test_case
+    def test_supersample(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        corner_x, corner_y, step = -3 << (scale - 1), 0, 1 << (scale - 2)
+        # a 4x3 tile with 2x2 samples per pixel, then a 2x2 tile with 4x4,
+        # both across the edge of the main cardioid
+        tiles = [(0, 0, 4, 3, 1), (4, 0, 2, 2, 2)]
+        commands = []
+        expected = []
+        self.sampling = {}
+        for x, y, width, height, levels in tiles:
+            fields = [x, y, width - 1, height - 1]
+            commands.append(([0xf7, 0xff, 0, 0],
+                             [b for v in fields for b in v.to_bytes(2, byteorder='little')] + [levels, 0xa5]))
+            for j in range(height):
+                for i in range(width):
+                    expected.append((x + i, y + j))
+                    self.sampling[(corner_x + (x + i) * step, corner_y + (y + j) * step)] = (levels, step)
+        pixels = yield from self.check_pixels(commands, expected)
+        maxed = [pixels[pixel][1] for pixel in expected]
+        print(f"maxed samples: {maxed}")
+        # some pixels are only partly inside
+        self.assertTrue(any(0 < n < 4 for n in maxed[:12]))
+
+class FractalManagerPerturbationTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2,
+                          'perturbation': True, 'orbit_depth': 256, 'test': True}
+    RESULT_CYCLES = 10000
+    EXPONENT = 6
+
+    def send_preamble(self, command_stream, max_iterations):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        bytewidth = self.FRAGMENT_ARGUMENTS['bitwidth'] // 8
+        precision = 2 * scale
+        cx = round(-0.745 * (1 << scale)) << (precision - scale)
+        cy = round( 0.113 * (1 << scale)) << (precision - scale)
+        self.orbit = reference_orbit(cx, cy, max_iterations, scale, precision)
+
+        # upload the reference orbit
+        header = [0xff, 0xff, len(self.orbit) & 0xff, len(self.orbit) >> 8]
+        entries = [0xff & (v >> (i * 8)) for x, y in self.orbit for v in (x, y) for i in range(bytewidth)]
+        for byte in header + entries + [0xa5]:
+            yield command_stream.payload.eq(byte)
             yield
 
-        yield command_stream.payload.eq(0xa5)
+    def send_coordinates(self, command_stream, coordinates):
+        yield command_stream.payload.eq(self.EXPONENT)
         yield
+        yield from super().send_coordinates(command_stream, coordinates)
+
+    def expected_results(self, cx, cy, max_iterations, scale):
+        iterations, _, maxed, glitch = perturbation_reference(cx, cy, self.EXPONENT, self.orbit, max_iterations, scale)
+        return [((iterations & 0x7f) | (maxed << 7), 0xa6 if glitch else 0xa5)]
+
+class FractalManagerDistanceTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'distance_estimate': True, 'test': True}
+    RESULT_CYCLES = 8000
+    PACKET_BYTES = 8
+
+    def expected_results(self, cx, cy, max_iterations, scale):
+        # the distance estimate follows the iterations
+        iterations, escape, maxed, distance = distance_reference(cx, cy, max_iterations, scale)
+        distance = distance & 0xffff if escape else 0x7fff
+        return [((iterations & 0x7f) | (maxed << 7), distance & 0xff, distance >> 8, 0xa5)]
+
+class FractalManagerResumableTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'resumable': True,
+                          'interior_check': True, 'test': True}
+
+    def parse_results(self, received):
+        # maxed pixels are followed by their iteration and final z
+        bytewidth = self.FRAGMENT_ARGUMENTS['bitwidth'] // 8
+        results = {}
+        while received:
+            length = 6 + (4 + 2 * bytewidth if received[4] & 0x80 else 0)
+            packet, received = received[:length], received[length:]
+            self.assertEqual(len(packet), length)
+            pixel = (packet[0] | (packet[1] << 8), packet[2] | (packet[3] << 8))
+            state = packet[5:-1]
+            iteration = int.from_bytes(state[:4], byteorder='little')
+            x = int.from_bytes(state[4:4 + bytewidth], byteorder='little', signed=True)
+            y = int.from_bytes(state[4 + bytewidth:], byteorder='little', signed=True)
+            self.assertNotIn(pixel, results)
+            results[pixel] = (packet[4], packet[-1], iteration, x, y)
+        return results
 
-        yield command_stream.valid.eq(0)
+    @sync_test_case
+    def test_basic(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        bytewidth = self.FRAGMENT_ARGUMENTS['bitwidth'] // 8
+        corner_x = -3 << (scale - 1)
+        corner_y = 0
+        step = 1 << (scale - 2)
+
+        def pixel_coordinates(pixel):
+            return corner_x + pixel[0] * step, corner_y + pixel[1] * step
+
+        def to_bytes(value, length):
+            return list(value.to_bytes(length, byteorder='little', signed=value < 0))
+
+        yield from self.advance_cycles(5)
+
+        # a low limit first, then the maxed pixels continue with a higher one
+        first_limit, second_limit = 4, 63
+        command = to_bytes(4, 2) + to_bytes(4, 2) + to_bytes(first_limit, 4)
+        for coordinate in (corner_x, corner_y, step):
+            command += to_bytes(coordinate, bytewidth)
+        received, _ = yield from self.send_and_receive([command + [0xa5]])
+        results = self.parse_results(received)
+        self.assertEqual(len(results), 5 * 5 - 1)
+
+        states = []
+        for pixel, (value, separator, iteration, x, y) in results.items():
+            iterations, escape, maxed = mandelbrot_reference(*pixel_coordinates(pixel), first_limit, scale)
+            self.assertEqual(value, (iterations & 0x7f) | (maxed << 7))
+            if not maxed:
+                self.assertEqual(separator, 0xa5)
+            elif escape:
+                # escaped in the last iteration, this is final
+                self.assertEqual(separator, 0xa7)
+                self.assertEqual(iteration, iterations)
+            elif iteration != 0xffffffff:
+                self.assertEqual(separator, 0xa5)
+                states.append((pixel, iteration, x, y))
+
+        print(f"continuing {len(states)} pixels")
+        self.assertGreater(len(states), 0)
+
+        command = to_bytes(0xfffe, 2) + to_bytes(len(states), 2) + to_bytes(second_limit, 4)
+        for pixel, iteration, x, y in states:
+            command += to_bytes(pixel[0], 2) + to_bytes(pixel[1], 2) + to_bytes(iteration, 4)
+            command += to_bytes(x, bytewidth) + to_bytes(y, bytewidth)
+        # the first pixels come back, while the rest of them are still coming in
+        received, _ = yield from self.send_and_receive([command + [0xa5]])
+        results = self.parse_results(received)
+        self.assertEqual(set(results), set(pixel for pixel, *_ in states))
+        for pixel, (value, separator, *_) in results.items():
+            iterations, escape, maxed = mandelbrot_reference(*pixel_coordinates(pixel), second_limit, scale)
+            self.assertEqual(value, (iterations & 0x7f) | (maxed << 7))
+            self.assertEqual(separator, 0xa7 if escape and maxed else 0xa5)
+
+class FractalManagerBuddhabrotTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'buddhabrot': True,
+                          'histogram_width': 16, 'histogram_height': 16, 'test': True}
+    RESULT_CYCLES = 10000
+
+    @sync_test_case
+    def test_basic(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        bytewidth = self.FRAGMENT_ARGUMENTS['bitwidth'] // 8
+        width = self.FRAGMENT_ARGUMENTS['histogram_width']
+        height = self.FRAGMENT_ARGUMENTS['histogram_height']
+        dut = self.dut
+        command_stream = dut.command_stream_in
+        result_stream = dut.pixel_stream_out
+        corner_x = -1 << scale
+        corner_y = 0
+        step = 1 << (scale - 2)
+        shift = scale - 2
+        max_iterations = 63
+
+        yield from self.advance_cycles(5)
+        yield result_stream.ready.eq(1)
+
+        # a 5x5 grid of samples, the histogram has bins of a quarter
+        command = [4, 0, 4, 0] + list(max_iterations.to_bytes(4, byteorder='little')) + [shift]
+        for coordinate in (corner_x, corner_y, step):
+            command += list(coordinate.to_bytes(bytewidth, byteorder='little', signed=True))
+        yield from self.send_bytes(command_stream, command + [0xa5])
+
+        # fetch the histogram, once all orbits are counted
+        yield from self.send_bytes(command_stream, [0xfd, 0xff, 0, 0])
+
+        received = []
+        for _ in range(self.RESULT_CYCLES):
+            if (yield result_stream.valid):
+                received.append((yield result_stream.payload))
+            yield
+        self.assertEqual(len(received), 2 * width * height)
+        histogram = [received[i] | (received[i + 1] << 8) for i in range(0, len(received), 2)]
+
+        expected = [0] * (width * height)
+        for pixel_y in range(5):
+            for pixel_x in range(5):
+                # the scheduler stops right before the last pixel
+                if (pixel_x, pixel_y) == (4, 4):
+                    continue
+                for x, y in escape_orbit(corner_x + pixel_x * step, corner_y + pixel_y * step, max_iterations, scale):
+                    bin_x, bin_y = (x - corner_x) >> shift, (y - corner_y) >> shift
+                    if 0 <= bin_x < width and 0 <= bin_y < height:
+                        expected[bin_y * width + bin_x] += 1
+
+        print(f"{sum(histogram)} orbit points counted")
+        self.assertEqual(histogram, expected)
+
+class FractalManagerOrbitTraceTest(FractalManagerTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores':2, 'orbit_trace': True, 'test': True}
+
+    @sync_test_case
+    def test_orbit(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        bytewidth = self.FRAGMENT_ARGUMENTS['bitwidth'] // 8
+        dut = self.dut
+        command_stream = dut.command_stream_in
+        result_stream = dut.pixel_stream_out
+        one = 1 << scale
+        max_iterations = 100
+
+        yield from self.advance_cycles(5)
+        yield result_stream.ready.eq(1)
+
+        # an escaping and an interior point
+        for cx, cy in [((one >> 2) + (one >> 6), 0), (-one, 0)]:
+            command = [0xfc, 0xff, 0, 0] + list(max_iterations.to_bytes(4, byteorder='little'))
+            for coordinate in (cx, cy, 0):
+                command += list(coordinate.to_bytes(bytewidth, byteorder='little', signed=True))
+            yield from self.send_bytes(command_stream, command + [0xa5])
+
+            received = []
+            for _ in range(2 * self.RESULT_CYCLES):
+                if (yield result_stream.valid):
+                    received.append((yield result_stream.payload))
+                yield
+
+            entry_bytes = 2 * bytewidth + 1
+            self.assertEqual(len(received) % entry_bytes, 0)
+            entries = [received[i:i+entry_bytes] for i in range(0, len(received), entry_bytes)]
+            self.assertEqual([entry[-1] for entry in entries], [0xa8] * (len(entries) - 1) + [0xa9])
+
+            orbit = [(int.from_bytes(entry[:bytewidth], byteorder='little', signed=True),
+                      int.from_bytes(entry[bytewidth:-1], byteorder='little', signed=True)) for entry in entries[:-1]]
+            end = entries[-1]
+            iterations, escape, maxed = mandelbrot_reference(cx, cy, max_iterations, scale)
+            print(f"orbit of ({hex(cx)}, {hex(cy)}): {len(orbit)} points")
+            self.assertEqual(int.from_bytes(end[:4], byteorder='little'), iterations)
+            self.assertEqual(end[4], escape | (maxed << 1))
+            self.assertEqual(orbit, traced_orbit(cx, cy, max_iterations, scale))
+
+class FractalManagerDispatchTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = FractalManagerCore
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores': 4, 'test': True}
+    # the consumer takes no results for this many cycles
+    HOLD_CYCLES = 0
+
+    @sync_test_case
+    def test_escape_heavy(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        dut = self.dut
+        # all pixels lie outside of the radius 2 and escape in the first iteration,
+        # the dispatcher has to keep up with the cores
+        corner_x = 2 << scale
+        corner_y = 0
+        step = 1 << (scale - 6)
+        size = 16
+        max_iterations = 63
+
+        yield dut.no_pixels_x.eq(size - 1)
+        yield dut.no_pixels_y.eq(size - 1)
+        yield dut.max_iterations.eq(max_iterations)
+        yield dut.bottom_left_corner_x.eq(corner_x)
+        yield dut.bottom_left_corner_y.eq(corner_y)
+        yield dut.step.eq(step)
+        yield from self.advance_cycles(5)
+        yield from self.pulse(dut.start)
+        yield from self.advance_cycles(self.HOLD_CYCLES)
+        yield dut.result_ready.eq(1)
+
+        # the scheduler stops right before the last pixel
+        expected = size * size - 1
+        pixels = set()
+        cycles = 0
+        while len(pixels) < expected and cycles < 20 * expected:
+            if (yield dut.result_valid):
+                pixel = ((yield dut.result_pixel_x), (yield dut.result_pixel_y))
+                iterations, escape, maxed = mandelbrot_reference(
+                    corner_x + pixel[0] * step, corner_y + pixel[1] * step, max_iterations, scale)
+                self.assertEqual(((yield dut.result_iterations), (yield dut.result_escape), (yield dut.result_maxed)),
+                                 (iterations, escape, maxed))
+                pixels.add(pixel)
+            cycles += 1
+            yield
+
+        print(f"{len(pixels)} pixels in {cycles} cycles: {cycles / expected:0.2f} cycles per pixel")
+        self.assertEqual(len(pixels), expected)
+        self.assertLess(cycles / expected, 4)
+
+class FractalManagerChunkDispatchTest(FractalManagerDispatchTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores': 4, 'chunk_size': 4, 'test': True}
+
+class FractalManagerClusterDispatchTest(FractalManagerDispatchTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores': 16, 'cluster_size': 4, 'test': True}
 
-        yield from self.advance_cycles(2500)
\ No newline at end of file
+class FractalManagerResultFifoTest(FractalManagerDispatchTest):
+    # the result FIFO fills up, then the cores wait
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'no_cores': 4, 'result_fifo_depth': 8, 'test': True}
+    HOLD_CYCLES = 200
@@ -0,0 +1,140 @@
+from amaranth       import *
+from amaranth.build import Platform
+from amlib.test     import GatewareTestCase, sync_test_case
+
+from mandelbrot     import mandelbrot_reference
+
+class InteriorCheck(Elaboratable):
+    """ finds out whether a point lies inside the main cardioid or the period-2 bulb,
+        where it never escapes. The check runs with a few bits of precision only,
+        the regions are shrunk by a margin larger than the rounding errors,
+        so points close to the boundary are left to the cores.
+        Within -2 <= x, y < 2 the cardioid term is off by less than
+        300 units of the last place, which the margin of 2^-margin_bits
+        covers at the default precision.
+        At 20 bits, the check takes a 25 by 26 bit product for the cardioid
+        and three more of 23 by 23 bits or less, the manager only builds it
+        with interior_check """
+    def __init__(self, *, bitwidth, fraction_bits, precision=20, margin_bits=11):
+        assert fraction_bits >= precision, "the coordinates need at least as many fraction bits as the check"
+
+        # Parameters
+        self._bitwidth = bitwidth
+        self._fraction_bits = fraction_bits
+        self._precision = precision
+        self._margin_bits = margin_bits
+
+        # the result appears at the output this many clocks after the start
+        self.latency = 3
+
+        # Inputs
+        self.cx_in    = Signal(signed(bitwidth))
+        self.cy_in    = Signal(signed(bitwidth))
+        self.start_in = Signal()
+
+        # Outputs
+        self.done_out   = Signal()
+        self.inside_out = Signal()
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        scale = self._fraction_bits
+        f     = self._precision
+
+        def fixed(value):
+            return int(value * (1 << f))
+
+        margin = 1 << (f - self._margin_bits)
+
+        # both regions lie within -2 <= x, y < 2,
+        # everything outside does not need to be looked at
+        in_range = Signal()
+        x        = Signal(signed(f + 2))
+        y        = Signal(signed(f + 2))
+        m.d.comb += [
+            in_range.eq(  (self.cx_in[scale + 1:].all() | ~self.cx_in[scale + 1:].any())
+                        & (self.cy_in[scale + 1:].all() | ~self.cy_in[scale + 1:].any())),
+            x.eq(self.cx_in[scale - f:scale + 2]),
+            y.eq(self.cy_in[scale - f:scale + 2]),
+        ]
+
+        valid = Signal(self.latency)
+        m.d.sync += valid.eq(Cat(self.start_in, valid[:-1]))
+        m.d.comb += self.done_out.eq(valid[-1])
+
+        # stage 0: y^2 and the shifted x coordinates
+        range_0        = Signal()
+        x_quarter      = Signal(signed(f + 3))
+        x_plus_one     = Signal(signed(f + 3))
+        yy             = Signal(signed(2 * f + 4))
+        m.d.sync += [
+            range_0    .eq(in_range),
+            x_quarter  .eq(x - fixed(1/4)),
+            x_plus_one .eq(x + fixed(1)),
+            yy         .eq((y * y) >> f),
+        ]
+
+        # stage 1: q = (x - 1/4)^2 + y^2 and the bulb
+        range_1     = Signal()
+        # q stays below (2 + 1/4)^2 + 2^2 < 2^4, so the product
+        # of stage 2 only needs a few DSP tiles
+        q           = Signal(signed(f + 5))
+        x_quarter_1 = Signal.like(x_quarter)
+        yy_1        = Signal.like(yy)
+        bulb        = Signal()
+        m.d.sync += [
+            range_1     .eq(range_0),
+            q           .eq(((x_quarter * x_quarter) >> f) + yy),
+            x_quarter_1 .eq(x_quarter),
+            yy_1        .eq(yy),
+            bulb        .eq((((x_plus_one * x_plus_one) >> f) + yy) < (fixed(1/16) - margin)),
+        ]
+
+        # stage 2: the cardioid, q * (q + x - 1/4) < y^2 / 4
+        cardioid = Signal()
+        m.d.comb += cardioid.eq(((q * (q + x_quarter_1)) >> f) < ((yy_1 >> 2) - margin))
+        m.d.sync += self.inside_out.eq(range_1 & (bulb | cardioid))
+
+        return m
+
+class InteriorCheckTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = InteriorCheck
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56}
+
+    @sync_test_case
+    def test_basic(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        dut = self.dut
+        max_iterations = 500
+
+        # a grid over the interesting part of the plane, offset from the
+        # axes, so the points do not fall on the boundaries of the regions
+        step = (1 << scale) // 16
+        points = [(-(2 << scale) + x * step + 12345, -(1 << scale) - (step >> 3) + y * step)
+                  for x in range(48) for y in range(33)]
+        points += [(-(4 << scale), 0), ((3 << scale) - 1, 0), (0, -(4 << scale))]
+
+        # feed a new point every clock
+        results = []
+        for n in range(len(points) + dut.latency):
+            if n < len(points):
+                cx, cy = points[n]
+                yield dut.cx_in.eq(cx)
+                yield dut.cy_in.eq(cy)
+            yield dut.start_in.eq(n < len(points))
+            yield
+            if (yield dut.done_out):
+                results.append((yield dut.inside_out))
+
+        self.assertEqual(len(results), len(points))
+        inside = [p for p, r in zip(points, results) if r]
+        outside_maxed = [p for p, r in zip(points, results)
+                         if not r and mandelbrot_reference(*p, max_iterations, scale)[2]]
+
+        # points inside never escape
+        for cx, cy in inside:
+            self.assertEqual(mandelbrot_reference(cx, cy, max_iterations, scale), (max_iterations + 1, 0, 1))
+
+        # only few points near the boundaries are missed
+        print(f"{len(inside)} points found inside, {len(outside_maxed)} maxed points not found")
+        self.assertGreater(len(inside), 5 * len(outside_maxed))
@@ -1,28 +1,95 @@
+import math
+from random         import Random
+
 from amaranth       import *
 from amaranth.build import Platform
 from amlib.test     import GatewareTestCase, sync_test_case
 
+from multiplier     import PipelinedMultiplier, PipelinedSquarer, LimbSerialMultiplier
+
+# the distance estimate is given as log2 of the distance with this many fraction bits
+DISTANCE_FRACTION_BITS = 4
+LOG2_LN2 = round(math.log2(math.log(2)) * (1 << DISTANCE_FRACTION_BITS))
+
 class Mandelbrot(Elaboratable):
-    def __init__(self, *, bitwidth=128, fraction_bits=120, test=False):
+    def __init__(self, *, bitwidth=128, fraction_bits=120, multipliers=1, multiplier_stages=0,
+                 squarers=False, periodicity_check=False, periodicity_tolerance=0, resumable=False,
+                 distance_estimate=False, trace=False, orbit_trace=False, tag_width=32, test=False):
+        assert multipliers in (1, 2, 3), "a core can use one, two or three multipliers"
+        if distance_estimate:
+            assert multipliers == 1 and not squarers, "the derivative shares the single multiplier with z"
+            assert not resumable, "a resumed pixel has no derivative"
+        if trace or orbit_trace:
+            assert not (resumable or distance_estimate), "a traced pixel runs its whole orbit twice"
+
         # Parameters
         self._bitwidth = bitwidth
         self._fraction_bits = fraction_bits
+        self._multipliers = multipliers
+        self._multiplier_stages = multiplier_stages
+        self._squarers = squarers
+        self._periodicity_check = periodicity_check
+        self._periodicity_tolerance = periodicity_tolerance
+        self._resumable = resumable
+        self._distance_estimate = distance_estimate
+        self._trace = trace
+        self._orbit_trace = orbit_trace
         self._test = test
 
+        # more multipliers compute more products in parallel,
+        # pipelined multipliers take the products in back to back
+        # and deliver them multiplier_stages clocks later,
+        # the derivative dz/dc takes another four products
+        products = 8 if distance_estimate else 4
+        self.cycles_per_iteration = {1: products, 2: 2, 3: 1}[multipliers] + multiplier_stages
+
         # Inputs
         self.cx_in             = Signal(signed(bitwidth))
         self.cy_in             = Signal(signed(bitwidth))
+        self.tag_in            = Signal(tag_width)
         self.start_in          = Signal()
         self.max_iterations_in = Signal(32)
         self.result_read_in    = Signal()
 
         # Outputs
         self.busy_out          = Signal()
+        self.ready_out         = Signal()
         self.escape_out        = Signal()
         self.maxed_out         = Signal()
         self.done_out          = Signal()
         self.result_ready_out  = Signal()
         self.iterations_out    = Signal(32)
+        self.tag_out           = Signal(tag_width)
+        # iterations not run, because the orbit was found to be periodic
+        self.saved_iterations_out = Signal(32)
+
+        if resumable:
+            # a maxed pixel can be continued with a higher max_iterations
+            # by starting it again from its final z and iteration
+            self.resume_in    = Signal()
+            self.x_in         = Signal.like(self.cx_in)
+            self.y_in         = Signal.like(self.cy_in)
+            self.iteration_in = Signal(32)
+            self.x_out        = Signal.like(self.cx_in)
+            self.y_out        = Signal.like(self.cy_in)
+
+        if distance_estimate:
+            # log2 of the distance of an escaped pixel to the set,
+            # with DISTANCE_FRACTION_BITS fraction bits
+            self.distance_out = Signal(signed(16))
+
+        if orbit_trace:
+            # the pixel started with this hands out its whole orbit on the first run,
+            # up to max_iterations, whether it escapes or not
+            self.trace_orbit_in = Signal()
+
+        if trace or orbit_trace:
+            # the orbit of an escaping pixel is run a second time,
+            # which hands out its points z_1 ... z_n one by one
+            self.trace_valid_out = Signal()
+            self.trace_ready_in  = Signal()
+            self.trace_x_out     = Signal.like(self.cx_in)
+            self.trace_y_out     = Signal.like(self.cy_in)
 
         if test:
             self.x          = Signal.like(self.cx_in)
@@ -39,7 +106,8 @@ class Mandelbrot(Elaboratable):
         iteration = Signal(32)
 
         # pipeline stages enable signals
-        stage_enable = Signal(4)
+        cycles = self.cycles_per_iteration
+        stage_enable = Signal(cycles)
 
         # pipeline stage 1
         two_xy = Signal(signed(bitwidth))
@@ -57,35 +125,136 @@ class Mandelbrot(Elaboratable):
         escape        = Signal()
         maxed_out     = Signal()
         result_read   = Signal(reset=1)
+        finished      = Signal()
+        tag           = Signal.like(self.tag_out)
+        saved         = Signal.like(self.saved_iterations_out)
+        distance      = Signal(signed(16))
+
+        # the result of the last pixel is held here, when the core is started
+        # again before it has been read, the outputs show it until then
+        held           = Signal()
+        held_iteration = Signal.like(iteration)
+        held_escape    = Signal()
+        held_maxed     = Signal()
+        held_tag       = Signal.like(tag)
+        held_saved     = Signal.like(saved)
+        held_distance  = Signal.like(distance)
+        held_x         = Signal(signed(bitwidth))
+        held_y         = Signal(signed(bitwidth))
 
         four = Signal(signed(bitwidth))
+        one  = Const(1 << scale, signed(bitwidth))
 
-        with m.If(self.result_read_in):
+        # the derivative dz/dc = (dx + i dy) * 2^dexp for the distance estimate,
+        # it grows too fast for the fixed point format of z
+        dx   = Signal(signed(bitwidth))
+        dy   = Signal(signed(bitwidth))
+        dexp = Signal(16)
+
+        def magnitude(v):
+            return Mux(v < 0, -v, v)
+
+        with m.If(self.result_read_in & held):
+            m.d.sync += held.eq(0)
+        with m.Elif(self.result_read_in):
             m.d.sync += [
                 result_read.eq(1),
-                self.result_ready_out.eq(0),
+                finished.eq(0),
                 maxed_out.eq(0),
                 escape.eq(0),
-                iteration.eq(0)
+                iteration.eq(0),
+                saved.eq(0),
             ]
 
         m.d.comb += [
-            self.busy_out.eq(running | ~result_read),
-            self.iterations_out.eq(iteration),
-            self.escape_out.eq(escape),
-            self.maxed_out.eq(maxed_out),
+            self.busy_out.eq(running | ~result_read | held),
+            # a finished core takes the next pixel at once, unless
+            # it still holds the result of the pixel before
+            self.ready_out.eq(~running & ~held),
+            self.result_ready_out.eq(held | finished),
+            self.iterations_out.eq(Mux(held, held_iteration, iteration)),
+            self.escape_out.eq(Mux(held, held_escape, escape)),
+            self.maxed_out.eq(Mux(held, held_maxed, maxed_out)),
+            self.tag_out.eq(Mux(held, held_tag, tag)),
+            self.saved_iterations_out.eq(Mux(held, held_saved, saved)),
             four.eq(Const(4, signed(bitwidth)) << scale),
         ]
+        if self._distance_estimate:
+            m.d.comb += self.distance_out.eq(Mux(held, held_distance, distance))
 
-        # instantiate a multiplier for reuse
+        # instantiate the multipliers for reuse
         # the product has one bit more than necessary
         # because we want to preserve the bit of precision
         # for the factor 2xy
-        factor1           = Signal(signed(bitwidth))
-        factor2           = Signal(signed(bitwidth))
-        two_times_product = Signal(signed(bitwidth))
+        latency            = self._multiplier_stages
+        squarers           = self._squarers
+        suffixes           = [""] + [f"_{n}" for n in range(1, self._multipliers)]
+        two_times_products = [Signal(signed(bitwidth), name=f"two_times_product{suffix}")
+                              for suffix in suffixes]
+
+        if not squarers:
+            factors = [(Signal(signed(bitwidth), name=f"factor1{suffix}"),
+                        Signal(signed(bitwidth), name=f"factor2{suffix}"))
+                       for suffix in suffixes]
+
+            for n, ((f1, f2), product) in enumerate(zip(factors, two_times_products)):
+                if latency > 0:
+                    multiplier = PipelinedMultiplier(width=bitwidth, stages=latency)
+                    m.submodules[f"multiplier_{n}"] = multiplier
+                    m.d.comb += [
+                        multiplier.a_in.eq(f1),
+                        multiplier.b_in.eq(f2),
+                        product.eq(multiplier.product_out >> (scale - 1)),
+                    ]
+                else:
+                    m.d.comb += product.eq((f1 * f2) >> (scale - 1))
+
+            two_times_cross_products = two_times_products
+            xx_full = yy_full = None
+
+            def issue(n, a, b):
+                return [factors[n][0].eq(a), factors[n][1].eq(b)]
+
+            def keep_square(n, full_square):
+                return []
+
+        else:
+            # squarers instead of multipliers, 2xy = (x + y)^2 - x^2 - y^2
+            # the unit which squares x + y needs one more bit
+            cross_unit = 2 if self._multipliers == 3 else 0
+            widths     = [bitwidth + 1 if n == cross_unit else bitwidth for n in range(self._multipliers)]
+            operands   = [Signal(signed(w),     name=f"operand{suffix}") for w, suffix in zip(widths, suffixes)]
+            squares    = [Signal(signed(2 * w), name=f"square{suffix}")  for w, suffix in zip(widths, suffixes)]
+
+            # x^2 and y^2 in full precision
+            xx_full = Signal(signed(2 * bitwidth))
+            yy_full = Signal(signed(2 * bitwidth))
+            if self._multipliers == 3:
+                m.d.comb += [
+                    xx_full.eq(squares[0]),
+                    yy_full.eq(squares[1]),
+                ]
+
+            two_times_cross_products = [Signal(signed(bitwidth), name=f"two_times_cross_product{suffix}")
+                                        for suffix in suffixes]
 
-        m.d.comb += two_times_product.eq((factor1 * factor2) >> (scale - 1))
+            for n, (w, operand, square) in enumerate(zip(widths, operands, squares)):
+                squarer = PipelinedSquarer(width=w, stages=latency)
+                m.submodules[f"squarer_{n}"] = squarer
+                m.d.comb += [
+                    squarer.a_in.eq(operand),
+                    square.eq(squarer.square_out),
+                    two_times_products[n].eq(square >> (scale - 1)),
+                    two_times_cross_products[n].eq((square - xx_full - yy_full) >> scale),
+                ]
+
+            def issue(n, a, b):
+                return [operands[n].eq(a if a is b else a + b)]
+
+            def keep_square(n, full_square):
+                if self._multipliers == 3:
+                    return []
+                return [full_square.eq(squares[n])]
 
         if test:
             m.d.comb += [
@@ -94,58 +263,266 @@ class Mandelbrot(Elaboratable):
                 self.xx_plus_yy.eq(xx_plus_yy),
             ]
 
-        # processing pipleline
-        # here still used in a sequential manner
-        # to be made fully pipelined later
-        with m.If(stage_enable[0]):
-            # stage 0
+        # where this run of the pixel started
+        start_x         = Signal.like(x)
+        start_y         = Signal.like(y)
+        start_iteration = Signal(32)
+
+        if self._resumable:
             m.d.comb += [
-                factor1.eq(x),
-                factor2.eq(x),
+                self.x_out.eq(Mux(held, held_x, x)),
+                self.y_out.eq(Mux(held, held_y, y)),
+                start_x.eq(Mux(self.resume_in, self.x_in, self.cx_in)),
+                start_y.eq(Mux(self.resume_in, self.y_in, self.cy_in)),
+                start_iteration.eq(Mux(self.resume_in, self.iteration_in, 0)),
             ]
-            m.d.sync += [
-                xx.eq(two_times_product >> 1),
+        else:
+            m.d.comb += [
+                start_x.eq(self.cx_in),
+                start_y.eq(self.cy_in),
             ]
 
-        with m.If(stage_enable[1]):
-            # stage 1
+        # the factors go into the multipliers in stage n,
+        # their products are taken in stage n + latency
+        if self._multipliers == 1:
+            two_times_product, two_times_cross_product = two_times_products[0], two_times_cross_products[0]
+
+            # processing pipleline
+            # here still used in a sequential manner
+            # to be made fully pipelined later
+            with m.If(stage_enable[0]):
+                # stage 0
+                m.d.comb += issue(0, x, x)
+            with m.If(stage_enable[latency]):
+                m.d.sync += [
+                    xx.eq(two_times_product >> 1),
+                    *keep_square(0, xx_full),
+                ]
+
+            with m.If(stage_enable[1]):
+                # stage 1
+                m.d.comb += issue(0, y, y)
+            with m.If(stage_enable[latency + 1]):
+                m.d.sync += [
+                    yy.eq(two_times_product >> 1),
+                    *keep_square(0, yy_full),
+                ]
+
+            with m.If(stage_enable[2]):
+                # stage 2
+                m.d.comb += issue(0, x, y)
+            with m.If(stage_enable[latency + 2]):
+                m.d.sync += [
+                    two_xy.eq(two_times_cross_product),
+                    xx_plus_yy    .eq(xx + yy),
+                    xx_minus_yy   .eq(xx - yy),
+                ]
+
+            # the derivative is updated together with z
+            update = latency + (7 if self._distance_estimate else 3)
+            with m.If(stage_enable[update]):
+                # stage 3
+                m.d.sync += [
+                    x             .eq(xx_minus_yy   + self.cx_in),
+                    y             .eq(two_xy        + self.cy_in),
+                    escape        .eq(xx_plus_yy > four),
+                    iteration     .eq(iteration + 1),
+                    maxed_out     .eq(iteration >= self.max_iterations_in),
+                ]
+
+            if self._distance_estimate:
+                # dz' = 2z * dz + 1, its four products follow those of z
+                x_dx, y_dy, x_dy, y_dx = derivative_products = \
+                    [Signal(signed(bitwidth), name=name) for name in ("x_dx", "y_dy", "x_dy", "y_dx")]
+                for n, ((a, b), product) in enumerate(zip([(x, dx), (y, dy), (x, dy), (y, dx)], derivative_products)):
+                    with m.If(stage_enable[3 + n]):
+                        # stage 3 + n
+                        m.d.comb += issue(0, a, b)
+                    with m.If(stage_enable[latency + 3 + n]):
+                        m.d.sync += product.eq(two_times_product)
+
+                # dz is scaled down, so that it stays below two
+                next_dx     = Signal(signed(bitwidth))
+                next_dy     = Signal(signed(bitwidth))
+                magnitudes  = Signal(bitwidth)
+                renormalize = Signal(range(bitwidth - scale))
+                m.d.comb += [
+                    next_dx    .eq(x_dx - y_dy + (one >> dexp)),
+                    next_dy    .eq(x_dy + y_dx),
+                    magnitudes .eq(magnitude(next_dx) | magnitude(next_dy)),
+                ]
+                for bit in range(1, bitwidth - scale):
+                    with m.If(magnitudes[scale + bit]):
+                        m.d.comb += renormalize.eq(bit)
+
+                # the derivative at the escape is the one for the distance estimate
+                with m.If(stage_enable[update] & ~(xx_plus_yy > four)):
+                    m.d.sync += [
+                        dx   .eq(next_dx >> renormalize),
+                        dy   .eq(next_dy >> renormalize),
+                        dexp .eq(dexp + renormalize),
+                    ]
+
+        elif self._multipliers == 2:
+            # x*x and y*y in parallel, then x*y and the update
+            xx_plus_yy_now  = Signal(signed(bitwidth))
+            xx_minus_yy_now = Signal(signed(bitwidth))
             m.d.comb += [
-                factor1.eq(y),
-                factor2.eq(y),
-            ]
-            m.d.sync += [
-                yy.eq(two_times_product >> 1),
+                xx_plus_yy_now  .eq(xx + yy),
+                xx_minus_yy_now .eq(xx - yy),
             ]
 
-        with m.If(stage_enable[2]):
-            # stage 2
+            with m.If(stage_enable[0]):
+                # stage 0
+                m.d.comb += [
+                    *issue(0, x, x),
+                    *issue(1, y, y),
+                ]
+            with m.If(stage_enable[latency]):
+                m.d.sync += [
+                    xx.eq(two_times_products[0] >> 1),
+                    yy.eq(two_times_products[1] >> 1),
+                    *keep_square(0, xx_full),
+                    *keep_square(1, yy_full),
+                ]
+
+            with m.If(stage_enable[1]):
+                # stage 1
+                m.d.comb += issue(0, x, y)
+            with m.If(stage_enable[latency + 1]):
+                m.d.sync += [
+                    x             .eq(xx_minus_yy_now            + self.cx_in),
+                    y             .eq(two_times_cross_products[0] + self.cy_in),
+                    xx_plus_yy    .eq(xx_plus_yy_now),
+                    escape        .eq(xx_plus_yy_now > four),
+                    iteration     .eq(iteration + 1),
+                    maxed_out     .eq(iteration >= self.max_iterations_in),
+                ]
+
+        else:
+            # the whole iteration in one cycle
+            xx_now          = Signal(signed(bitwidth))
+            yy_now          = Signal(signed(bitwidth))
+            xx_plus_yy_now  = Signal(signed(bitwidth))
+            xx_minus_yy_now = Signal(signed(bitwidth))
             m.d.comb += [
-                factor1.eq(x),
-                factor2.eq(y),
-            ]
-            m.d.sync += [
-                two_xy.eq(two_times_product),
-                xx_plus_yy    .eq(xx + yy),
-                xx_minus_yy   .eq(xx - yy),
+                *issue(0, x, x),
+                *issue(1, y, y),
+                *issue(2, x, y),
+                xx_now          .eq(two_times_products[0] >> 1),
+                yy_now          .eq(two_times_products[1] >> 1),
+                xx_plus_yy_now  .eq(xx_now + yy_now),
+                xx_minus_yy_now .eq(xx_now - yy_now),
             ]
 
-        with m.If(stage_enable[3]):
-            # stage 3
-            m.d.sync += [
-                x             .eq(xx_minus_yy   + self.cx_in),
-                y             .eq(two_xy        + self.cy_in),
-                escape        .eq(xx_plus_yy > four),
-                iteration     .eq(iteration + 1),
-                maxed_out     .eq(iteration >= self.max_iterations_in),
+            with m.If(stage_enable[latency] & ~(escape | maxed_out)):
+                # stage 0
+                m.d.sync += [
+                    x             .eq(xx_minus_yy_now            + self.cx_in),
+                    y             .eq(two_times_cross_products[2] + self.cy_in),
+                    xx_plus_yy    .eq(xx_plus_yy_now),
+                    escape        .eq(xx_plus_yy_now > four),
+                    iteration     .eq(iteration + 1),
+                    maxed_out     .eq(iteration >= self.max_iterations_in),
+                ]
+
+        # periodicity check (Brent): z is saved at iterations 1, 2, 4, 8, ...
+        # if a later z comes back to the saved one, the orbit is in a cycle
+        # and will never escape, so the pixel is maxed right away
+        periodic   = Signal()
+        saved_x    = Signal.like(x)
+        saved_y    = Signal.like(y)
+        checkpoint = Signal(32)
+        first      = Signal(32)
+
+        if self._periodicity_check:
+            tolerance = self._periodicity_tolerance
+            if tolerance == 0:
+                m.d.comb += periodic.eq((x == saved_x) & (y == saved_y))
+            else:
+                # close enough counts as a cycle, which trades exactness for speed
+                diff_x = Signal(signed(bitwidth + 1))
+                diff_y = Signal(signed(bitwidth + 1))
+                m.d.comb += [
+                    diff_x.eq(x - saved_x),
+                    diff_y.eq(y - saved_y),
+                    periodic.eq(  (diff_x <= tolerance) & (diff_x >= -tolerance)
+                                & (diff_y <= tolerance) & (diff_y >= -tolerance)),
+                ]
+
+        # distance estimate |z| ln|z| / |dz| of an escaped pixel, as log2 of it,
+        # the logarithms use Mitchell's approximation, |dz| is max + min/2
+        F      = DISTANCE_FRACTION_BITS
+        log_zz = Signal(signed(16)) # log2 |z|^2
+        log_dz = Signal(signed(24)) # log2 |dz|
+
+        def log2(value):
+            # position of the leading one, followed by the bits below it
+            width      = len(value)
+            msb        = Signal(range(width))
+            shift      = Signal(range(width))
+            normalized = Signal(width)
+            for bit in range(1, width):
+                with m.If(value[bit]):
+                    m.d.comb += msb.eq(bit)
+            m.d.comb += [
+                shift.eq(width - 1 - msb),
+                normalized.eq(value << shift),
             ]
+            return Cat(normalized[width - 1 - F:width - 1], msb)
+
+        if self._distance_estimate:
+            dz_magnitude = Signal(bitwidth)
+            m.d.comb += dz_magnitude.eq(Mux(magnitude(dx) > magnitude(dy),
+                                            magnitude(dx) + (magnitude(dy) >> 1),
+                                            magnitude(dy) + (magnitude(dx) >> 1)))
+            log_zz_now   = log2(xx_plus_yy[:bitwidth])
+            log_dz_now   = log2(dz_magnitude)
+            log_log_z    = log2(log_zz[:15])
+
+        def finish():
+            m.d.comb += self.done_out.eq(1)
+            m.d.sync += finished.eq(1)
+            m.next = "IDLE"
+
+        # the second run of an escaping orbit, or a traced orbit
+        tracing = Signal()
+        tracer = self._trace or self._orbit_trace
+        if tracer:
+            with m.If(self.trace_ready_in):
+                m.d.sync += self.trace_valid_out.eq(0)
+
+        def advance(stage):
+            next_stage = f"S{(stage + 1) % cycles}"
+            if tracer and stage == cycles - 1:
+                # each new z is handed out, before the iteration goes on
+                with m.If(tracing):
+                    m.next = "EMIT"
+                with m.Else():
+                    m.next = next_stage
+            else:
+                m.next = next_stage
 
         with m.FSM() as fsm:
             m.d.comb += running.eq(~fsm.ongoing("IDLE"))
             with m.State("IDLE"):
+                with m.If(self.start_in & finished & ~self.result_read_in):
+                    m.d.sync += [
+                        held           .eq(1),
+                        held_iteration .eq(iteration),
+                        held_escape    .eq(escape),
+                        held_maxed     .eq(maxed_out),
+                        held_tag       .eq(tag),
+                        held_saved     .eq(saved),
+                        held_distance  .eq(distance),
+                        held_x         .eq(x),
+                        held_y         .eq(y),
+                    ]
+
                 with m.If(self.start_in):
                     m.d.sync += [
-                        x             .eq(self.cx_in),
-                        y             .eq(self.cy_in),
+                        x             .eq(start_x),
+                        y             .eq(start_y),
                         two_xy        .eq(0),
                         xx            .eq(0),
                         yy            .eq(0),
@@ -153,46 +530,787 @@ class Mandelbrot(Elaboratable):
 
                         escape                .eq(0),
                         maxed_out             .eq(0),
+                        iteration             .eq(start_iteration),
+                        finished              .eq(0),
+                        tag                   .eq(self.tag_in),
+                        result_read           .eq(0),
+                        saved                 .eq(0),
+
+                        saved_x               .eq(start_x),
+                        saved_y               .eq(start_y),
+                        checkpoint            .eq(start_iteration + 1),
+                        first                 .eq(start_iteration),
+
+                        dx                    .eq(one),
+                        dy                    .eq(0),
+                        dexp                  .eq(0),
+                        tracing               .eq(0),
+                    ]
+                    if self._orbit_trace:
+                        with m.If(self.trace_orbit_in):
+                            m.d.sync += tracing.eq(1)
+                            m.next = "EMIT"
+                        with m.Else():
+                            m.next = "S0"
+                    else:
+                        m.next = "S0"
+
+            for stage in range(cycles):
+                with m.State(f"S{stage}"):
+                    m.d.comb += stage_enable.eq(1 << stage)
+                    if stage == 0:
+                        with m.If(escape | maxed_out):
+                            if self._distance_estimate:
+                                with m.If(escape):
+                                    m.next = "DISTANCE"
+                                with m.Else():
+                                    finish()
+                            elif self._trace:
+                                with m.If(escape & ~maxed_out & ~tracing):
+                                    # run the orbit again from the start
+                                    m.d.sync += [
+                                        x          .eq(self.cx_in),
+                                        y          .eq(self.cy_in),
+                                        two_xy     .eq(0),
+                                        xx         .eq(0),
+                                        yy         .eq(0),
+                                        xx_plus_yy .eq(0),
+                                        escape     .eq(0),
+                                        iteration  .eq(0),
+                                        saved_x    .eq(self.cx_in),
+                                        saved_y    .eq(self.cy_in),
+                                        checkpoint .eq(1),
+                                        tracing    .eq(1),
+                                    ]
+                                    m.next = "EMIT"
+                                with m.Else():
+                                    finish()
+                            else:
+                                finish()
+                        with m.Elif(periodic & (iteration != first) & ~tracing):
+                            # report the same result as the full run
+                            m.d.comb += self.done_out.eq(1)
+                            m.d.sync += [
+                                finished                  .eq(1),
+                                maxed_out                 .eq(1),
+                                iteration                 .eq(self.max_iterations_in + 1),
+                                saved                     .eq(self.max_iterations_in + 1 - iteration),
+                            ]
+                            m.next = "IDLE"
+                        with m.Else():
+                            with m.If(iteration == checkpoint):
+                                m.d.sync += [
+                                    saved_x    .eq(x),
+                                    saved_y    .eq(y),
+                                    checkpoint .eq(checkpoint << 1),
+                                ]
+                            advance(stage)
+                    else:
+                        advance(stage)
+
+            if tracer:
+                with m.State("EMIT"):
+                    # the point, which escaped last, is not handed out
+                    with m.If(escape | maxed_out):
+                        m.next = "S0"
+                    with m.Elif(~self.trace_valid_out):
+                        m.d.sync += [
+                            self.trace_x_out     .eq(x),
+                            self.trace_y_out     .eq(y),
+                            self.trace_valid_out .eq(1),
+                        ]
+                        m.next = "S0"
+
+            if self._distance_estimate:
+                with m.State("DISTANCE"):
+                    m.d.sync += [
+                        log_zz .eq(log_zz_now - (scale << F)),
+                        log_dz .eq(log_dz_now - (scale << F) + (dexp << F)),
+                    ]
+                    m.next = "LOG_LOG"
+
+                with m.State("LOG_LOG"):
+                    # ln|z| = ln(2) * log2|z|
+                    m.d.sync += distance.eq(
+                        (log_zz >> 1) + log_log_z - ((F + 1) << F) + LOG2_LN2 - log_dz)
+                    finish()
+
+        return m
+
+class PipelinedMandelbrot(Elaboratable):
+    def __init__(self, *, bitwidth=128, fraction_bits=120, slots=4, multiplier_stages=0, squarers=False, tag_width=32):
+        assert slots >= 4 + multiplier_stages, "the pipeline needs four slots plus one per multiplier stage"
+
+        # Parameters
+        self._bitwidth = bitwidth
+        self._fraction_bits = fraction_bits
+        self._slots = slots
+        self._multiplier_stages = multiplier_stages
+        self._squarers = squarers
+        self._tag_width = tag_width
+
+        # Inputs
+        self.cx_in             = Signal(signed(bitwidth))
+        self.cy_in             = Signal(signed(bitwidth))
+        self.tag_in            = Signal(tag_width)
+        self.start_in          = Signal()
+        self.max_iterations_in = Signal(32)
+        self.result_read_in    = Signal()
+
+        # Outputs
+        self.busy_out          = Signal()
+        self.ready_out         = Signal()
+        self.escape_out        = Signal()
+        self.maxed_out         = Signal()
+        self.done_out          = Signal()
+        self.result_ready_out  = Signal()
+        self.iterations_out    = Signal(32)
+        self.tag_out           = Signal(tag_width)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        bitwidth = self._bitwidth
+        scale = self._fraction_bits
+
+        # state of one pixel, which travels around the pipeline ring
+        pixel_layout = [
+            ("valid",     1),
+            ("tag",       self._tag_width),
+            ("cx",        signed(bitwidth)),
+            ("cy",        signed(bitwidth)),
+            ("iteration", 32),
+            ("escape",    1),
+            ("maxed",     1),
+        ]
+        pixel_fields = [name for name, _ in pixel_layout]
+
+        def carry(dst, src):
+            return [dst[f].eq(src[f]) for f in pixel_fields]
+
+        z_layout       = pixel_layout + [("x",  signed(bitwidth)), ("y", signed(bitwidth))]
+        product_layout = pixel_layout + [
+            ("xx",     signed(bitwidth)),
+            ("yy",     signed(bitwidth)),
+            ("two_xy", signed(bitwidth)),
+        ]
+        sum_layout     = pixel_layout + [
+            ("xx_plus_yy",  signed(bitwidth)),
+            ("xx_minus_yy", signed(bitwidth)),
+            ("two_xy",      signed(bitwidth)),
+        ]
+
+        # pipeline stages, the update stage feeds back into the entry stage
+        latency   = self._multiplier_stages
+        entry     = Record(z_layout, name="entry")
+        # pixels travel alongside their factors through the multipliers
+        in_flight = [Record(pixel_layout, name=f"in_flight_{n}") for n in range(latency)]
+        products  = [Record(product_layout, name=f"product_{n}") for n in range(self._slots - 3 - latency)]
+        sums     = Record(sum_layout, name="sums")
+        update   = Record(z_layout, name="update")
+
+        # pixel waiting for a free slot in the ring
+        pending = Record(pixel_layout, name="pending")
+
+        four = Signal(signed(bitwidth))
+        m.d.comb += four.eq(Const(4, signed(bitwidth)) << scale)
+
+        m.d.comb += [
+            self.ready_out.eq(~pending.valid),
+            self.busy_out.eq(pending.valid | self.result_ready_out |
+                             Cat(entry.valid, *[p.valid for p in in_flight + products],
+                                 sums.valid, update.valid).any()),
+        ]
+
+        with m.If(self.start_in):
+            m.d.sync += [
+                pending.valid .eq(1),
+                pending.tag   .eq(self.tag_in),
+                pending.cx    .eq(self.cx_in),
+                pending.cy    .eq(self.cy_in),
+            ]
+
+        # entry stage: retire finished pixels and fill empty slots
+        finished = Signal()
+        retire   = Signal()
+        free     = Signal()
+        m.d.comb += [
+            finished.eq(update.valid & (update.escape | update.maxed)),
+            retire.eq(finished & (~self.result_ready_out | self.result_read_in)),
+            free.eq(~update.valid | retire),
+        ]
+
+        with m.If(self.result_read_in):
+            m.d.sync += self.result_ready_out.eq(0)
+
+        with m.If(retire):
+            m.d.comb += self.done_out.eq(1)
+            m.d.sync += [
+                self.result_ready_out .eq(1),
+                self.iterations_out   .eq(update.iteration),
+                self.escape_out       .eq(update.escape),
+                self.maxed_out        .eq(update.maxed),
+                self.tag_out          .eq(update.tag),
+            ]
+
+        with m.If(free & pending.valid):
+            m.d.sync += [
+                *carry(entry, pending),
+                entry.x         .eq(pending.cx),
+                entry.y         .eq(pending.cy),
+                entry.iteration .eq(0),
+                entry.escape    .eq(0),
+                entry.maxed     .eq(0),
+                pending.valid   .eq(0),
+            ]
+        with m.Elif(free):
+            m.d.sync += entry.valid.eq(0)
+        with m.Else():
+            # finished pixels, which cannot be retired yet, stay in the ring
+            m.d.sync += entry.eq(update)
+
+        # product stage: all three products of the iteration at once
+        # the products have one bit more than necessary
+        # because we want to preserve the bit of precision
+        # for the factor 2xy
+        two_times_xx = Signal(signed(bitwidth))
+        two_times_yy = Signal(signed(bitwidth))
+        two_times_xy = Signal(signed(bitwidth))
+
+        if self._squarers:
+            # 2xy = (x + y)^2 - x^2 - y^2
+            x_plus_y = Signal(signed(bitwidth + 1))
+            m.d.comb += x_plus_y.eq(entry.x + entry.y)
+
+            squares = []
+            for name, operand in [("xx", entry.x), ("yy", entry.y), ("x_plus_y", x_plus_y)]:
+                squarer = PipelinedSquarer(width=len(operand), stages=latency)
+                m.submodules[f"squarer_{name}"] = squarer
+                m.d.comb += squarer.a_in.eq(operand)
+                squares.append(squarer.square_out)
+
+            square_xx, square_yy, square_x_plus_y = squares
+            m.d.comb += [
+                two_times_xx.eq(square_xx >> (scale - 1)),
+                two_times_yy.eq(square_yy >> (scale - 1)),
+                two_times_xy.eq((square_x_plus_y - square_xx - square_yy) >> scale),
+            ]
+
+        else:
+            factors = [
+                (two_times_xx, entry.x, entry.x),
+                (two_times_yy, entry.y, entry.y),
+                (two_times_xy, entry.x, entry.y),
+            ]
+            for name, (product, a, b) in zip(["xx", "yy", "xy"], factors):
+                if latency > 0:
+                    multiplier = PipelinedMultiplier(width=bitwidth, stages=latency)
+                    m.submodules[f"multiplier_{name}"] = multiplier
+                    m.d.comb += [
+                        multiplier.a_in.eq(a),
+                        multiplier.b_in.eq(b),
+                        product.eq(multiplier.product_out >> (scale - 1)),
+                    ]
+                else:
+                    m.d.comb += product.eq((a * b) >> (scale - 1))
+
+        for previous, current in zip([entry] + in_flight, in_flight):
+            m.d.sync += carry(current, previous)
+
+        multiplied = (in_flight or [entry])[-1]
+        m.d.sync += [
+            *carry(products[0], multiplied),
+            products[0].xx     .eq(two_times_xx >> 1),
+            products[0].yy     .eq(two_times_yy >> 1),
+            products[0].two_xy .eq(two_times_xy),
+        ]
+
+        # additional slots are plain registers after the multipliers,
+        # which synthesis can retime into the multiplier
+        for previous, product in zip(products, products[1:]):
+            m.d.sync += product.eq(previous)
+
+        # sum stage
+        product = products[-1]
+        m.d.sync += [
+            *carry(sums, product),
+            sums.xx_plus_yy  .eq(product.xx + product.yy),
+            sums.xx_minus_yy .eq(product.xx - product.yy),
+            sums.two_xy      .eq(product.two_xy),
+        ]
+
+        # update stage
+        m.d.sync += carry(update, sums)
+        with m.If(sums.valid & ~(sums.escape | sums.maxed)):
+            m.d.sync += [
+                update.x         .eq(sums.xx_minus_yy + sums.cx),
+                update.y         .eq(sums.two_xy      + sums.cy),
+                update.escape    .eq(sums.xx_plus_yy > four),
+                update.iteration .eq(sums.iteration + 1),
+                update.maxed     .eq(sums.iteration >= self.max_iterations_in),
+            ]
+
+        return m
+
+class MultiLimbMandelbrot(Elaboratable):
+    """ iterates over fixed point numbers of max_limbs limbs,
+        with the integer part in the top limb. Only the upper limbs_in limbs
+        are used, so the precision can be chosen per pixel, and a shallow
+        zoom does not pay for the precision of a deep one """
+    def __init__(self, *, limb_width=32, max_limbs=4, tag_width=32):
+        # Parameters
+        self._limb_width = limb_width
+        self._max_limbs = max_limbs
+        bitwidth = limb_width * max_limbs
+
+        # Inputs
+        self.cx_in             = Signal(signed(bitwidth))
+        self.cy_in             = Signal(signed(bitwidth))
+        self.limbs_in          = Signal(range(max_limbs + 1))
+        self.tag_in            = Signal(tag_width)
+        self.start_in          = Signal()
+        self.max_iterations_in = Signal(32)
+        self.result_read_in    = Signal()
+
+        # Outputs
+        self.busy_out          = Signal()
+        self.ready_out         = Signal()
+        self.escape_out        = Signal()
+        self.maxed_out         = Signal()
+        self.done_out          = Signal()
+        self.result_ready_out  = Signal()
+        self.iterations_out    = Signal(32)
+        self.tag_out           = Signal(tag_width)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        w         = self._limb_width
+        max_limbs = self._max_limbs
+        bitwidth  = w * max_limbs
+        scale     = bitwidth - w
+
+        m.submodules.multiplier = multiplier = LimbSerialMultiplier(limb_width=w, max_limbs=max_limbs)
+
+        running     = Signal()
+        result_read = Signal(reset=1)
+        iteration   = Signal(32)
+        limbs       = Signal.like(self.limbs_in)
+
+        cx          = Signal(signed(bitwidth))
+        cy          = Signal(signed(bitwidth))
+        x           = Signal(signed(bitwidth))
+        y           = Signal(signed(bitwidth))
+        xx          = Signal(signed(bitwidth))
+        yy          = Signal(signed(bitwidth))
+        escape      = Signal()
+        maxed       = Signal()
+
+        four = Signal(signed(bitwidth))
+        # clears the limbs, which are not in use
+        mask = Array([Const(((1 << bitwidth) - 1) ^ ((1 << (n * w)) - 1), bitwidth) for n in range(max_limbs)])
+
+        m.d.comb += [
+            self.busy_out.eq(running | ~result_read),
+            self.ready_out.eq(~self.busy_out),
+            self.iterations_out.eq(iteration),
+            self.escape_out.eq(escape),
+            self.maxed_out.eq(maxed),
+            four.eq(Const(4, signed(bitwidth)) << scale),
+            multiplier.limbs_in.eq(limbs),
+        ]
+
+        with m.If(self.result_read_in):
+            m.d.sync += [
+                result_read.eq(1),
+                self.result_ready_out.eq(0),
+                maxed.eq(0),
+                escape.eq(0),
+                iteration.eq(0),
+            ]
+
+        def multiply(a, b):
+            return [
+                multiplier.a_in.eq(a),
+                multiplier.b_in.eq(b),
+                multiplier.start_in.eq(1),
+            ]
+
+        with m.FSM() as fsm:
+            m.d.comb += running.eq(~fsm.ongoing("IDLE"))
+            with m.State("IDLE"):
+                with m.If(self.start_in):
+                    low = max_limbs - self.limbs_in
+                    m.d.sync += [
+                        cx                    .eq(self.cx_in & mask[low]),
+                        cy                    .eq(self.cy_in & mask[low]),
+                        x                     .eq(self.cx_in & mask[low]),
+                        y                     .eq(self.cy_in & mask[low]),
+                        limbs                 .eq(self.limbs_in),
+                        escape                .eq(0),
+                        maxed                 .eq(0),
                         iteration             .eq(0),
                         self.result_ready_out .eq(0),
+                        self.tag_out          .eq(self.tag_in),
                         result_read           .eq(0),
                     ]
-                    m.next = "S0"
+                    m.next = "CHECK"
 
-            with m.State("S0"):
-                m.d.comb += stage_enable.eq(1)
-                with m.If(escape | maxed_out):
+            with m.State("CHECK"):
+                with m.If(escape | maxed):
                     m.d.comb += self.done_out.eq(1)
                     m.d.sync += self.result_ready_out.eq(1)
                     m.next = "IDLE"
                 with m.Else():
-                    m.next = "S1"
+                    m.d.comb += multiply(x, x)
+                    m.next = "XX"
+
+            with m.State("XX"):
+                with m.If(multiplier.done_out):
+                    m.d.sync += xx.eq(multiplier.product_out)
+                    m.next = "YY_START"
+
+            with m.State("YY_START"):
+                m.d.comb += multiply(y, y)
+                m.next = "YY"
 
-            with m.State("S1"):
-                m.d.comb += stage_enable.eq(1 << 1)
-                m.next = "S2"
+            with m.State("YY"):
+                with m.If(multiplier.done_out):
+                    m.d.sync += yy.eq(multiplier.product_out)
+                    m.next = "XY_START"
 
-            with m.State("S2"):
-                m.d.comb += stage_enable.eq(1 << 2)
-                m.next = "S3"
+            with m.State("XY_START"):
+                # 2xy is rounded down as a whole, like in the other cores
+                m.d.comb += multiply(x, y << 1)
+                m.next = "XY"
 
-            with m.State("S3"):
-                m.d.comb += stage_enable.eq(1 << 3)
-                m.next = "S0"
+            with m.State("XY"):
+                with m.If(multiplier.done_out):
+                    m.d.sync += [
+                        x         .eq(xx - yy + cx),
+                        y         .eq(multiplier.product_out + cy),
+                        escape    .eq((xx + yy) > four),
+                        iteration .eq(iteration + 1),
+                        maxed     .eq(iteration >= self.max_iterations_in),
+                    ]
+                    m.next = "CHECK"
 
         return m
 
+class PerturbationMandelbrot(Elaboratable):
+    """ iterates the difference d of the pixel to a reference orbit Z, which
+        the host has computed in high precision: d' = (2Z + d) * d + dc.
+        d and dc are scaled up by 2^exponent_in, so they keep their precision
+        in deep zooms. When d grows, it is scaled back down step by step.
+        Pixels, which come too close to zero compared to the reference
+        or outlive it, are marked as glitched, the host has to compute
+        them again with another reference """
+    def __init__(self, *, bitwidth=64, fraction_bits=56, orbit_depth=4096,
+                 glitch_bits=10, renormalize_bits=4, tag_width=32):
+        # Parameters
+        self._bitwidth = bitwidth
+        self._fraction_bits = fraction_bits
+        self._glitch_bits = glitch_bits
+        self._renormalize_bits = renormalize_bits
+
+        # Inputs
+        self.cx_in             = Signal(signed(bitwidth))
+        self.cy_in             = Signal(signed(bitwidth))
+        self.exponent_in       = Signal(8)
+        self.tag_in            = Signal(tag_width)
+        self.start_in          = Signal()
+        self.max_iterations_in = Signal(32)
+        self.result_read_in    = Signal()
+
+        # reference orbit, the entry at the address appears one clock later
+        self.orbit_length_in   = Signal(range(orbit_depth + 1))
+        self.orbit_x_in        = Signal(signed(bitwidth))
+        self.orbit_y_in        = Signal(signed(bitwidth))
+        self.orbit_address_out = Signal(range(orbit_depth))
+
+        # Outputs
+        self.busy_out          = Signal()
+        self.ready_out         = Signal()
+        self.escape_out        = Signal()
+        self.maxed_out         = Signal()
+        self.glitch_out        = Signal()
+        self.done_out          = Signal()
+        self.result_ready_out  = Signal()
+        self.iterations_out    = Signal(32)
+        self.tag_out           = Signal(tag_width)
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        bitwidth = self._bitwidth
+        scale    = self._fraction_bits
+
+        running     = Signal()
+        result_read = Signal(reset=1)
+        iteration   = Signal(32)
+
+        # the difference to the reference and dc, scaled up by 2^exponent
+        dx          = Signal(signed(bitwidth))
+        dy          = Signal(signed(bitwidth))
+        dcx         = Signal(signed(bitwidth))
+        dcy         = Signal(signed(bitwidth))
+        exponent    = Signal(8)
+        # how far d has been scaled down since the start
+        dc_shift    = Signal(8)
+
+        # z = Z + d and 2Z + d, unscaled
+        zx          = Signal(signed(bitwidth))
+        zy          = Signal(signed(bitwidth))
+        tx          = Signal(signed(bitwidth))
+        ty          = Signal(signed(bitwidth))
+
+        escape      = Signal()
+        maxed       = Signal()
+        glitch      = Signal()
+        small       = Signal()
+
+        four = Signal(signed(bitwidth))
+        one  = Const(1 << scale, signed(bitwidth))
+
+        m.d.comb += [
+            self.busy_out.eq(running | ~result_read),
+            self.ready_out.eq(~self.busy_out),
+            self.iterations_out.eq(iteration),
+            self.escape_out.eq(escape),
+            self.maxed_out.eq(maxed),
+            self.glitch_out.eq(glitch),
+            self.orbit_address_out.eq(iteration),
+            four.eq(Const(4, signed(bitwidth)) << scale),
+        ]
+
+        with m.If(self.result_read_in):
+            m.d.sync += [
+                result_read.eq(1),
+                self.result_ready_out.eq(0),
+                maxed.eq(0),
+                escape.eq(0),
+                glitch.eq(0),
+                iteration.eq(0),
+            ]
+
+        # one multiplier, shared by the six products of an iteration
+        factor1 = Signal(signed(bitwidth))
+        factor2 = Signal(signed(bitwidth))
+        product = Signal(signed(bitwidth))
+        m.d.comb += product.eq((factor1 * factor2) >> scale)
+
+        factors  = [(zx, zx), (zy, zy), (tx, dx), (ty, dy), (tx, dy), (ty, dx)]
+        products = [Signal(signed(bitwidth), name=f"product_{n}") for n in range(len(factors))]
+        zxx, zyy, txdx, tydy, txdy, tydx = products
+
+        zx_now = Signal(signed(bitwidth))
+        zy_now = Signal(signed(bitwidth))
+        m.d.comb += [
+            zx_now.eq(self.orbit_x_in + (dx >> exponent)),
+            zy_now.eq(self.orbit_y_in + (dy >> exponent)),
+        ]
+
+        def magnitude(v):
+            return Mux(v < 0, -v, v)
+
+        # the maximum norm is good enough to find glitches
+        def norm(x, y):
+            return Mux(magnitude(x) > magnitude(y), magnitude(x), magnitude(y))
+
+        # the new d, scaled down if it has grown too large
+        next_dx       = Signal(signed(bitwidth))
+        next_dy       = Signal(signed(bitwidth))
+        renormalize   = Signal(range(self._renormalize_bits + 1))
+        m.d.comb += [
+            next_dx.eq(txdx - tydy + (dcx >> dc_shift)),
+            next_dy.eq(txdy + tydx + (dcy >> dc_shift)),
+        ]
+        with m.If((exponent != 0) & (  (next_dx >= one) | (next_dx <= -one)
+                                     | (next_dy >= one) | (next_dy <= -one))):
+            m.d.comb += renormalize.eq(Mux(exponent > self._renormalize_bits, self._renormalize_bits, exponent))
+
+        with m.FSM() as fsm:
+            m.d.comb += running.eq(~fsm.ongoing("IDLE"))
+            with m.State("IDLE"):
+                with m.If(self.start_in):
+                    m.d.sync += [
+                        dx                    .eq(self.cx_in),
+                        dy                    .eq(self.cy_in),
+                        dcx                   .eq(self.cx_in),
+                        dcy                   .eq(self.cy_in),
+                        exponent              .eq(self.exponent_in),
+                        dc_shift              .eq(0),
+                        escape                .eq(0),
+                        maxed                 .eq(0),
+                        glitch                .eq(0),
+                        iteration             .eq(0),
+                        self.result_ready_out .eq(0),
+                        self.tag_out          .eq(self.tag_in),
+                        result_read           .eq(0),
+                    ]
+                    m.next = "CHECK"
+
+            with m.State("CHECK"):
+                with m.If(escape | maxed | glitch | (iteration >= self.orbit_length_in)):
+                    m.d.comb += self.done_out.eq(1)
+                    m.d.sync += [
+                        self.result_ready_out.eq(1),
+                        glitch.eq(~(escape | maxed)),
+                    ]
+                    m.next = "IDLE"
+                with m.Else():
+                    m.next = "Z"
+
+            with m.State("Z"):
+                m.d.sync += [
+                    zx    .eq(zx_now),
+                    zy    .eq(zy_now),
+                    tx    .eq(zx_now + self.orbit_x_in),
+                    ty    .eq(zy_now + self.orbit_y_in),
+                    small .eq(norm(zx_now, zy_now) < (norm(self.orbit_x_in, self.orbit_y_in) >> self._glitch_bits)),
+                ]
+                m.next = "P0"
+
+            for n, ((a, b), p) in enumerate(zip(factors, products)):
+                with m.State(f"P{n}"):
+                    m.d.comb += [
+                        factor1.eq(a),
+                        factor2.eq(b),
+                    ]
+                    m.d.sync += p.eq(product)
+                    m.next = f"P{n + 1}" if n + 1 < len(factors) else "UPDATE"
+
+            with m.State("UPDATE"):
+                m.d.sync += [
+                    dx        .eq(next_dx >> renormalize),
+                    dy        .eq(next_dy >> renormalize),
+                    exponent  .eq(exponent - renormalize),
+                    dc_shift  .eq(dc_shift + renormalize),
+                    escape    .eq((zxx + zyy) > four),
+                    glitch    .eq(small),
+                    iteration .eq(iteration + 1),
+                    maxed     .eq(iteration >= self.max_iterations_in),
+                ]
+                m.next = "CHECK"
+
+        return m
+
+def mandelbrot_reference(cx, cy, max_iterations, scale):
+    """ computes (iterations, escape, maxed) of one pixel the same way the cores do """
+    x, y, iteration = cx, cy, 0
+    while True:
+        xx = (x * x) >> scale
+        yy = (y * y) >> scale
+        escape = (xx + yy) > (4 << scale)
+        maxed  = iteration >= max_iterations
+        x, y = xx - yy + cx, ((x * y) >> (scale - 1)) + cy
+        iteration += 1
+        if escape or maxed:
+            return iteration, int(escape), int(maxed)
+
+def log2_approximation(value):
+    """ log2 of value the way the distance estimate computes it """
+    F = DISTANCE_FRACTION_BITS
+    msb = max(value.bit_length() - 1, 0)
+    return (msb << F) | (((value << F) >> msb) & ((1 << F) - 1))
+
+def distance_reference(cx, cy, max_iterations, scale):
+    """ computes (iterations, escape, maxed, distance) of one pixel the same way the cores do,
+        distance is the estimate for escaped pixels as log2 with DISTANCE_FRACTION_BITS fraction bits """
+    F = DISTANCE_FRACTION_BITS
+    one = 1 << scale
+    x, y, iteration = cx, cy, 0
+    dx, dy, dexp = one, 0, 0
+    while True:
+        xx = (x * x) >> scale
+        yy = (y * y) >> scale
+        escape = (xx + yy) > (4 << scale)
+        maxed  = iteration >= max_iterations
+        if not escape:
+            next_dx = ((x * dx) >> (scale - 1)) - ((y * dy) >> (scale - 1)) + (one >> dexp)
+            next_dy = ((x * dy) >> (scale - 1)) + ((y * dx) >> (scale - 1))
+            renormalize = max((abs(next_dx) | abs(next_dy)).bit_length() - scale - 1, 0)
+            dx, dy, dexp = next_dx >> renormalize, next_dy >> renormalize, dexp + renormalize
+        x, y = xx - yy + cx, ((x * y) >> (scale - 1)) + cy
+        iteration += 1
+        if escape or maxed:
+            distance = None
+            if escape:
+                dz = max(abs(dx), abs(dy)) + (min(abs(dx), abs(dy)) >> 1)
+                log_zz = log2_approximation(xx + yy) - (scale << F)
+                log_dz = log2_approximation(dz) - (scale << F) + (dexp << F)
+                distance = (log_zz >> 1) + log2_approximation(log_zz) - ((F + 1) << F) + LOG2_LN2 - log_dz
+            return iteration, int(escape), int(maxed), distance
+
+def traced_orbit(cx, cy, max_iterations, scale):
+    """ the points z_1 ... z_n, which a core hands out for a pixel started with trace_orbit_in """
+    iterations, escape, maxed = mandelbrot_reference(cx, cy, max_iterations, scale)
+    x, y = cx, cy
+    orbit = []
+    for _ in range(iterations):
+        orbit.append((x, y))
+        x, y = ((x * x) >> scale) - ((y * y) >> scale) + cx, ((x * y) >> (scale - 1)) + cy
+    return orbit
+
+def escape_orbit(cx, cy, max_iterations, scale):
+    """ the points z_1 ... z_n, which a tracing core hands out for the pixel,
+        only escaping pixels are traced """
+    iterations, escape, maxed = mandelbrot_reference(cx, cy, max_iterations, scale)
+    if maxed:
+        return []
+    return traced_orbit(cx, cy, max_iterations, scale)
+
+def perturbation_reference(dcx, dcy, exponent, orbit, max_iterations, scale, glitch_bits=10, renormalize_bits=4):
+    """ computes (iterations, escape, maxed, glitch) of one pixel the same way PerturbationMandelbrot does """
+    one = 1 << scale
+    dx, dy, e = dcx, dcy, exponent
+    iteration, escape, maxed, glitch = 0, 0, 0, 0
+    while True:
+        if escape or maxed:
+            return iteration, escape, maxed, 0
+        if glitch or iteration >= len(orbit):
+            return iteration, 0, 0, 1
+        X, Y = orbit[iteration]
+        zx, zy = X + (dx >> e), Y + (dy >> e)
+        tx, ty = zx + X, zy + Y
+        glitch = int(max(abs(zx), abs(zy)) < (max(abs(X), abs(Y)) >> glitch_bits))
+        escape = int(((zx * zx) >> scale) + ((zy * zy) >> scale) > (4 << scale))
+        maxed  = int(iteration >= max_iterations)
+        dx, dy = (((tx * dx) >> scale) - ((ty * dy) >> scale) + (dcx >> (exponent - e)),
+                  ((tx * dy) >> scale) + ((ty * dx) >> scale) + (dcy >> (exponent - e)))
+        if e > 0 and (abs(dx) >= one or abs(dy) >= one):
+            shift = min(e, renormalize_bits)
+            dx, dy, e = dx >> shift, dy >> shift, e - shift
+        iteration += 1
+
+def reference_orbit(cx, cy, max_iterations, scale, precision):
+    """ the orbit of (cx, cy), which have precision fraction bits, with scale fraction bits """
+    x, y = cx, cy
+    orbit = []
+    for _ in range(max_iterations + 1):
+        orbit.append((x >> (precision - scale), y >> (precision - scale)))
+        xx = (x * x) >> precision
+        yy = (y * y) >> precision
+        if xx + yy > (4 << precision):
+            break
+        x, y = xx - yy + cx, ((x * y) >> (precision - 1)) + cy
+    return orbit
+
 class MandelbrotTest(GatewareTestCase):
     FRAGMENT_UNDER_TEST = Mandelbrot
     FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'test': True}
 
+    def wait_for_iteration(self, dut, iteration):
+        while (yield dut.iterations_out) < iteration:
+            yield
+        self.assertEqual((yield dut.iterations_out), iteration)
+
     def iterate_mandel(self, scale, dut, start_x, start_y, check=True):
         print("=================> mandel start")
         x = start_x
         y = start_y
         done = 0
-        yield from self.advance_cycles(4)
+        iteration = 0
         while done == 0:
+            iteration += 1
+            yield from self.wait_for_iteration(dut, iteration)
             x_new = ((x * x) >> scale) - ((y * y) >> scale) + start_x
             y_new = ((x * y) >> (scale - 1)) + start_y
             x = x_new
@@ -203,10 +1321,13 @@ class MandelbrotTest(GatewareTestCase):
             if check:
                 self.assertEqual(dut_x, x)
                 self.assertEqual(dut_y, y)
-            yield from self.advance_cycles(4)
             done = (yield dut.maxed_out) | (yield dut.escape_out)
 
         self.assertEqual(done, 1)
+        max_iterations = (yield dut.max_iterations_in)
+        result = ((yield dut.iterations_out), (yield dut.escape_out), (yield dut.maxed_out))
+        self.assertEqual(result, mandelbrot_reference(start_x, start_y, max_iterations, scale))
+        yield from self.wait_until(dut.result_ready_out)
         yield dut.result_read_in.eq(1)
         yield
         yield dut.result_read_in.eq(0)
@@ -223,27 +1344,24 @@ class MandelbrotTest(GatewareTestCase):
         yield dut.max_iterations_in.eq(110)
         yield
         yield from self.pulse(dut.start_in)
-        yield
-        yield
 
         self.assertEqual((yield dut.x), start_x)
-        yield from self.advance_cycles(4)
+        yield from self.wait_for_iteration(dut, 1)
 
         # 1 * 1 + 1 = 2
         first_iter = start_x + start_x
         self.assertEqual((yield dut.x), first_iter)
-        yield from self.advance_cycles(4)
+        yield from self.wait_for_iteration(dut, 2)
 
         # 2 * 2 + 1 = 5
         second_iter = (first_iter * first_iter >> scale) + start_x
         self.assertEqual((yield dut.x), second_iter)
-        yield
-        yield
-        self.assertGreater((yield dut.xx_plus_yy), 4 << scale)
-        yield from self.advance_cycles(4)
+        yield from self.wait_for_iteration(dut, 3)
 
+        self.assertGreater((yield dut.xx_plus_yy), 4 << scale)
         self.assertEqual((yield dut.escape_out), 1)
 
+        yield from self.wait_until(dut.result_ready_out)
         yield dut.result_read_in.eq(1)
         yield
         yield dut.result_read_in.eq(0)
@@ -254,8 +1372,7 @@ class MandelbrotTest(GatewareTestCase):
         yield dut.cx_in.eq(start_x)
         yield dut.cy_in.eq(start_y)
         yield
-        yield from self.pulse(dut.start_in)
-        yield
+        yield from self.pulse(dut.start_in, step_after=False)
         yield from self.iterate_mandel(scale, dut, start_x, start_y)
 
         yield
@@ -266,8 +1383,7 @@ class MandelbrotTest(GatewareTestCase):
         yield dut.cx_in.eq(start_x)
         yield dut.cy_in.eq(start_y)
         yield
-        yield from self.pulse(dut.start_in)
-        yield
+        yield from self.pulse(dut.start_in, step_after=False)
         yield from self.iterate_mandel(scale, dut, start_x, start_y)
 
         yield
@@ -278,9 +1394,377 @@ class MandelbrotTest(GatewareTestCase):
         yield dut.cx_in.eq(start_x)
         yield dut.cy_in.eq(start_y)
         yield
-        yield from self.pulse(dut.start_in)
-        yield
+        yield from self.pulse(dut.start_in, step_after=False)
         yield from self.iterate_mandel(scale, dut, start_x, start_y)
         yield
         self.assertEqual((yield dut.result_ready_out), 0)
         yield
+
+class MandelbrotTwoMultipliersTest(MandelbrotTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'multipliers': 2, 'test': True}
+
+class MandelbrotThreeMultipliersTest(MandelbrotTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'multipliers': 3, 'test': True}
+
+class MandelbrotPipelinedMultiplierTest(MandelbrotTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'multiplier_stages': 2, 'test': True}
+
+class MandelbrotSquarerTest(MandelbrotTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'squarers': True, 'test': True}
+
+class MandelbrotTwoSquarersTest(MandelbrotTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'multipliers': 2, 'squarers': True, 'test': True}
+
+class MandelbrotThreeSquarersTest(MandelbrotTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'multipliers': 3, 'squarers': True, 'test': True}
+
+class MandelbrotDoubleBufferTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = Mandelbrot
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56}
+
+    @sync_test_case
+    def test_basic(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        dut = self.dut
+        max_iterations = 20
+        one = 1 << scale
+        first, second = (-2 * one, one), (one >> 2, one >> 1)
+        yield dut.max_iterations_in.eq(max_iterations)
+
+        yield dut.cx_in.eq(first[0])
+        yield dut.cy_in.eq(first[1])
+        yield dut.tag_in.eq(1)
+        yield from self.pulse(dut.start_in)
+        yield from self.wait_until(dut.result_ready_out)
+
+        # the core takes the next pixel, while its result waits
+        self.assertEqual((yield dut.ready_out), 1)
+        yield dut.cx_in.eq(second[0])
+        yield dut.cy_in.eq(second[1])
+        yield dut.tag_in.eq(2)
+        yield from self.pulse(dut.start_in)
+        yield
+        self.assertEqual((yield dut.ready_out), 0)
+
+        for tag, (cx, cy) in enumerate([first, second], start=1):
+            yield from self.wait_until(dut.result_ready_out)
+            result = ((yield dut.iterations_out), (yield dut.escape_out), (yield dut.maxed_out))
+            self.assertEqual((yield dut.tag_out), tag)
+            self.assertEqual(result, mandelbrot_reference(cx, cy, max_iterations, scale))
+            yield from self.pulse(dut.result_read_in)
+
+        self.assertEqual((yield dut.result_ready_out), 0)
+        self.assertEqual((yield dut.busy_out), 0)
+
+class MandelbrotPeriodicityTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = Mandelbrot
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'multipliers': 3, 'periodicity_check': True}
+
+    @sync_test_case
+    def test_basic(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        dut = self.dut
+        max_iterations = 1000
+        one = 1 << scale
+        points = [
+            (0, 0), (-one, 0), (one, 0), (one >> 1, 0),
+            (-(one >> 3), one >> 3), (-(one >> 1), one >> 2), (-(one + (one >> 3)), one >> 4),
+        ]
+        yield dut.max_iterations_in.eq(max_iterations)
+        yield
+
+        total_saved = 0
+        for cx, cy in points:
+            yield dut.cx_in.eq(cx)
+            yield dut.cy_in.eq(cy)
+            yield from self.pulse(dut.start_in)
+            yield from self.wait_until(dut.result_ready_out)
+
+            result = ((yield dut.iterations_out), (yield dut.escape_out), (yield dut.maxed_out))
+            saved = (yield dut.saved_iterations_out)
+            print(f"pixel ({hex(cx)}, {hex(cy)}): {result}, {saved} iterations saved")
+            self.assertEqual(result, mandelbrot_reference(cx, cy, max_iterations, scale))
+            if result[1]:
+                self.assertEqual(saved, 0)
+            total_saved += saved
+
+            yield from self.pulse(dut.result_read_in)
+
+        # z = 0 is a fixed point, which is found after the first iteration
+        self.assertGreater(total_saved, max_iterations)
+
+class MandelbrotResumeTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = Mandelbrot
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'multipliers': 2, 'resumable': True}
+
+    @sync_test_case
+    def test_basic(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        dut = self.dut
+        one = 1 << scale
+        points = [
+            (-(3 * one >> 2), one >> 4), (-(3 * one >> 2), one >> 5),
+            ((one >> 2) + (one >> 6), 0), (-(one + (one >> 2) + (one >> 4)), one >> 5),
+        ]
+        first_limit, second_limit = 16, 500
+
+        for cx, cy in points:
+            yield dut.cx_in.eq(cx)
+            yield dut.cy_in.eq(cy)
+            yield dut.max_iterations_in.eq(first_limit)
+            yield from self.pulse(dut.start_in)
+            yield from self.wait_until(dut.result_ready_out)
+            self.assertEqual((yield dut.maxed_out), 1)
+            x, y, iteration = (yield dut.x_out), (yield dut.y_out), (yield dut.iterations_out)
+            yield from self.pulse(dut.result_read_in)
+
+            # continue from the final z with the higher limit
+            yield dut.x_in.eq(x)
+            yield dut.y_in.eq(y)
+            yield dut.iteration_in.eq(iteration)
+            yield dut.resume_in.eq(1)
+            yield dut.max_iterations_in.eq(second_limit)
+            yield from self.pulse(dut.start_in)
+            yield dut.resume_in.eq(0)
+            yield from self.wait_until(dut.result_ready_out)
+
+            result = ((yield dut.iterations_out), (yield dut.escape_out), (yield dut.maxed_out))
+            print(f"pixel ({hex(cx)}, {hex(cy)}): resumed at {iteration}, {result}")
+            self.assertEqual(result, mandelbrot_reference(cx, cy, second_limit, scale))
+            yield from self.pulse(dut.result_read_in)
+
+class MandelbrotDistanceTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = Mandelbrot
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'distance_estimate': True}
+
+    @sync_test_case
+    def test_basic(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        dut = self.dut
+        max_iterations = 200
+        random = Random(0)
+        points = [(0, 0), (-(3 << (scale - 2)), 1 << (scale - 5))] + \
+                 [(random.randrange(-2 << scale, 1 << (scale - 1)), random.randrange(-1 << scale, 1 << scale))
+                  for _ in range(10)]
+        yield dut.max_iterations_in.eq(max_iterations)
+        yield
+
+        for cx, cy in points:
+            yield dut.cx_in.eq(cx)
+            yield dut.cy_in.eq(cy)
+            yield from self.pulse(dut.start_in)
+            yield from self.wait_until(dut.result_ready_out)
+
+            result = ((yield dut.iterations_out), (yield dut.escape_out), (yield dut.maxed_out))
+            iterations, escape, maxed, distance = distance_reference(cx, cy, max_iterations, scale)
+            print(f"pixel ({hex(cx)}, {hex(cy)}): {result}, distance 2^{(yield dut.distance_out) / (1 << DISTANCE_FRACTION_BITS)}")
+            self.assertEqual(result, (iterations, escape, maxed))
+            if escape:
+                self.assertEqual((yield dut.distance_out), distance)
+
+            yield from self.pulse(dut.result_read_in)
+
+class MandelbrotDistancePipelinedMultiplierTest(MandelbrotDistanceTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'distance_estimate': True, 'multiplier_stages': 2}
+
+class MandelbrotTraceTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = Mandelbrot
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'trace': True}
+
+    @sync_test_case
+    def test_basic(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        dut = self.dut
+        max_iterations = 100
+        one = 1 << scale
+        points = [(one, 0), (0, 0), (-(3 * one >> 2), one >> 4), ((one >> 2) + (one >> 6), 0), (-2 * one, one)]
+        yield dut.max_iterations_in.eq(max_iterations)
+        yield
+
+        for cx, cy in points:
+            yield dut.cx_in.eq(cx)
+            yield dut.cy_in.eq(cy)
+            yield from self.pulse(dut.start_in)
+
+            orbit = []
+            while not (yield dut.result_ready_out) or (yield dut.trace_valid_out):
+                if (yield dut.trace_valid_out):
+                    orbit.append(((yield dut.trace_x_out), (yield dut.trace_y_out)))
+                    yield from self.pulse(dut.trace_ready_in)
+                else:
+                    yield
+
+            result = ((yield dut.iterations_out), (yield dut.escape_out), (yield dut.maxed_out))
+            print(f"pixel ({hex(cx)}, {hex(cy)}): {result}, {len(orbit)} points")
+            self.assertEqual(result, mandelbrot_reference(cx, cy, max_iterations, scale))
+            self.assertEqual(orbit, escape_orbit(cx, cy, max_iterations, scale))
+            yield from self.pulse(dut.result_read_in)
+
+class MandelbrotThreeMultipliersTraceTest(MandelbrotTraceTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'multipliers': 3, 'trace': True}
+
+class MandelbrotOrbitTraceTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = Mandelbrot
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'multipliers': 2,
+                          'periodicity_check': True, 'orbit_trace': True}
+
+    @sync_test_case
+    def test_basic(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        dut = self.dut
+        max_iterations = 100
+        one = 1 << scale
+        # the periodic orbits of the interior points are traced up to max_iterations,
+        # the last pixel is not traced
+        points = [(0, 0, 1), (-one, 0, 1), (-(3 * one >> 2), one >> 4, 1), (-2 * one, one, 1), ((one >> 2) + (one >> 6), 0, 0)]
+        yield dut.max_iterations_in.eq(max_iterations)
+        yield
+
+        for cx, cy, trace in points:
+            yield dut.cx_in.eq(cx)
+            yield dut.cy_in.eq(cy)
+            yield dut.trace_orbit_in.eq(trace)
+            yield from self.pulse(dut.start_in)
+            yield dut.trace_orbit_in.eq(0)
+
+            orbit = []
+            while not (yield dut.result_ready_out) or (yield dut.trace_valid_out):
+                if (yield dut.trace_valid_out):
+                    orbit.append(((yield dut.trace_x_out), (yield dut.trace_y_out)))
+                    yield from self.pulse(dut.trace_ready_in)
+                else:
+                    yield
+
+            result = ((yield dut.iterations_out), (yield dut.escape_out), (yield dut.maxed_out))
+            print(f"pixel ({hex(cx)}, {hex(cy)}): {result}, {len(orbit)} points")
+            self.assertEqual(result, mandelbrot_reference(cx, cy, max_iterations, scale))
+            self.assertEqual(orbit, traced_orbit(cx, cy, max_iterations, scale) if trace else [])
+            yield from self.pulse(dut.result_read_in)
+
+class MultiLimbMandelbrotTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = MultiLimbMandelbrot
+    FRAGMENT_ARGUMENTS = {'limb_width': 16, 'max_limbs': 3}
+
+    @sync_test_case
+    def test_basic(self):
+        dut = self.dut
+        limb_width = self.FRAGMENT_ARGUMENTS['limb_width']
+        max_limbs  = self.FRAGMENT_ARGUMENTS['max_limbs']
+        scale = limb_width * (max_limbs - 1)
+        max_iterations = 40
+        one = 1 << scale
+        points = [
+            (one, 0), (one >> 1, 0), (one >> 2, one >> 3), (-one, 0),
+            (-(one + (one >> 2)) + 12345, (one >> 2) + 54321), (-(one >> 1) - 98765, (one >> 1) + 45678),
+        ]
+        yield dut.max_iterations_in.eq(max_iterations)
+        yield
+
+        for limbs in range(2, max_limbs + 1):
+            unused = (max_limbs - limbs) * limb_width
+            for cx, cy in points:
+                yield dut.cx_in.eq(cx)
+                yield dut.cy_in.eq(cy)
+                yield dut.limbs_in.eq(limbs)
+                yield from self.pulse(dut.start_in)
+                yield from self.wait_until(dut.result_ready_out)
+
+                result = ((yield dut.iterations_out), (yield dut.escape_out), (yield dut.maxed_out))
+                print(f"{limbs} limbs, pixel ({hex(cx)}, {hex(cy)}): {result}")
+                # the core works with the upper limbs only
+                self.assertEqual(result, mandelbrot_reference(cx >> unused, cy >> unused,
+                                                              max_iterations, scale - unused))
+                yield from self.pulse(dut.result_read_in)
+
+class PerturbationMandelbrotTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = PerturbationMandelbrot
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'orbit_depth': 256}
+
+    @sync_test_case
+    def test_basic(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        dut = self.dut
+        max_iterations = 200
+        precision = 160
+        exponent = 12
+        random = Random(0)
+
+        # the reference sits near the boundary, so the pixels around it differ
+        cx = round(-0.745 * (1 << scale)) << (precision - scale)
+        cy = round( 0.113 * (1 << scale)) << (precision - scale)
+        orbit = reference_orbit(cx, cy, max_iterations, scale, precision)
+        yield dut.max_iterations_in.eq(max_iterations)
+        yield dut.orbit_length_in.eq(len(orbit))
+        yield dut.exponent_in.eq(exponent)
+        yield
+
+        deltas = [(0, 0)] + [(random.randrange(-(1 << scale), 1 << scale),
+                              random.randrange(-(1 << scale), 1 << scale)) for _ in range(12)]
+        for dcx, dcy in deltas:
+            yield dut.cx_in.eq(dcx)
+            yield dut.cy_in.eq(dcy)
+            yield from self.pulse(dut.start_in)
+            while not (yield dut.result_ready_out):
+                address = (yield dut.orbit_address_out)
+                x, y = orbit[address] if address < len(orbit) else (0, 0)
+                yield dut.orbit_x_in.eq(x)
+                yield dut.orbit_y_in.eq(y)
+                yield
+
+            result = ((yield dut.iterations_out), (yield dut.escape_out), (yield dut.maxed_out), (yield dut.glitch_out))
+            print(f"delta ({hex(dcx)}, {hex(dcy)}): {result}")
+            self.assertEqual(result, perturbation_reference(dcx, dcy, exponent, orbit, max_iterations, scale))
+
+            # pixels, which are not glitched, come out like in a full precision computation
+            if not result[3]:
+                shift = precision - scale - exponent
+                self.assertEqual(result[:3], mandelbrot_reference(cx + (dcx << shift), cy + (dcy << shift),
+                                                                  max_iterations, precision))
+            yield from self.pulse(dut.result_read_in)
+
+class PipelinedMandelbrotTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = PipelinedMandelbrot
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'slots': 5}
+
+    @sync_test_case
+    def test_basic(self):
+        scale = self.FRAGMENT_ARGUMENTS['fraction_bits']
+        dut = self.dut
+        max_iterations = 40
+        one = 1 << scale
+        points = [
+            (one, 0), (one >> 1, 0), (0, one >> 1), (one >> 2, one >> 3),
+            (-one, 0), (-(one + (one >> 2)), one >> 2), (-2 * one, one), (one >> 3, -(one >> 1)),
+        ]
+        yield dut.max_iterations_in.eq(max_iterations)
+        yield
+
+        results = {}
+        to_send = list(enumerate(points))
+        while len(results) < len(points):
+            if to_send and (yield dut.ready_out):
+                tag, (cx, cy) = to_send.pop(0)
+                yield dut.cx_in.eq(cx)
+                yield dut.cy_in.eq(cy)
+                yield dut.tag_in.eq(tag)
+                yield from self.pulse(dut.start_in)
+
+            if (yield dut.result_ready_out):
+                tag = (yield dut.tag_out)
+                self.assertNotIn(tag, results)
+                results[tag] = ((yield dut.iterations_out), (yield dut.escape_out), (yield dut.maxed_out))
+                yield from self.pulse(dut.result_read_in)
+            yield
+
+        yield
+        self.assertEqual((yield dut.busy_out), 0)
+
+        for tag, (cx, cy) in enumerate(points):
+            print(f"pixel {tag}: {results[tag]}")
+            self.assertEqual(results[tag], mandelbrot_reference(cx, cy, max_iterations, scale))
+
+class PipelinedMandelbrotPipelinedMultiplierTest(PipelinedMandelbrotTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'slots': 7, 'multiplier_stages': 3}
+
+class PipelinedMandelbrotSquarerTest(PipelinedMandelbrotTest):
+    FRAGMENT_ARGUMENTS = {'bitwidth': 64, 'fraction_bits': 56, 'slots': 6, 'multiplier_stages': 2, 'squarers': True}
@@ -0,0 +1,325 @@
+from math            import ceil
+from random          import Random
+
+from amaranth        import *
+from amaranth.build  import Platform
+from amlib.test      import GatewareTestCase, sync_test_case
+
+def split_into_tiles(value, width, tile_width):
+    # all tiles are unsigned, only the most significant one carries the sign
+    no_tiles = ceil(width / tile_width)
+    tiles = [value[n * tile_width:(n + 1) * tile_width] for n in range(no_tiles - 1)]
+    tiles.append(value[(no_tiles - 1) * tile_width:].as_signed())
+    return tiles
+
+def adder_tree(m, terms, *, width, stages):
+    """ sums up the terms, with the register stages
+        distributed evenly over the levels of the tree """
+    # one level for the terms themselves and one for each level of the adder tree
+    no_levels = 1
+    no_terms = len(terms)
+    while no_terms > 1:
+        no_terms = ceil(no_terms / 2)
+        no_levels += 1
+
+    # stages beyond the number of levels go to the output
+    registered_levels = set(n * no_levels // stages for n in range(min(stages, no_levels)))
+
+    def register(level, name):
+        registered = [Signal(signed(width), name=f"{name}_{n}") for n in range(len(level))]
+        m.d.sync += [r.eq(s) for r, s in zip(registered, level)]
+        return registered
+
+    level = terms
+    for n in range(no_levels):
+        if n > 0:
+            summed = []
+            for k in range(0, len(level), 2):
+                s = Signal(signed(width), name=f"sum_{n}_{k // 2}")
+                m.d.comb += s.eq(sum(level[k:k + 2]))
+                summed.append(s)
+            level = summed
+        if n in registered_levels:
+            level = register(level, f"level_{n}")
+
+    result = level[0]
+    for n in range(stages - len(registered_levels)):
+        result = register([result], f"output_{n}")[0]
+
+    return result
+
+class PipelinedMultiplier(Elaboratable):
+    """ signed multiplier, which splits a wide product into DSP sized
+        partial products and sums them up in a registered adder tree """
+    def __init__(self, *, width, tile_width=18, stages=2):
+        # Parameters
+        self._width = width
+        self._tile_width = tile_width
+        self._stages = stages
+
+        # the product appears at the output this many clocks after the factors
+        self.latency = stages
+
+        # Inputs
+        self.a_in = Signal(signed(width))
+        self.b_in = Signal(signed(width))
+
+        # Outputs
+        self.product_out = Signal(signed(2 * width))
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        width      = self._width
+        tile_width = self._tile_width
+
+        # partial products, each one fits into a DSP block
+        terms = []
+        for i, a in enumerate(split_into_tiles(self.a_in, width, tile_width)):
+            for j, b in enumerate(split_into_tiles(self.b_in, width, tile_width)):
+                term = Signal(signed(2 * width), name=f"partial_{i}_{j}")
+                m.d.comb += term.eq((a * b) << ((i + j) * tile_width))
+                terms.append(term)
+
+        m.d.comb += self.product_out.eq(adder_tree(m, terms, width=2 * width, stages=self._stages))
+
+        return m
+
+class PipelinedSquarer(Elaboratable):
+    """ squares a signed number, the cross terms a_i * a_j of the tiles
+        appear twice in the square, so only about half of the partial
+        products of a multiplier of the same width are needed """
+    def __init__(self, *, width, tile_width=18, stages=2):
+        # Parameters
+        self._width = width
+        self._tile_width = tile_width
+        self._stages = stages
+
+        # the square appears at the output this many clocks after the input
+        self.latency = stages
+
+        # Inputs
+        self.a_in = Signal(signed(width))
+
+        # Outputs
+        self.square_out = Signal(signed(2 * width))
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        width      = self._width
+        tile_width = self._tile_width
+
+        tiles = split_into_tiles(self.a_in, width, tile_width)
+        terms = []
+        for i, a in enumerate(tiles):
+            for j, b in enumerate(tiles[i:], start=i):
+                term = Signal(signed(2 * width), name=f"partial_{i}_{j}")
+                # the cross terms count twice
+                shift = (i + j) * tile_width + (0 if i == j else 1)
+                m.d.comb += term.eq((a * b) << shift)
+                terms.append(term)
+
+        m.d.comb += self.square_out.eq(adder_tree(m, terms, width=2 * width, stages=self._stages))
+
+        return m
+
+class LimbSerialMultiplier(Elaboratable):
+    """ fixed point multiplier for numbers of max_limbs limbs, of which only
+        the upper limbs_in are used. The integer part is the top limb.
+        One limb by limb product is summed up per clock, column by column,
+        so a product of n limbs takes n * n clocks, plus one clock
+        in which done_out strobes.
+        The product is rounded down to the limbs in use, like a shift
+        of the full product would do """
+    def __init__(self, *, limb_width=32, max_limbs=4):
+        # Parameters
+        self._limb_width = limb_width
+        self._max_limbs = max_limbs
+        width = limb_width * max_limbs
+
+        # Inputs
+        self.a_in     = Signal(signed(width))
+        self.b_in     = Signal(signed(width))
+        self.limbs_in = Signal(range(max_limbs + 1))
+        self.start_in = Signal()
+
+        # Outputs
+        self.busy_out    = Signal()
+        self.done_out    = Signal() # strobes, when the product is ready
+        self.product_out = Signal(signed(width))
+
+    def elaborate(self, platform: Platform) -> Module:
+        m = Module()
+        w         = self._limb_width
+        max_limbs = self._max_limbs
+        width     = w * max_limbs
+        top       = max_limbs - 1
+
+        # the products of the magnitudes are summed up, the sign is applied at the end
+        negative  = Signal()
+        a         = Signal(width)
+        b         = Signal(width)
+        a_limbs   = Array([a[n * w:(n + 1) * w] for n in range(max_limbs)])
+        b_limbs   = Array([b[n * w:(n + 1) * w] for n in range(max_limbs)])
+
+        # lowest limb in use
+        low       = Signal(range(max_limbs))
+        # the current column k of the product and its partial product a_i * b_(k-i)
+        column    = Signal(range(2 * max_limbs))
+        i         = Signal(range(max_limbs))
+        last_i    = Signal(range(max_limbs))
+        next_i    = Signal(range(max_limbs))
+
+        accumulator = Signal(2 * w + max_limbs.bit_length())
+        column_sum  = Signal.like(accumulator)
+        # any bits below the limbs in use, for rounding down negative products
+        sticky      = Signal()
+        result      = Array([Signal(w, name=f"result_{n}") for n in range(max_limbs)])
+        magnitude   = Signal(width)
+        lsb         = Array([Const(1 << (n * w), width) for n in range(max_limbs)])
+
+        m.d.comb += [
+            last_i    .eq(Mux(column > top + low, top, column - low)),
+            next_i    .eq(Mux(column + 1 > top + low, column + 1 - top, low)),
+            column_sum.eq(accumulator + a_limbs[i] * b_limbs[column - i]),
+            magnitude .eq(Cat(result)),
+            self.product_out.eq(Mux(negative, -(magnitude + Mux(sticky, lsb[low], 0)), magnitude)),
+        ]
+
+        with m.FSM():
+            with m.State("IDLE"):
+                with m.If(self.start_in):
+                    m.d.sync += [
+                        negative    .eq(self.a_in[-1] ^ self.b_in[-1]),
+                        a           .eq(Mux(self.a_in < 0, -self.a_in, self.a_in)),
+                        b           .eq(Mux(self.b_in < 0, -self.b_in, self.b_in)),
+                        low         .eq(max_limbs - self.limbs_in),
+                        column      .eq(2 * (max_limbs - self.limbs_in)),
+                        i           .eq(max_limbs - self.limbs_in),
+                        accumulator .eq(0),
+                        sticky      .eq(0),
+                        *[r.eq(0) for r in result],
+                    ]
+                    m.next = "MULTIPLY"
+
+            with m.State("MULTIPLY"):
+                m.d.comb += self.busy_out.eq(1)
+                with m.If(i == last_i):
+                    # the column is complete, the lower limbs of the
+                    # product only matter for their carries and the rounding
+                    m.d.sync += [
+                        accumulator .eq(column_sum >> w),
+                        column      .eq(column + 1),
+                        i           .eq(next_i),
+                    ]
+                    with m.If(column >= top + low):
+                        m.d.sync += result[column - top].eq(column_sum[:w])
+                    with m.Elif(column_sum[:w].any()):
+                        m.d.sync += sticky.eq(1)
+
+                    with m.If(column == 2 * top):
+                        m.next = "DONE"
+                with m.Else():
+                    m.d.sync += [
+                        accumulator .eq(column_sum),
+                        i           .eq(i + 1),
+                    ]
+
+            with m.State("DONE"):
+                m.d.comb += [
+                    self.busy_out.eq(1),
+                    self.done_out.eq(1),
+                ]
+                m.next = "IDLE"
+
+        return m
+
+class PipelinedMultiplierTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = PipelinedMultiplier
+    FRAGMENT_ARGUMENTS = {'width': 72, 'tile_width': 18, 'stages': 3}
+
+    @sync_test_case
+    def test_basic(self):
+        dut = self.dut
+        width = self.FRAGMENT_ARGUMENTS['width']
+        latency = dut.latency
+        random = Random(0)
+
+        extremes = [-(1 << (width - 1)), (1 << (width - 1)) - 1, -1, 0, 1]
+        factors = [(a, b) for a in extremes for b in extremes]
+        factors += [(random.randrange(-(1 << (width - 1)), 1 << (width - 1)),
+                     random.randrange(-(1 << (width - 1)), 1 << (width - 1))) for _ in range(50)]
+
+        # feed a new pair of factors every clock
+        products = []
+        for n in range(len(factors) + latency):
+            if n < len(factors):
+                a, b = factors[n]
+                yield dut.a_in.eq(a)
+                yield dut.b_in.eq(b)
+            yield
+            products.append((yield dut.product_out))
+
+        for (a, b), product in zip(factors, products[latency:]):
+            self.assertEqual(product, a * b)
+
+class PipelinedSquarerTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = PipelinedSquarer
+    FRAGMENT_ARGUMENTS = {'width': 73, 'tile_width': 18, 'stages': 2}
+
+    @sync_test_case
+    def test_basic(self):
+        dut = self.dut
+        width = self.FRAGMENT_ARGUMENTS['width']
+        latency = dut.latency
+        random = Random(0)
+
+        values = [-(1 << (width - 1)), (1 << (width - 1)) - 1, -1, 0, 1]
+        values += [random.randrange(-(1 << (width - 1)), 1 << (width - 1)) for _ in range(50)]
+
+        # feed a new value every clock
+        squares = []
+        for n in range(len(values) + latency):
+            if n < len(values):
+                yield dut.a_in.eq(values[n])
+            yield
+            squares.append((yield dut.square_out))
+
+        for a, square in zip(values, squares[latency:]):
+            self.assertEqual(square, a * a)
+
+class LimbSerialMultiplierTest(GatewareTestCase):
+    FRAGMENT_UNDER_TEST = LimbSerialMultiplier
+    FRAGMENT_ARGUMENTS = {'limb_width': 16, 'max_limbs': 3}
+
+    @sync_test_case
+    def test_basic(self):
+        dut = self.dut
+        limb_width = self.FRAGMENT_ARGUMENTS['limb_width']
+        max_limbs  = self.FRAGMENT_ARGUMENTS['max_limbs']
+        width = limb_width * max_limbs
+        random = Random(0)
+
+        for limbs in range(1, max_limbs + 1):
+            # the limbs which are not used are zero
+            unused = (max_limbs - limbs) * limb_width
+            fraction_bits = (limbs - 1) * limb_width
+            bound = 1 << (width - unused - 1)
+            values = [-bound, bound - 1, -1, 0, 1]
+            values += [random.randrange(-bound, bound) for _ in range(10)]
+
+            for a, b in [(a, b) for a in values[:5] for b in values[:5]] + list(zip(values, reversed(values))):
+                yield dut.a_in.eq(a << unused)
+                yield dut.b_in.eq(b << unused)
+                yield dut.limbs_in.eq(limbs)
+                yield from self.pulse(dut.start_in, step_after=False)
+                cycles = 0
+                while not (yield dut.done_out):
+                    cycles += 1
+                    yield
+
+                # wraps around like the fixed width cores do
+                expected = ((a * b) >> fraction_bits) << unused
+                expected = (expected + (1 << (width - 1))) % (1 << width) - (1 << (width - 1))
+                self.assertEqual((yield dut.product_out), expected)
+                self.assertEqual(cycles, limbs * limbs + 1)
+                yield
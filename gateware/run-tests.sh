@@ -1,4 +1,55 @@
 #!/bin/bash
 export GENERATE_VCDS=0
+python3 -m unittest multiplier.PipelinedMultiplierTest
+python3 -m unittest multiplier.PipelinedSquarerTest
+python3 -m unittest multiplier.LimbSerialMultiplierTest
+python3 -m unittest interior.InteriorCheckTest
+python3 -m unittest arbiter.RoundRobinArbiterTest
+python3 -m unittest arbiter.RoundRobinArbiterRegisteredTest
 python3 -m unittest mandelbrot.MandelbrotTest
-python3 -m unittest fractalmanager.FractalManagerTest
\ No newline at end of file
+python3 -m unittest mandelbrot.MandelbrotTwoMultipliersTest
+python3 -m unittest mandelbrot.MandelbrotThreeMultipliersTest
+python3 -m unittest mandelbrot.MandelbrotPipelinedMultiplierTest
+python3 -m unittest mandelbrot.MandelbrotSquarerTest
+python3 -m unittest mandelbrot.MandelbrotTwoSquarersTest
+python3 -m unittest mandelbrot.MandelbrotThreeSquarersTest
+python3 -m unittest mandelbrot.MandelbrotDoubleBufferTest
+python3 -m unittest mandelbrot.MandelbrotPeriodicityTest
+python3 -m unittest mandelbrot.MandelbrotResumeTest
+python3 -m unittest mandelbrot.MandelbrotDistanceTest
+python3 -m unittest mandelbrot.MandelbrotDistancePipelinedMultiplierTest
+python3 -m unittest mandelbrot.MandelbrotTraceTest
+python3 -m unittest mandelbrot.MandelbrotThreeMultipliersTraceTest
+python3 -m unittest mandelbrot.MandelbrotOrbitTraceTest
+python3 -m unittest mandelbrot.MultiLimbMandelbrotTest
+python3 -m unittest mandelbrot.PerturbationMandelbrotTest
+python3 -m unittest mandelbrot.PipelinedMandelbrotTest
+python3 -m unittest mandelbrot.PipelinedMandelbrotPipelinedMultiplierTest
+python3 -m unittest mandelbrot.PipelinedMandelbrotSquarerTest
+python3 -m unittest fractalmanager.FractalManagerTest
+python3 -m unittest fractalmanager.FractalManagerThreeMultipliersTest
+python3 -m unittest fractalmanager.FractalManagerPipelinedTest
+python3 -m unittest fractalmanager.FractalManagerNoInteriorCheckTest
+python3 -m unittest fractalmanager.FractalManagerPeriodicityTest
+python3 -m unittest fractalmanager.FractalManagerNarrowCoresTest
+python3 -m unittest fractalmanager.FractalManagerClusterTest
+python3 -m unittest fractalmanager.FractalManagerChunkTest
+python3 -m unittest fractalmanager.FractalManagerTileTest
+python3 -m unittest fractalmanager.FractalManagerChunkTileTest
+python3 -m unittest fractalmanager.FractalManagerClusterTileTest
+python3 -m unittest fractalmanager.FractalManagerInterlaceTest
+python3 -m unittest fractalmanager.FractalManagerSubdivideTest
+python3 -m unittest fractalmanager.FractalManagerRunLengthTest
+python3 -m unittest fractalmanager.FractalManagerQueueTest
+python3 -m unittest fractalmanager.FractalManagerRasterTest
+python3 -m unittest fractalmanager.FractalManagerSupersampleTest
+python3 -m unittest fractalmanager.FractalManagerMultiLimbTest
+python3 -m unittest fractalmanager.FractalManagerPerturbationTest
+python3 -m unittest fractalmanager.FractalManagerDistanceTest
+python3 -m unittest fractalmanager.FractalManagerResumableTest
+python3 -m unittest fractalmanager.FractalManagerBuddhabrotTest
+python3 -m unittest fractalmanager.FractalManagerOrbitTraceTest
+python3 -m unittest fractalmanager.FractalManagerDispatchTest
+python3 -m unittest fractalmanager.FractalManagerChunkDispatchTest
+python3 -m unittest fractalmanager.FractalManagerClusterDispatchTest
+python3 -m unittest fractalmanager.FractalManagerResultFifoTest
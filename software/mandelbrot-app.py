@@ -7,6 +7,9 @@ import code
 import sys
 import subprocess
 import threading, queue
+import itertools
+import math
+from fractions import Fraction
 
 dev=usb.core.find(idVendor=0x1209, idProduct=0xDECA)
 
@@ -14,6 +17,34 @@ debug=False
 if debug: print(dev)
 
 scale = 8*8
+# set, if the bitstream was built with resumable=True
+resumable = False
+# set, if the bitstream was built with distance_estimate=True
+distance_estimate = False
+# set, if the bitstream was built with subdivide=True
+subdivide = False
+# passes after the first, coarse one of an interlaced frame,
+# at most the interlace_levels the bitstream was built with
+interlace = 0
+# set, if the bitstream was built with queue_frames=True: the next frame command
+# is taken while the cores still run the last frame, and the results of each
+# frame follow a record with its frame id
+queue_frames = False
+# the device counts the frames it has started in a byte, from 1 on
+frames_started = 0
+# set, if the bitstream was built with raster_order=True: the pixels come in the order
+# they were sent, each one as its whole iteration count, 7 bits per byte from the bottom
+raster_order = False
+# the supersample_levels the bitstream was built with: every pixel has the number
+# of its maxed samples in front of the separator
+supersample_levels = 0
+# each pixel of a frame is computed as 2^supersample by 2^supersample samples,
+# at most the supersample_levels the bitstream was built with
+supersample = 0
+# the histogram of a bitstream built with buddhabrot=True
+histogram_width  = 64
+histogram_height = 64
+histogram_bytes  = 2
 
 def fix2float(fix):
     return fix/2**scale
@@ -23,20 +54,95 @@ def float2fix(f):
 
 pixel_queue = queue.Queue()
 
-def send_command(bytewidth, view, iterations=10000, debug=False):
-    tstart = time.perf_counter()
-    command_bytes = struct.pack("HHI", view.width-1, view.height-1, view.max_iterations)
-    command_bytes += view.corner_x.to_bytes(bytewidth, byteorder='little', signed=True)
-    command_bytes += view.corner_y.to_bytes(bytewidth, byteorder='little', signed=True)
-    command_bytes += view.step    .to_bytes(bytewidth, byteorder='little', signed=True)
+# final states of the maxed pixels of the last frame: (x, y) -> (iteration, zx, zy),
+# zx is None for pixels, which escaped in their last iteration
+frame_state = {}
+
+def fix2limbs(fix, limbs, limb_bytes):
+    # multi limb cores have the integer part in the top limb
+    # and take as many limbs as they should use
+    shift = (limbs - 1) * limb_bytes * 8 - scale
+    value = fix << shift if shift >= 0 else fix >> -shift
+    return value.to_bytes(limbs * limb_bytes, byteorder='little', signed=True)
+
+def count_frame():
+    global frames_started
+    frames_started += 1
+    return frames_started & 0xff
+
+def frame_command(bytewidth, view, limbs=None, limb_bytes=4):
+    if subdivide and limbs is None:
+        # no_pixels_x = 0xfff9 subdivides the frame as a tile, uniform rectangles come back filled
+        command_bytes = struct.pack("HHI", 0xfff9, 0, view.max_iterations)
+    elif interlace and limbs is None:
+        # no_pixels_x = 0xfff8 scans the frame as a tile in interlace + 1 passes
+        command_bytes = struct.pack("HHI", 0xfff8, 0, view.max_iterations)
+    elif supersample and limbs is None:
+        # no_pixels_x = 0xfff7 supersamples the pixels of the frame as a tile
+        command_bytes = struct.pack("HHI", 0xfff7, 0, view.max_iterations)
+    else:
+        command_bytes = struct.pack("HHI", view.width-1, view.height-1, view.max_iterations)
+    if limbs is None:
+        command_bytes += view.corner_x.to_bytes(bytewidth, byteorder='little', signed=True)
+        command_bytes += view.corner_y.to_bytes(bytewidth, byteorder='little', signed=True)
+        command_bytes += view.step    .to_bytes(bytewidth, byteorder='little', signed=True)
+        if subdivide:
+            command_bytes += struct.pack("HHHH", 0, 0, view.width-1, view.height-1)
+        elif interlace:
+            command_bytes += struct.pack("HHHHB", 0, 0, view.width-1, view.height-1, interlace)
+        elif supersample:
+            command_bytes += struct.pack("HHHHB", 0, 0, view.width-1, view.height-1, supersample)
+    else:
+        command_bytes += bytes([limbs])
+        command_bytes += fix2limbs(view.corner_x, limbs, limb_bytes)
+        command_bytes += fix2limbs(view.corner_y, limbs, limb_bytes)
+        command_bytes += fix2limbs(view.step,     limbs, limb_bytes)
     command_bytes += bytes([0xa5])
+    return command_bytes
+
+def send_command(bytewidth, view, iterations=10000, debug=False, limbs=None, limb_bytes=4):
+    tstart = time.perf_counter()
+    command_bytes = frame_command(bytewidth, view, limbs, limb_bytes)
     if debug: print(f"command: {[hex(b) for b in command_bytes]}")
 
+    count_frame()
     dev.write(0x01, command_bytes)
 
     time.sleep(0.05)
 
+    frame_state.clear()
+    read_results(bytewidth, iterations, debug,
+                 order=raster_pixels(view.width, view.height), max_iterations=view.max_iterations,
+                 samples=4**supersample if limbs is None else 1)
+    tusb = time.perf_counter()
+    print(f"USB transfer+unpacking took: {tusb - tstart:0.4f} seconds")
+
+def raster_pixels(width, height, x=0, y=0, frame=True):
+    pixels = ((x + i, y + j) for j in range(height) for i in range(width))
+    # the scheduler stops right before the last pixel of a frame
+    return itertools.islice(pixels, width * height - 1) if frame else pixels
+
+def read_results(bytewidth, iterations, debug=False, frames=None, order=None, max_iterations=None, samples=1):
+    # with a resumable bitstream, maxed pixels are followed by their
+    # iteration and final z, which are kept in frame_state
+    state_bytes = 4 + 2 * bytewidth if resumable else 0
+    # with distance_estimate, every pixel has log2 of its distance to the set
+    distance_bytes = 2 if distance_estimate else 0
+    # with supersample_levels, every pixel has the number of its maxed samples out of samples
+    sample_bytes = 1 if supersample_levels else 0
     result = []
+    # the bottom left pixel of a filled rectangle, until its top right one comes
+    fill_start = None
+    # with queue_frames, the id of the frame the following results belong to,
+    # given frames, they are collected there by frame id instead of being painted
+    frame = None
+
+    def put(pixel):
+        if frames is None:
+            pixel_queue.put(pixel)
+        else:
+            frames.setdefault(frame, []).append(pixel)
+
     try:
         while True:
             if debug: print("read")
@@ -44,14 +150,341 @@ def send_command(bytewidth, view, iterations=10000, debug=False):
             if debug: print("Got: "+ str(len(r)))
             if debug: print(str(r))
             result += r
+            if raster_order:
+                # order yields the coordinates of the pixels, the maxed ones have max_iterations + 1
+                while any(b < 0x80 for b in result):
+                    length = next(n for n, b in enumerate(result) if b < 0x80) + 1
+                    count = sum((b & 0x7f) << (7 * n) for n, b in enumerate(result[:length]))
+                    result = result[length:]
+                    x, y = next(order)
+                    maxed = count > max_iterations
+                    put((x, y, (count & 0x7f) | (maxed << 7), None, count))
+                continue
+            while len(result) >= 6:
+                length = 6 + distance_bytes + sample_bytes + (state_bytes if result[4] & 0x80 else 0)
+                if len(result) < length:
+                    break
+                packet, result = (result[:length], result[length:])
+                # maxed pixels, which escaped in their last iteration, have their own separator
+                assert packet[-1] in (0xa5, 0xa7, 0xaa, 0xab)
+                x, y, value = struct.unpack("HHB", bytes(packet[:5]))
+                if packet[-1] == 0xab:
+                    frame = packet[0]
+                    continue
+                if packet[-1] == 0xaa:
+                    # with subdivide, a filled rectangle comes as its bottom left and top right pixel,
+                    # so does a run of pixels of a row with the same value with run_length
+                    if fill_start is None:
+                        fill_start = (x, y)
+                        continue
+                    for fill_y in range(fill_start[1], y + 1):
+                        for fill_x in range(fill_start[0], x + 1):
+                            put((fill_x, fill_y, value, None))
+                    fill_start = None
+                    continue
+                distance = None
+                if distance_bytes:
+                    distance = int.from_bytes(bytes(packet[5:7]), byteorder='little', signed=True)
+                    # the pixels, which did not escape, are far away
+                    if distance == 0x7fff:
+                        distance = None
+                if sample_bytes:
+                    # the fraction of the pixel, which lies inside
+                    put((x, y, value, distance, None, packet[5] / samples))
+                else:
+                    put((x, y, value, distance))
+
+                frame_state.pop((x, y), None)
+                state = packet[5 + distance_bytes:-1]
+                if state:
+                    iteration = int.from_bytes(bytes(state[0:4]), byteorder='little')
+                    if packet[-1] == 0xa7:
+                        frame_state[(x, y)] = (iteration, None, None)
+                    # the interior pixels never escape
+                    elif iteration != 0xffffffff:
+                        zx = int.from_bytes(bytes(state[4:4 + bytewidth]), byteorder='little', signed=True)
+                        zy = int.from_bytes(bytes(state[4 + bytewidth:]), byteorder='little', signed=True)
+                        frame_state[(x, y)] = (iteration, zx, zy)
+    except usb.USBError:
+        pass
+
+def continue_command(bytewidth, max_iterations, debug=False):
+    # continue the maxed pixels of the last frame with a higher max_iterations,
+    # instead of computing the whole frame again
+    tstart = time.perf_counter()
+    states = list(frame_state.items())
+    for (x, y), (iteration, zx, zy) in states:
+        if zx is None:
+            # this one escaped in its last iteration
+            del frame_state[(x, y)]
+            pixel_queue.put((x, y, iteration & 0x7f))
+
+    states = [entry for entry in states if entry[1][1] is not None]
+    # no_pixels_x = 0xfffe marks a continue command, at most 0xffff pixels each
+    for chunk in range(0, len(states), 0xffff):
+        entries = states[chunk:chunk + 0xffff]
+        command_bytes = struct.pack("HHI", 0xfffe, len(entries), max_iterations)
+        for (x, y), (iteration, zx, zy) in entries:
+            command_bytes += struct.pack("HHI", x, y, iteration)
+            command_bytes += zx.to_bytes(bytewidth, byteorder='little', signed=True)
+            command_bytes += zy.to_bytes(bytewidth, byteorder='little', signed=True)
+        command_bytes += bytes([0xa5])
+        if debug: print(f"continue: {len(entries)} pixels")
+
+        dev.write(0x01, command_bytes)
+        time.sleep(0.05)
+        read_results(bytewidth, max_iterations, debug)
+
+    tusb = time.perf_counter()
+    print(f"continuing {len(states)} pixels took: {tusb - tstart:0.4f} seconds")
+
+def view_coordinates(bytewidth, view):
+    return (view.corner_x.to_bytes(bytewidth, byteorder='little', signed=True) +
+            view.corner_y.to_bytes(bytewidth, byteorder='little', signed=True) +
+            view.step    .to_bytes(bytewidth, byteorder='little', signed=True))
+
+def tile_command(bytewidth, view, x, y, width, height, debug=False):
+    # no_pixels_x = 0xfffb marks a tile command: only the width x height pixels
+    # at x, y of the view's frame are computed
+    command_bytes = struct.pack("HHI", 0xfffb, 0, view.max_iterations)
+    command_bytes += view_coordinates(bytewidth, view)
+    command_bytes += struct.pack("HHHH", x, y, width - 1, height - 1)
+    command_bytes += bytes([0xa5])
+    if debug: print(f"tile: {width}x{height} at {x}, {y}")
+
+    count_frame()
+    dev.write(0x01, command_bytes)
+    time.sleep(0.05)
+    read_results(bytewidth, view.max_iterations, debug,
+                 order=raster_pixels(width, height, x, y, frame=False), max_iterations=view.max_iterations)
+
+def send_frames(bytewidth, views, debug=False):
+    # with queue_frames, the frames go out back to back, each one starts as soon
+    # as the last one has been given to the cores, there is no pause between them,
+    # returns the pixels of each view
+    assert queue_frames, "the bitstream takes one frame at a time"
+    tstart = time.perf_counter()
+    frame_ids = [count_frame() for _ in views]
+    commands  = [frame_command(bytewidth, view) for view in views]
+    if debug: print(f"frames: {frame_ids}")
+
+    # a write waits until the device takes the command
+    writer = threading.Thread(target=lambda: [dev.write(0x01, command) for command in commands])
+    writer.start()
+    frames = {}
+    read_results(bytewidth, max(view.max_iterations for view in views), debug, frames)
+    writer.join()
+
+    tusb = time.perf_counter()
+    print(f"{len(views)} frames took: {tusb - tstart:0.4f} seconds")
+    return [frames.get(frame_id, []) for frame_id in frame_ids]
+
+def pixels_command(bytewidth, view, pixels, debug=False):
+    # no_pixels_x = 0xfffa marks a pixel list command, at most 0xffff pixels each
+    for chunk in range(0, len(pixels), 0xffff):
+        entries = pixels[chunk:chunk + 0xffff]
+        command_bytes = struct.pack("HHI", 0xfffa, len(entries), view.max_iterations)
+        command_bytes += view_coordinates(bytewidth, view)
+        for x, y in entries:
+            command_bytes += struct.pack("HH", x, y)
+        command_bytes += bytes([0xa5])
+        if debug: print(f"pixel list: {len(entries)} pixels")
+
+        dev.write(0x01, command_bytes)
+        time.sleep(0.05)
+        read_results(bytewidth, view.max_iterations, debug,
+                     order=iter(entries), max_iterations=view.max_iterations)
+
+def receive_pixels(iterations, debug=False):
+    # returns the pixels of a frame as (x, y, iterations|maxed, glitched)
+    result = []
+    pixels = []
+    try:
+        while True:
+            r = dev.read(0x81, 256, timeout=max(10, iterations//1000))
+            if debug: print("Got: "+ str(len(r)))
+            result += r
             while len(result) >= 6:
                 packet, result = (result[:6], result[6:])
-                assert packet[-1] == 0xa5
-                pixel = struct.unpack("HHBx", bytes(packet))
-                pixel_queue.put(pixel)
+                # glitched pixels have their own separator
+                assert packet[-1] in (0xa5, 0xa6)
+                x, y, value = struct.unpack("HHBx", bytes(packet))
+                pixels.append((x, y, value, packet[-1] == 0xa6))
     except usb.USBError:
-        tusb = time.perf_counter()
-        print(f"USB transfer+unpacking took: {tusb - tstart:0.4f} seconds")
+        pass
+    return pixels
+
+def distance_shade(pixel, step):
+    # brightness of an escaped pixel from its distance estimate, which is
+    # log2 of the distance with 4 fraction bits, so that thin filaments
+    # come out dark even when they are much narrower than a pixel
+    if len(pixel) < 4 or pixel[3] is None:
+        return 1.0
+    pixels = 2**(pixel[3] / 16) / step
+    return min(1.0, math.sqrt(pixels / 2))
+
+def sample_shade(pixel):
+    # a supersampled pixel, which lies partly inside, is darkened by the fraction inside
+    if len(pixel) < 6:
+        return 1.0
+    return 1.0 - pixel[5]
+
+def reference_orbit(cx, cy, max_iterations, precision):
+    # the orbit of the reference point in high precision,
+    # rounded to the fixed point format of the device
+    x, y = cx, cy
+    orbit = []
+    for _ in range(max_iterations + 1):
+        orbit.append((x >> (precision - scale), y >> (precision - scale)))
+        xx = (x * x) >> precision
+        yy = (y * y) >> precision
+        if xx + yy > (4 << precision):
+            break
+        x, y = xx - yy + cx, ((x * y) >> (precision - 1)) + cy
+    return orbit
+
+def upload_orbit(bytewidth, orbit, debug=False):
+    # no_pixels_x = 0xffff marks an orbit upload, followed by its length
+    command_bytes = struct.pack("HH", 0xffff, len(orbit))
+    for x, y in orbit:
+        command_bytes += x.to_bytes(bytewidth, byteorder='little', signed=True)
+        command_bytes += y.to_bytes(bytewidth, byteorder='little', signed=True)
+    command_bytes += bytes([0xa5])
+    if debug: print(f"orbit upload: {len(orbit)} entries")
+    dev.write(0x01, command_bytes)
+
+class PerturbationView():
+    # a view for deep zooms: the coordinates are exact fractions,
+    # which can be given as decimal strings of any length
+    def __init__(self, *, center_x, center_y, radius, width, height, max_iterations=256, max_orbit=4096) -> None:
+        self.center_x = Fraction(center_x)
+        self.center_y = Fraction(center_y)
+        self.radius   = Fraction(radius)
+        self.width    = width
+        self.height   = height
+        self.max_iterations = min(max_iterations, max_orbit - 1)
+
+        self.step     = self.radius / Fraction(min(width, height), 2)
+        self.corner_x = self.center_x - Fraction(width,  2) * self.step
+        self.corner_y = self.center_y - Fraction(height, 2) * self.step
+
+        # the deltas are scaled up, so that the whole frame is just below one
+        self.exponent = max(0, min(255, math.floor(-math.log2(self.step * max(width, height)))))
+        # enough bits for the reference orbit to resolve the pixels
+        self.precision = max(2 * scale, self.exponent + 2 * scale)
+
+    def pixel(self, x, y):
+        return (self.corner_x + x * self.step, self.corner_y + y * self.step)
+
+def fraction2fix(value, fraction_bits):
+    return math.floor(value * 2**fraction_bits)
+
+def render_perturbation(bytewidth, view, max_rebases=8, debug=False):
+    # render with the reference in the center, then again
+    # for the glitched pixels with a reference among them
+    tstart = time.perf_counter()
+    pixels = {}
+    pending = None
+    reference = (view.center_x, view.center_y)
+    for rebase in range(max_rebases + 1):
+        orbit = reference_orbit(fraction2fix(reference[0], view.precision),
+                                fraction2fix(reference[1], view.precision),
+                                view.max_iterations, view.precision)
+        upload_orbit(bytewidth, orbit, debug)
+
+        delta_bits = scale + view.exponent
+        command_bytes = struct.pack("HHIB", view.width-1, view.height-1, view.max_iterations, view.exponent)
+        command_bytes += fraction2fix(view.corner_x - reference[0], delta_bits).to_bytes(bytewidth, byteorder='little', signed=True)
+        command_bytes += fraction2fix(view.corner_y - reference[1], delta_bits).to_bytes(bytewidth, byteorder='little', signed=True)
+        command_bytes += fraction2fix(view.step, delta_bits)                  .to_bytes(bytewidth, byteorder='little', signed=True)
+        command_bytes += bytes([0xa5])
+        dev.write(0x01, command_bytes)
+        time.sleep(0.05)
+
+        glitched = []
+        for x, y, value, glitch in receive_pixels(view.max_iterations, debug):
+            if pending is None or (x, y) in pending:
+                pixels[(x, y)] = value
+                if glitch:
+                    glitched.append((x, y))
+
+        print(f"pass {rebase}: {len(glitched)} glitched pixels")
+        if not glitched:
+            break
+
+        pending = set(glitched)
+        reference = view.pixel(*glitched[len(glitched) // 2])
+
+    for (x, y), value in pixels.items():
+        pixel_queue.put((x, y, value))
+
+    tusb = time.perf_counter()
+    print(f"perturbation rendering took: {tusb - tstart:0.4f} seconds")
+
+def render_buddhabrot(bytewidth, view, passes=4, debug=False):
+    # every pixel of the view is a sample, the device counts the points of the
+    # escaping orbits in its histogram, which starts at the corner of the view,
+    # the passes move the samples by a random fraction of a pixel
+    import random
+    tstart = time.perf_counter()
+    extent = view.step * max(view.width, view.height)
+    bins   = min(histogram_width, histogram_height)
+    shift  = max(0, ((extent + bins - 1) // bins - 1).bit_length())
+
+    for _ in range(passes):
+        jitter_x = random.randrange(view.step)
+        jitter_y = random.randrange(view.step)
+        command_bytes = struct.pack("HHIB", view.width-1, view.height-1, view.max_iterations, shift)
+        command_bytes += (view.corner_x + jitter_x).to_bytes(bytewidth, byteorder='little', signed=True)
+        command_bytes += (view.corner_y + jitter_y).to_bytes(bytewidth, byteorder='little', signed=True)
+        command_bytes += view.step.to_bytes(bytewidth, byteorder='little', signed=True)
+        command_bytes += bytes([0xa5])
+        dev.write(0x01, command_bytes)
+
+    # the histogram comes, once all orbits are counted
+    dev.write(0x01, struct.pack("HH", 0xfffd, 0))
+    size = histogram_width * histogram_height * histogram_bytes
+    result = []
+    while len(result) < size:
+        r = dev.read(0x81, 4096, timeout=max(1000, view.max_iterations))
+        if debug: print("Got: "+ str(len(r)))
+        result += r
+
+    counts = [int.from_bytes(bytes(result[i:i + histogram_bytes]), byteorder='little')
+              for i in range(0, size, histogram_bytes)]
+    tusb = time.perf_counter()
+    print(f"buddhabrot with {passes} passes took: {tusb - tstart:0.4f} seconds")
+    return [counts[row * histogram_width:(row + 1) * histogram_width] for row in range(histogram_height)]
+
+def trace_orbit(bytewidth, cx, cy, max_iterations, debug=False):
+    # needs a bitstream built with orbit_trace=True, one core runs the point
+    # and sends every z as x and y, each followed by 0xa8, then the iterations,
+    # escape and maxed, padded to the size of a point and followed by 0xa9
+    import numpy as np
+    tstart = time.perf_counter()
+    command_bytes = struct.pack("HHI", 0xfffc, 0, max_iterations)
+    command_bytes += cx.to_bytes(bytewidth, byteorder='little', signed=True)
+    command_bytes += cy.to_bytes(bytewidth, byteorder='little', signed=True)
+    command_bytes += bytes(bytewidth)
+    command_bytes += bytes([0xa5])
+    dev.write(0x01, command_bytes)
+
+    entry_bytes = 2 * bytewidth + 1
+    result = bytearray()
+    while len(result) == 0 or len(result) % entry_bytes != 0 or result[-1] != 0xa9:
+        r = dev.read(0x81, 65536, timeout=1000)
+        if debug: print("Got: "+ str(len(r)))
+        result += r
+
+    entries = [result[i:i + entry_bytes] for i in range(0, len(result), entry_bytes)]
+    orbit = np.array([(fix2float(int.from_bytes(entry[:bytewidth], byteorder='little', signed=True)),
+                       fix2float(int.from_bytes(entry[bytewidth:-1], byteorder='little', signed=True)))
+                      for entry in entries[:-1]], dtype=float).reshape(-1, 2)
+    iterations = int.from_bytes(entries[-1][:4], byteorder='little')
+    escape, maxed = entries[-1][4] & 1, entries[-1][4] >> 1
+    tusb = time.perf_counter()
+    print(f"orbit of {len(orbit)} points took: {tusb - tstart:0.4f} seconds")
+    return orbit, iterations, escape, maxed
 
 def openImage(path):
     imageViewerFromCommandLine = {'linux':'xdg-open',
@@ -148,6 +581,11 @@ def gtk_gui(orbits=False):
 
         drawing = False
         view = default_view
+        # the view of the last frame, which can be continued with more iterations
+        last_frame = None
+        last_iterations = 0
+        # the orbit of the last clicked point, in orbits mode
+        orbit = None
 
         def __init__(self, builder) -> None:
             self.builder = builder
@@ -171,6 +609,7 @@ def gtk_gui(orbits=False):
 
         def painter(self):
             drawing_start = time.perf_counter()
+            step = fix2float(self.view.step)
             try:
                 channels  = 3
                 rowstride = self.width * channels
@@ -187,6 +626,9 @@ def gtk_gui(orbits=False):
                     red, green, blue = colortable[pixel[2] & 0xf]
                     maxed = pixel[2] >> 7
 
+                    shade = distance_shade(pixel, step) * sample_shade(pixel)
+                    red, green, blue = int(red * shade), int(green * shade), int(blue * shade)
+
                     pixel_index = y * rowstride + x * channels
 
                     if maxed:
@@ -237,14 +679,22 @@ def gtk_gui(orbits=False):
             self.view.update(center_x=center_x, center_y=center_y, radius=radius, width=self.width, height=self.height, max_iterations=iterations)
             print(self.view.to_string())
 
-            # clear out image
-            for i in range(len(self.pixels)):
-                self.pixels[i] = 0
-
             view        = self.view
             view.width  = self.width
             view.height = self.height
-            usb_reader = lambda: send_command(9, view, view.max_iterations, debug=False)
+
+            frame = (center_x, center_y, radius, self.width, self.height)
+            if resumable and frame == self.last_frame and iterations > self.last_iterations:
+                # only the maxed pixels need the added iterations
+                usb_reader = lambda: continue_command(9, view.max_iterations, debug=False)
+            else:
+                # clear out image
+                for i in range(len(self.pixels)):
+                    self.pixels[i] = 0
+                usb_reader = lambda: send_command(9, view, view.max_iterations, debug=False)
+
+            self.last_frame      = frame
+            self.last_iterations = iterations
             usb_thread = threading.Thread(target=usb_reader, daemon=True)
             usb_thread.start()
 
@@ -258,6 +708,9 @@ def gtk_gui(orbits=False):
             center_x, center_y, _ = self.getViewParameterWidgets()
             center_x.set_text(str(x))
             center_y.set_text(str(y))
+            if orbits:
+                self.orbit, *_ = trace_orbit(9, float2fix(x), float2fix(y), self.view.max_iterations)
+                canvas.queue_draw()
 
         crosshairs = None
 
@@ -289,6 +742,17 @@ def gtk_gui(orbits=False):
                 cr.move_to(20, 40)
                 cr.show_text(f"y: {str(self.crosshairs[1][1])}")
 
+            if not self.orbit is None and len(self.orbit) > 0:
+                step = fix2float(self.view.step)
+                xs = (self.orbit[:, 0] - fix2float(self.view.corner_x)) / step
+                ys = self.view.height - (self.orbit[:, 1] - fix2float(self.view.corner_y)) / step
+                cr.set_source_rgb(1, 1, 0)
+                cr.set_line_width(1)
+                cr.move_to(xs[0], ys[0])
+                for x, y in zip(xs[1:], ys[1:]):
+                    cr.line_to(x, y)
+                cr.stroke()
+
 
     builder = Gtk.Builder()
     builder.add_from_file("mandelbrot-client-gui.ui")
@@ -311,24 +775,40 @@ if __name__ == "__main__":
         if argv[1] == "debug":
             send_command(9, view, debug=True)
 
-        elif argv[1] == "png":
+        elif argv[1] in ("png", "deep"):
             tstart = time.perf_counter()
 
-            if len(argv) >= 4:
-                width  = int(argv[2])
-                height = int(argv[3])
-                if (len(argv) == 5):
-                    iterations = int(argv[4])
-                    view.update_size(width, height, iterations)
-                else:
-                    view.update_size(width, height, 170)
-
-            print("Rendering view to PNG:")
-            lower_left = view.get_lower_left_corner()
-            print(f"lower left corner: x: {lower_left[0]} y: {lower_left[1]}")
-            upper_right = view.get_upper_right_corner()
-            print(f"upper right corner: x: {upper_right[0]} y: {upper_right[1]}")
-            usb_reader = lambda: send_command(9, view, debug=False)
+            if argv[1] == "deep":
+                # deep <center_x> <center_y> <radius> [<width> <height> [<iterations>]]
+                # needs a bitstream built with perturbation=True
+                width, height, iterations = 1550, 1080, 1000
+                if len(argv) >= 7:
+                    width  = int(argv[5])
+                    height = int(argv[6])
+                if len(argv) == 8:
+                    iterations = int(argv[7])
+                view = PerturbationView(center_x=argv[2], center_y=argv[3], radius=argv[4],
+                                        width=width, height=height, max_iterations=iterations)
+                print(f"Rendering deep view to PNG, exponent: {view.exponent}")
+                usb_reader = lambda: render_perturbation(9, view, debug=False)
+
+            else:
+                if len(argv) >= 4:
+                    width  = int(argv[2])
+                    height = int(argv[3])
+                    if (len(argv) == 5):
+                        iterations = int(argv[4])
+                        view.update_size(width, height, iterations)
+                    else:
+                        view.update_size(width, height, 170)
+
+                print("Rendering view to PNG:")
+                lower_left = view.get_lower_left_corner()
+                print(f"lower left corner: x: {lower_left[0]} y: {lower_left[1]}")
+                upper_right = view.get_upper_right_corner()
+                print(f"upper right corner: x: {upper_right[0]} y: {upper_right[1]}")
+                usb_reader = lambda: send_command(9, view, debug=False)
+
             usb_thread = threading.Thread(target=usb_reader, daemon=True)
             usb_thread.start()
 
@@ -336,6 +816,7 @@ if __name__ == "__main__":
             from matplotlib.image import imsave
 
             p = np.zeros((view.height, view.width, 3))
+            step = float(view.step) if argv[1] == "deep" else fix2float(view.step)
 
             def unpacker():
                 while True:
@@ -352,18 +833,20 @@ if __name__ == "__main__":
 
                     red, green, blue = colortable_float[pixel[2] & 0xf]
                     maxed = pixel[2] >> 7
+                    shade = distance_shade(pixel, step) * sample_shade(pixel)
                     if not maxed:
-                        p[y][x][0] = red
-                        p[y][x][1] = green
-                        p[y][x][2] = blue
+                        p[y][x][0] = red   * shade
+                        p[y][x][1] = green * shade
+                        p[y][x][2] = blue  * shade
 
                     pixel_queue.task_done()
 
             unpacker_thread = threading.Thread(target=unpacker, daemon=True)
             unpacker_thread.start()
 
-            pixel_queue.join()
+            # all pixels are in the queue, once the transfer is over
             usb_thread.join()
+            pixel_queue.join()
 
             pix_conv = time.perf_counter()
             outfilename = 'mandelbrot.png'
@@ -372,7 +855,25 @@ if __name__ == "__main__":
             print(f"saving image took: {img_save - pix_conv:0.4f} seconds")
             openImage(outfilename)
 
+        elif argv[1] == "buddha":
+            # buddha [<width> <height> [<iterations> [<passes>]]], needs a bitstream built with buddhabrot=True
+            # width x height samples are taken, the image has the size of the histogram
+            width, height = (int(argv[2]), int(argv[3])) if len(argv) >= 4 else (1024, 1024)
+            iterations = int(argv[4]) if len(argv) >= 5 else 1000
+            passes     = int(argv[5]) if len(argv) >= 6 else 4
+            view.update_size(width, height, iterations)
+            histogram = render_buddhabrot(9, view, passes)
+
+            import numpy as np
+            from matplotlib.image import imsave
+
+            p = np.sqrt(np.array(histogram, dtype=float) / max(1, max(map(max, histogram))))
+            outfilename = 'buddhabrot.png'
+            imsave(outfilename, p, cmap='gray')
+            openImage(outfilename)
+
         elif argv[1] == "orbits":
+            # click a point to see its orbit, needs a bitstream built with orbit_trace=True
             gtk_gui(orbits=True)
 
     else: